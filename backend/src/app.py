@@ -1,26 +1,56 @@
-from fastapi import FastAPI, Request
-from fastapi.responses import StreamingResponse, HTMLResponse
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, HTTPException, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse, HTMLResponse, PlainTextResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
 import uvicorn
-import cv2
 import os # Cần thiết để xây dựng đường dẫn file
+from concurrent.futures import ThreadPoolExecutor
 
 # Import lớp ObjectDetector từ file detector.py
 # (Giả sử app.py và processing/ nằm cùng cấp trong thư mục src/)
 try:
     from processing.detector import ObjectDetector
+    from processing.broker import StreamProducer
+    from processing.encoder import JpegEncoder
+    from processing.events import DetectionPublisher, MESSAGE_FORMATS, FORMAT_JSON, FORMAT_BINARY
+    from processing.metrics import StageMetrics
+    from processing.streams import StreamManager
+    from processing.tiling import HorizonTiler
 except ImportError:
     print("\n[LỖI] Không thể import ObjectDetector. Hãy đảm bảo file 'backend/src/processing/detector.py' tồn tại.\n")
     exit()
 
 # === 1. KHỞI TẠO CÁC THÀNH PHẦN ===
 
+@asynccontextmanager
+async def lifespan(app):
+    """
+    Chạy mọi nguồn camera trong suốt vòng đời server.
+    Mô hình được tải + warmup trên luồng nền (chỉ trong tiến trình worker, không phải lúc import),
+    nên server nhận request ngay; các nguồn bắt đầu khi mô hình sẵn sàng.
+    """
+    loading = asyncio.ensure_future(run_in_threadpool(start_streams))
+    yield
+    # Server dừng khi mô hình còn đang tải: chờ tải xong rồi mới dừng
+    await loading
+    for producer in stream_producers.values():
+        producer.close()
+    for publisher in detection_publishers.values():
+        publisher.close()
+    if stream_manager is not None:
+        stream_manager.stop()
+    encode_pool.shutdown(wait=False)
+
+
 # --- Khởi tạo Ứng dụng FastAPI ---
 app = FastAPI(
     title="Collision Warning System API",
     description="API cho hệ thống cảnh báo va chạm sử dụng YOLOv8 và TTC.",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan
 )
 
 # --- Xác định đường dẫn ---
@@ -30,16 +60,28 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) # Trỏ v
 ROOT_DIR = os.path.dirname(BASE_DIR) # Trỏ về thư mục 'collision_warning_system/'
 
 VIDEO_PATH = os.path.join(ROOT_DIR, "data", "videos", "test_video.mp4")
+# Các nguồn camera chạy đồng thời: {stream_id: đường dẫn}; nguồn đầu tiên là mặc định của /video_stream
+VIDEO_SOURCES = {
+    "front": VIDEO_PATH,
+}
+DEFAULT_STREAM = next(iter(VIDEO_SOURCES))
 MODEL_PATH = os.path.join(ROOT_DIR, "models", "yolov8n.pt") # Đường dẫn tới model nếu bạn lưu riêng
+# Backend suy luận: "torch", "onnx" (onnxruntime) hoặc "openvino" - máy không có GPU nên dùng onnx/openvino
+MODEL_BACKEND = "torch"
+# Số frame tối đa (từ các nguồn khác nhau) trong một lần suy luận
+MAX_BATCH = 4
+# Mã hoá MJPEG: số luồng, chất lượng ban đầu và bitrate mục tiêu cho mỗi client (kbit/s, None = cố định)
+ENCODER_THREADS = 2
+MJPEG_QUALITY = 80
+MJPEG_TARGET_KBPS = 4000
+# Chạy thêm dải chân trời ở độ phân giải cao (mỗi TILE_INTERVAL frame) để thấy xe/người ở xa sớm hơn
+TILED_INFERENCE = False
+TILE_INTERVAL = 2
+# Giải mã mỗi nguồn ở một tiến trình riêng (frame qua bộ nhớ chung) để không tranh GIL với YOLO
+DECODE_PROCESS = False
 
-# --- Tải Mô hình AI ---
-# Tải mô hình 1 LẦN DUY NHẤT khi server khởi động
-# Chúng ta sẽ dùng model yolov8n.pt mặc định mà thư viện tự tải
-try:
-    detector = ObjectDetector() # Dùng model mặc định 'yolov8n.pt'
-except Exception as e:
-    print(f"\n[LỖI] Không thể tải mô hình YOLO. Lỗi: {e}\n")
-    exit()
+# Kích thước frame dùng để warmup mô hình (nên trùng độ phân giải camera)
+WARMUP_SHAPE = (720, 1280, 3)
 
 # --- Cấu hình Giao diện (Frontend) ---
 # Trỏ đến thư mục 'templates' của frontend
@@ -52,51 +94,74 @@ app.mount("/static",
 
 # === 2. ĐỊNH NGHĨA HÀM XỬ LÝ VIDEO ===
 
-def video_stream_generator():
+# Độ trễ từng giai đoạn (decode, inference, tracking, overlay, encode, ...)
+metrics = StageMetrics()
+
+# Vẽ + mã hoá JPEG chạy trên thread pool riêng (libjpeg-turbo nếu có), không chiếm luồng suy luận.
+jpeg_encoder = JpegEncoder()
+encode_pool = ThreadPoolExecutor(max_workers=ENCODER_THREADS, thread_name_prefix="jpeg")
+
+# Được tạo bởi start_streams() khi mô hình đã sẵn sàng
+stream_manager = None
+stream_producers = {}
+detection_publishers = {}
+load_error = None
+
+
+def start_streams():
     """
-    Hàm generator này sẽ đọc video, xử lý từng frame và 'yield' (trả về) 
-    frame đó dưới dạng byte JPEG.
+    Tải mô hình 1 LẦN DUY NHẤT, warmup, rồi khởi chạy mọi nguồn (chạy trên luồng nền).
+    Mọi nguồn dùng chung MỘT mô hình qua hàng đợi suy luận; mỗi nguồn có tracker và
+    TTCCalculator riêng, nguồn đang cảnh báo được suy luận trước.
+    Mỗi nguồn có đúng MỘT producer (vẽ + mã hoá JPEG) và MỘT publisher kết quả nhận diện/TTC
+    (WebSocket), dùng chung cho mọi client của nguồn đó.
     """
-    if not os.path.exists(VIDEO_PATH):
-        print(f"[LỖI] Không tìm thấy video tại: {VIDEO_PATH}")
-        return
-
-    cap = cv2.VideoCapture(VIDEO_PATH)
-    if not cap.isOpened():
-        print(f"[LỖI] Không thể mở file video: {VIDEO_PATH}")
+    global stream_manager, load_error
+    try:
+        tiler = HorizonTiler(interval=TILE_INTERVAL) if TILED_INFERENCE else None
+        detector = ObjectDetector(backend=MODEL_BACKEND, tiler=tiler) # Dùng model mặc định 'yolov8n.pt'
+        detector.warmup(WARMUP_SHAPE)
+    except Exception as e:
+        load_error = f"Không thể tải mô hình YOLO. Lỗi: {e}"
+        print(f"\n[LỖI] {load_error}\n")
         return
 
-    print("\nBắt đầu xử lý và truyền video...")
-    while cap.isOpened():
-        success, frame = cap.read()
-        if not success:
-            # Hết video, quay lại từ đầu
-            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-            continue
+    manager = StreamManager(detector, max_batch=MAX_BATCH, metrics=metrics,
+                            decode_process=DECODE_PROCESS)
+    for stream_id, source_path in VIDEO_SOURCES.items():
+        camera = manager.add_stream(stream_id, source_path)
+        stream_producers[stream_id] = StreamProducer(camera, metrics=metrics, encoder=jpeg_encoder,
+                                                     executor=encode_pool, quality=MJPEG_QUALITY,
+                                                     target_kbps=MJPEG_TARGET_KBPS)
+        detection_publishers[stream_id] = DetectionPublisher(camera)
+    manager.start()
+    stream_manager = manager
 
-        # 1. Đưa frame qua mô hình AI
-        results = detector.detect_and_track(frame)
-        
-        # 2. Vẽ kết quả (bounding box, ID) lên frame
-        annotated_frame = detector.draw_results(frame, results)
 
-        # 3. Mã hóa frame thành JPEG
-        # .jpg giúp nén ảnh, giảm băng thông truyền
-        (flag, encoded_image) = cv2.imencode(".jpg", annotated_frame)
-        if not flag:
-            continue
+def require_streams():
+    """503 khi mô hình chưa tải xong (hoặc tải lỗi)."""
+    if stream_manager is None:
+        raise HTTPException(status_code=503, detail=load_error or "Mô hình AI đang được tải, hãy thử lại sau.")
 
-        # 4. Yield frame dưới dạng byte cho response
-        # Đây là định dạng chuẩn của multipart/x-mixed-replace
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + bytearray(encoded_image) + b'\r\n')
 
-    cap.release()
-    print("Dừng truyền video.")
+def video_stream_generator(stream_id=DEFAULT_STREAM, scale=1.0):
+    """
+    Async generator trả về các frame đã xử lý dưới dạng byte JPEG.
+    Việc đọc video và chạy AI do StreamManager đảm nhận (luồng decode/suy luận riêng), nên số client
+    xem cùng lúc không làm tăng chi phí suy luận; client chờ frame trên event loop, không chiếm luồng.
+    """
+    require_streams()
+    producer = stream_producers.get(stream_id)
+    if producer is None:
+        raise HTTPException(status_code=404, detail=f"Không có nguồn '{stream_id}'")
+    return producer.stream_frames(scale)
 
 
 # === 3. TẠO CÁC API ENDPOINTS ===
 
+# ?scale= của luồng video: trong (0, 1]; NaN/vô cùng hoặc ngoài khoảng bị từ chối (422)
+ScaleQuery = Query(1.0, gt=0, le=1.0, description="Tỉ lệ thu nhỏ video (0..1]")
+
 @app.get("/", response_class=HTMLResponse)
 async def read_index(request: Request):
     """
@@ -105,21 +170,87 @@ async def read_index(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
 @app.get("/video_stream")
-def video_stream():
+async def video_stream(scale: float = ScaleQuery):
     """
     Endpoint này trả về luồng video đã được xử lý.
     Trình duyệt sẽ tự động nhận diện và hiển thị.
+    ?scale=0.5: nhận video thu nhỏ (vd: cho màn hình nhỏ hoặc mạng chậm).
     """
     # Trả về một StreamingResponse, nội dung là hàm generator ở trên
     return StreamingResponse(
-        video_stream_generator(),
+        video_stream_generator(scale=scale),
+        media_type="multipart/x-mixed-replace; boundary=frame"
+    )
+
+@app.get("/video_stream/{stream_id}")
+async def video_stream_by_id(stream_id: str, scale: float = ScaleQuery):
+    """
+    Luồng video đã xử lý của một nguồn cụ thể (vd: front, rear, left, right).
+    """
+    return StreamingResponse(
+        video_stream_generator(stream_id, scale),
         media_type="multipart/x-mixed-replace; boundary=frame"
     )
 
+@app.websocket("/ws/detections")
+async def detections_socket(websocket: WebSocket, format: str = FORMAT_JSON):
+    """Kết quả nhận diện/TTC của nguồn mặc định qua WebSocket."""
+    await send_detections(websocket, DEFAULT_STREAM, format)
+
+@app.websocket("/ws/detections/{stream_id}")
+async def detections_socket_by_id(websocket: WebSocket, stream_id: str, format: str = FORMAT_JSON):
+    """
+    Mỗi frame một thông điệp: track_id, lớp, khung, khoảng cách, TTC, cờ cảnh báo và mức rủi ro.
+    ?format=json (text) hoặc ?format=binary (bố cục trong processing/events.py).
+    Không cần mở /video_stream; client chậm chỉ nhận thông điệp mới nhất.
+    """
+    await send_detections(websocket, stream_id, format)
+
+async def send_detections(websocket, stream_id, message_format):
+    if stream_manager is None:
+        # 1013: try again later - mô hình chưa tải xong
+        await websocket.close(code=1013)
+        return
+    publisher = detection_publishers.get(stream_id)
+    if publisher is None or message_format not in MESSAGE_FORMATS:
+        # 1008: policy violation - nguồn hoặc định dạng không hợp lệ
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    broker = publisher.subscribe()
+    try:
+        # Chờ trên event loop: client rảnh/chậm không giữ luồng nào của server
+        async for message in publisher.iter_messages(broker):
+            if message_format == FORMAT_BINARY:
+                await websocket.send_bytes(message.binary())
+            else:
+                await websocket.send_text(message.json())
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        publisher.unsubscribe()
+
+@app.get("/streams")
+def read_streams():
+    """
+    Trạng thái từng nguồn: đang chạy, mức rủi ro (0/1/2), số frame đã xử lý, lỗi.
+    """
+    require_streams()
+    return stream_manager.status()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def read_metrics():
+    """
+    Độ trễ p50/p95/p99 của từng giai đoạn xử lý theo định dạng text của Prometheus.
+    """
+    return PlainTextResponse(metrics.to_prometheus(), media_type="text/plain; version=0.0.4")
+
 # --- Phần này để chạy server (giống như trước) ---
 if __name__ == "__main__":
     print(f"Server sẽ chạy từ thư mục gốc: {ROOT_DIR}")
-    print(f"Video sẽ được tải từ: {VIDEO_PATH}")
+    for stream_id, source_path in VIDEO_SOURCES.items():
+        print(f"Nguồn '{stream_id}' sẽ được tải từ: {source_path}")
     print(f"Giao diện sẽ được tải từ: {os.path.join(ROOT_DIR, 'frontend', 'templates')}")
     print("\nKhởi chạy server Uvicorn tại http://127.0.0.1:8000")
     
@@ -0,0 +1,106 @@
+import numpy as np
+
+from .calculator import (TTCCalculator, BOX_CLASS_COL, BOX_TRACK_ID_COL, DEFAULT_TTC_THRESHOLD,
+                         TTC_MODE_DISTANCE, as_box_array)
+
+# Vùng quan tâm: chỉ xét đối tượng có tâm nằm trong 60% giữa khung hình
+ROI_WIDTH_RATIO = 0.6
+
+# Các lớp phương tiện được tính TTC (car, motorcycle, bus, truck)
+VEHICLE_CLASS_IDS = (2, 3, 5, 7)
+
+# === MỨC RỦI RO CỦA MỘT FRAME ===
+RISK_NONE = 0        # không có đối tượng nào có TTC dưới ngưỡng cảnh báo
+RISK_WARNING = 1     # TTC nhỏ nhất dưới ngưỡng cảnh báo (config["ttc_threshold"])
+RISK_CRITICAL = 2    # ít nhất một track đang bật cảnh báo (hysteresis hoặc tức thì)
+
+
+class FrameAnalyzer:
+    """
+    Phân tích kết quả tracking của một frame (lô bản ghi của ObjectDetector.filter_results):
+    - Chọn đối tượng trong vùng ROI phía trước và thuộc lớp phương tiện
+    - Tính khoảng cách / vận tốc / TTC theo lô bằng TTCCalculator
+    - Tổng hợp trạng thái cảnh báo của cả frame
+    Dùng chung cho ứng dụng desktop, server và công cụ phân tích offline.
+    """
+
+    def __init__(self, fps, ttc_threshold=DEFAULT_TTC_THRESHOLD, ttc_mode=TTC_MODE_DISTANCE, track_grace=0):
+        self.calculator = TTCCalculator(fps, ttc_threshold=ttc_threshold, ttc_mode=ttc_mode,
+                                        track_grace=track_grace)
+
+    def set_ttc_threshold(self, ttc_threshold):
+        self.calculator.set_ttc_threshold(ttc_threshold)
+
+    def set_ttc_mode(self, ttc_mode):
+        self.calculator.set_ttc_mode(ttc_mode)
+
+    def set_track_grace(self, track_grace):
+        """Xem ObjectDetector.track_grace."""
+        self.calculator.set_track_grace(track_grace)
+
+    def reset(self):
+        """Xoá trạng thái TTC/cảnh báo của mọi track (giữ ngưỡng và cách tính TTC)."""
+        self.calculator.reset()
+
+    def analyze(self, detections, frame_shape, timestamp=None):
+        """
+        detections: lô bản ghi DETECTION_DTYPE, vd: detector.filter_results(results)
+        (đã lọc lớp mục tiêu và độ tin cậy).
+        timestamp: thời điểm của frame (giây) từ bộ giải mã/camera; None = cách đều 1/fps.
+        Trả về dict:
+        - boxes: mảng M×7 các đối tượng được tính TTC
+        - distances, velocities, ttcs, alerts: mảng độ dài M (ước lượng đã lọc Kalman)
+        - ttc_stds: độ lệch chuẩn ước lượng của TTC (độ tin cậy), mảng độ dài M
+        - track_ids: mọi track_id trong detections (kể cả ngoài ROI)
+        - risk_level: RISK_NONE / RISK_WARNING / RISK_CRITICAL
+        - overall_danger, is_red_alert (= RISK_CRITICAL), min_ttc, min_distance, min_class_id
+        """
+        boxes_data = as_box_array(detections)
+        # Đối tượng chưa được track (track_id = -1) không có lịch sử để tính TTC
+        has_id = boxes_data[:, BOX_TRACK_ID_COL] >= 0
+        current_track_ids = boxes_data[has_id, BOX_TRACK_ID_COL].astype(int).tolist()
+
+        frame_w = frame_shape[1]
+        cx = (boxes_data[:, 0] + boxes_data[:, 2]) / 2
+        in_roi = np.abs(cx - frame_w / 2) <= frame_w * ROI_WIDTH_RATIO / 2
+        is_vehicle = np.isin(boxes_data[:, BOX_CLASS_COL].astype(int), VEHICLE_CLASS_IDS)
+        tracked = boxes_data[has_id & in_roi & is_vehicle]
+
+        # Tính TTC + trạng thái cảnh báo của từng track trong 1 lần gọi
+        distances, velocities, ttcs, _, alerts = self.calculator.calculate_ttc_batch(tracked, timestamp)
+
+        min_ttc = float("inf")
+        min_distance = float("inf")
+        min_class_id = None
+        if len(ttcs) and np.isfinite(ttcs).any():
+            idx = int(np.argmin(ttcs))
+            min_ttc = float(ttcs[idx])
+            min_distance = float(distances[idx])
+            min_class_id = int(tracked[idx, BOX_CLASS_COL])
+
+        _, _, ttc_stds = self.calculator.estimate_std(tracked[:, BOX_TRACK_ID_COL])
+        self.calculator.cleanup_history(current_track_ids)
+
+        if alerts.any():
+            risk_level = RISK_CRITICAL
+        elif min_ttc <= self.calculator.ttc_threshold:
+            risk_level = RISK_WARNING
+        else:
+            risk_level = RISK_NONE
+
+        return {
+            "boxes": tracked,
+            "distances": distances,
+            "velocities": velocities,
+            "ttcs": ttcs,
+            "alerts": alerts,
+            "ttc_stds": ttc_stds,
+            "track_ids": current_track_ids,
+            "object_count": len(current_track_ids),
+            "risk_level": risk_level,
+            "overall_danger": risk_level == RISK_CRITICAL,
+            "is_red_alert": risk_level == RISK_CRITICAL,
+            "min_ttc": min_ttc,
+            "min_distance": min_distance,
+            "min_class_id": min_class_id,
+        }
@@ -0,0 +1,125 @@
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """
+    Gom frame từ nhiều luồng/nguồn thành lô để chạy ObjectDetector.detect_batch():
+    - Một lô được chạy khi đủ max_batch frame hoặc khi frame đầu tiên đã chờ quá max_delay giây
+    - submit() trả về Future; kết quả cùng định dạng với detect_and_track()
+    - Chỉ một luồng worker gọi detector, nên mô hình và tracker của từng nguồn không bị truy cập đồng thời
+    - Khi có nhiều frame hơn max_batch, nguồn có priority cao hơn được chạy trước (cùng priority:
+      frame chờ lâu hơn trước); frame có priority >= flush_priority được chạy ngay, không chờ đủ lô
+    """
+
+    def __init__(self, detector, max_batch=8, max_delay=0.01, track=True, flush_priority=None,
+                 metrics=None):
+        self.detector = detector
+        self.max_batch = max(1, int(max_batch))
+        self.max_delay = max_delay
+        self.track = track
+        self.flush_priority = flush_priority
+        self.metrics = metrics
+        self.batches = 0
+        self.frames = 0
+        self._pending = []   # (frame, stream_id, future, thời điểm gửi, priority)
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return self
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=2.0):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        # Huỷ các frame chưa được xử lý. Worker có thể vẫn chạy nếu join hết thời gian,
+        # nên lấy danh sách ra dưới khoá rồi mới huỷ (callback của Future chạy ngoài khoá)
+        with self._cond:
+            pending, self._pending = self._pending, []
+        for item in pending:
+            item[2].cancel()
+
+    def submit(self, frame, stream_id=None, priority=0):
+        """Đưa một frame vào hàng đợi; trả về Future của kết quả."""
+        future = Future()
+        with self._cond:
+            if not self._running:
+                raise RuntimeError("MicroBatcher chưa được khởi động.")
+            self._pending.append((frame, stream_id, future, time.perf_counter(), priority))
+            self._cond.notify_all()
+        return future
+
+    def detect_and_track(self, frame, stream_id=None, timeout=None, priority=0):
+        """Gửi một frame và chờ kết quả (dùng như ObjectDetector.detect_and_track)."""
+        return self.submit(frame, stream_id, priority).result(timeout)
+
+    @property
+    def average_batch_size(self):
+        return self.frames / self.batches if self.batches else 0.0
+
+    def _collect(self):
+        """Chờ tới khi đủ lô hoặc hết hạn chờ của frame đầu tiên; trả về lô (rỗng khi dừng)."""
+        with self._cond:
+            while self._running and not self._pending:
+                self._cond.wait()
+            if not self._running:
+                return []
+            deadline = min(item[3] for item in self._pending) + self.max_delay
+            while self._running and len(self._pending) < self.max_batch and not self._urgent():
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            # Ưu tiên theo nguồn (priority lớn nhất của nguồn đó) rồi theo thời điểm gửi;
+            # các frame cùng nguồn vì vậy luôn giữ đúng thứ tự cho tracker
+            stream_priority = {}
+            for item in self._pending:
+                stream_priority[item[1]] = max(stream_priority.get(item[1], item[4]), item[4])
+            self._pending.sort(key=lambda item: (-stream_priority[item[1]], item[3]))
+            batch = self._pending[:self.max_batch]
+            del self._pending[:self.max_batch]
+            return batch
+
+    def _urgent(self):
+        return (self.flush_priority is not None
+                and any(item[4] >= self.flush_priority for item in self._pending))
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if not batch:
+                return
+            batch = [item for item in batch if item[2].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            frames = [item[0] for item in batch]
+            stream_ids = [item[1] for item in batch]
+            start = time.perf_counter()
+            try:
+                outputs = self.detector.detect_batch(frames, stream_ids, track=self.track)
+            except Exception as e:
+                print(f"[LỖI] Suy luận theo lô thất bại: {e}")
+                for item in batch:
+                    item[2].set_exception(e)
+                continue
+            self.batches += 1
+            self.frames += len(batch)
+            if self.metrics is not None:
+                # Thời gian chia đều cho từng frame của lô
+                per_frame = (time.perf_counter() - start) / len(batch)
+                for results in outputs:
+                    self.metrics.observe_detection(results, per_frame)
+            for item, results in zip(batch, outputs):
+                item[2].set_result(results)
@@ -0,0 +1,272 @@
+import asyncio
+import math
+import threading
+import time
+
+from .encoder import JpegEncoder, AdaptiveJpegStream, DEFAULT_QUALITY, MIN_RESOLUTION
+from .metrics import STAGE_OVERLAY, STAGE_ENCODE
+from .overlay import OverlayRenderer
+
+# Ranh giới giữa các frame trong luồng multipart/x-mixed-replace
+MJPEG_BOUNDARY = b"frame"
+MJPEG_PART_HEADER = b'--' + MJPEG_BOUNDARY + b'\r\nContent-Type: image/jpeg\r\n\r\n'
+MJPEG_PART_TRAILER = b'\r\n'
+
+
+class FrameBroker:
+    """
+    Phát (fan-out) dữ liệu mới nhất của một nguồn tới nhiều subscriber.
+    - Chỉ giữ frame mới nhất kèm số thứ tự (seq)
+    - Subscriber chậm sẽ bỏ qua các frame trung gian, không làm chậm producer
+    - Producer chạy trên luồng thường; subscriber có thể chờ bằng wait_next() (chặn luồng)
+      hoặc await wait_next_async() (không giữ luồng nào, phù hợp cho nhiều client rảnh/chậm)
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._data = None
+        self._seq = 0
+        self._closed = False
+        self._async_waiters = []    # (event loop, future) của các subscriber async đang chờ
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def publish(self, data):
+        with self._cond:
+            self._data = data
+            self._seq += 1
+            self._cond.notify_all()
+            self._wake_async()
+
+    def _wake_async(self):
+        """Đánh thức các subscriber async (gọi khi đang giữ self._cond)."""
+        for loop, waiter in self._async_waiters:
+            loop.call_soon_threadsafe(_resolve, waiter)
+        self._async_waiters = []
+
+    def wait_next(self, last_seq, timeout=None):
+        """
+        Chờ frame có seq mới hơn last_seq.
+        Trả về (seq, data); data là None nếu hết thời gian chờ hoặc broker đã đóng.
+        """
+        with self._cond:
+            ready = self._cond.wait_for(lambda: self._closed or self._seq > last_seq, timeout)
+            if not ready or self._seq <= last_seq:
+                return last_seq, None
+            return self._seq, self._data
+
+    async def wait_next_async(self, last_seq, timeout=None):
+        """Như wait_next() nhưng chờ trên event loop hiện tại thay vì chặn luồng."""
+        with self._cond:
+            if self._closed or self._seq > last_seq:
+                return self._latest(last_seq)
+            waiter = asyncio.get_running_loop().create_future()
+            self._async_waiters.append((asyncio.get_running_loop(), waiter))
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._cond:
+                self._async_waiters = [item for item in self._async_waiters if item[1] is not waiter]
+        with self._cond:
+            return self._latest(last_seq)
+
+    def _latest(self, last_seq):
+        if self._seq <= last_seq:
+            return last_seq, None
+        return self._seq, self._data
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            self._wake_async()
+
+
+def _resolve(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class StreamPublisher:
+    """
+    Cơ sở cho các bộ phát theo nguồn (CameraStream của StreamManager): chỉ đăng ký
+    listener vào nguồn khi có ít nhất một subscriber, và phát kết quả qua FrameBroker.
+    Lớp con cài đặt _on_frame(stream, frame, results, analysis) và gọi self.broker.publish().
+    """
+
+    def __init__(self, stream, metrics=None, wait_timeout=5.0):
+        self.stream = stream
+        self.metrics = metrics
+        self.wait_timeout = wait_timeout
+        self.broker = FrameBroker()
+        self.subscribers = 0
+        self._lock = threading.Lock()
+
+    # --- QUẢN LÝ SUBSCRIBER ---
+    def subscribe(self):
+        """Thêm một subscriber; trả về FrameBroker để chờ dữ liệu (wait_next)."""
+        with self._lock:
+            self.subscribers += 1
+            if self.subscribers == 1:
+                if self.broker.closed:
+                    self.broker = FrameBroker()
+                self.stream.add_listener(self._on_frame)
+            return self.broker
+
+    def unsubscribe(self):
+        with self._lock:
+            self.subscribers -= 1
+            if self.subscribers <= 0:
+                self.subscribers = 0
+                self.stream.remove_listener(self._on_frame)
+
+    def source_failed(self):
+        """Nguồn đã dừng vì lỗi (subscriber nên ngắt thay vì chờ tiếp)."""
+        return self.stream.error is not None and not self.stream.is_running
+
+    async def iter_messages(self, broker):
+        """
+        Async generator: dữ liệu mới nhất của broker cho tới khi broker đóng hoặc nguồn lỗi.
+        Chờ trên event loop nên mỗi client không chiếm luồng nào của server.
+        """
+        seq = 0
+        while True:
+            seq, data = await broker.wait_next_async(seq, timeout=self.wait_timeout)
+            if data is None:
+                if broker.closed or self.source_failed():
+                    return
+                continue
+            yield data
+
+    def close(self):
+        """Ngắt mọi subscriber (khi dừng server)."""
+        with self._lock:
+            self.stream.remove_listener(self._on_frame)
+            self.broker.close()
+
+    def _on_frame(self, stream, frame, results, analysis):
+        raise NotImplementedError
+
+
+class StreamProducer(StreamPublisher):
+    """
+    Phát MJPEG cho một nguồn (CameraStream của StreamManager): vẽ + mã hoá JPEG
+    chỉ chạy MỘT lần cho mỗi frame (và mỗi tỉ lệ thu nhỏ), rồi phát tới mọi client đang xem.
+    - Decode, suy luận và TTC do CameraStream đảm nhận (chạy kể cả khi không ai xem)
+    - Chỉ vẽ và mã hoá khi có ít nhất một client
+    - Có executor: vẽ + mã hoá chạy trên thread pool, luồng suy luận không phải chờ;
+      nếu frame trước chưa mã hoá xong thì chỉ giữ frame mới nhất
+    - Mỗi tỉ lệ thu nhỏ (scale) là một AdaptiveJpegStream riêng, tự chỉnh chất lượng/độ phân giải
+      theo target_kbps
+    """
+
+    def __init__(self, stream, metrics=None, wait_timeout=5.0, encoder=None, executor=None,
+                 quality=DEFAULT_QUALITY, target_kbps=None):
+        super().__init__(stream, metrics=metrics, wait_timeout=wait_timeout)
+        self.overlay = OverlayRenderer()
+        self.encoder = encoder if encoder is not None else JpegEncoder()
+        self.executor = executor
+        self.quality = quality
+        self.target_kbps = target_kbps
+        self.dropped = 0                # frame bỏ qua vì encoder còn bận
+        self._variants = {}             # scale -> [AdaptiveJpegStream, FrameBroker, số client]
+        self._pending = None            # (frame, results, analysis) chờ mã hoá
+        self._draining = False
+        self._pending_lock = threading.Lock()
+
+    def _subscribe_variant(self, scale):
+        self.subscribe()
+        with self._lock:
+            variant = self._variants.get(scale)
+            if variant is None:
+                jpeg = AdaptiveJpegStream(self.encoder, scale, self.target_kbps, self.quality)
+                variant = self._variants[scale] = [jpeg, FrameBroker(), 0]
+            variant[2] += 1
+            return variant[1]
+
+    def _unsubscribe_variant(self, scale):
+        with self._lock:
+            variant = self._variants.get(scale)
+            if variant is not None:
+                variant[2] -= 1
+                if variant[2] <= 0:
+                    del self._variants[scale]
+        self.unsubscribe()
+
+    async def stream_frames(self, scale=1.0):
+        """
+        Async generator cho StreamingResponse: trả về các phần multipart JPEG.
+        scale: tỉ lệ thu nhỏ (0..1] cho client này; client cùng tỉ lệ dùng chung một lần mã hoá.
+        Mỗi client luôn nhận frame mới nhất; frame nào lỡ thì bỏ qua.
+        Buffer JPEG được gửi thẳng (memoryview), không ghép/chép thêm.
+        """
+        scale = float(scale)
+        if not math.isfinite(scale):
+            # NaN lọt qua phép kẹp (mọi so sánh đều sai) và mỗi NaN là một khoá _variants mới
+            raise ValueError(f"Tỉ lệ thu nhỏ không hợp lệ: {scale}")
+        scale = round(min(max(scale, MIN_RESOLUTION), 1.0), 2)
+        broker = self._subscribe_variant(scale)
+        try:
+            async for data in self.iter_messages(broker):
+                yield MJPEG_PART_HEADER
+                yield memoryview(data)
+                yield MJPEG_PART_TRAILER
+        finally:
+            self._unsubscribe_variant(scale)
+
+    def close(self):
+        super().close()
+        with self._lock:
+            for variant in self._variants.values():
+                variant[1].close()
+
+    # --- XỬ LÝ MỖI FRAME (trên luồng của CameraStream) ---
+    def _on_frame(self, stream, frame, results, analysis):
+        if self.executor is None:
+            self._encode_frame(frame, results, analysis)
+            return
+        with self._pending_lock:
+            if self._pending is not None:
+                self.dropped += 1
+            self._pending = (frame, results, analysis)
+            if self._draining:
+                return
+            self._draining = True
+        self.executor.submit(self._drain)
+
+    def _drain(self):
+        """Chạy trên thread pool: mã hoá frame đang chờ cho đến khi không còn frame mới."""
+        while True:
+            with self._pending_lock:
+                item = self._pending
+                self._pending = None
+                if item is None:
+                    self._draining = False
+                    return
+            try:
+                self._encode_frame(*item)
+            except Exception as e:
+                print(f"[LỖI] Mã hoá JPEG nguồn '{self.stream.stream_id}' thất bại: {e}")
+
+    def _encode_frame(self, frame, results, analysis):
+        with self._lock:
+            variants = [(variant[0], variant[1]) for variant in self._variants.values()]
+        if not variants:
+            return
+        start = time.perf_counter()
+        # Vẽ khung, khoảng cách/TTC và HUD lên frame
+        annotated_frame = self.overlay.render(frame, results, analysis)
+        t_overlay = time.perf_counter()
+
+        # Mã hóa JPEG 1 lần cho mỗi tỉ lệ, dùng chung cho mọi client của tỉ lệ đó
+        for jpeg, broker in variants:
+            data = jpeg.encode(annotated_frame)
+            if data is not None:
+                broker.publish(data)
+        if self.metrics is not None:
+            self.metrics.observe(STAGE_OVERLAY, t_overlay - start)
+            self.metrics.observe(STAGE_ENCODE, time.perf_counter() - t_overlay)
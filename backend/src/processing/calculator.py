@@ -1,4 +1,6 @@
-import time
+import numpy as np
+
+from .kalman import KinematicKalman
 
 # === CÁC HẰNG SỐ HIỆU CHỈNH ===
 # Chiều rộng trung bình (m) của các loại đối tượng (theo COCO)
@@ -22,134 +24,398 @@ CRITICAL_DISTANCES = {
     7: 2.0    # truck
 }
 
-# Ngưỡng phát hiện tốc độ phóng to khung (pixel/frame)
+# Ngưỡng phát hiện tốc độ phóng to khung (pixel/frame ở FPS danh định)
 EXPANSION_RATE_THRESHOLD = 10.0
 
-# Hệ số làm mượt khoảng cách (EMA)
-EMA_ALPHA = 0.4
+# === BỘ LỌC KALMAN ===
+# Độ lệch chuẩn (pixel) của kích thước bounding box do detector rung;
+# sai số khoảng cách suy ra: d × PIXEL_NOISE / kích thước (xa/nhỏ thì nhiễu hơn)
+PIXEL_NOISE = 2.0
+# Mật độ phổ nhiễu jerk của khoảng cách (m²/s⁵): lớn = bám nhanh hơn khi xe phanh/tăng tốc
+DISTANCE_JERK_NOISE = 4.0
+# Mật độ phổ nhiễu gia tốc của kích thước khung (pixel²/s³)
+SCALE_ACCEL_NOISE = 2000.0
+# Độ lệch chuẩn ban đầu của track mới: vận tốc (m/s), gia tốc (m/s²), tốc độ phóng to (pixel/s)
+INITIAL_VELOCITY_STD = 5.0
+INITIAL_ACCEL_STD = 2.0
+INITIAL_SCALE_RATE_STD = 50.0
+
+# === CHẾ ĐỘ TÍNH TTC ===
+TTC_MODE_DISTANCE = "distance"   # khoảng cách (m) / vận tốc tiếp cận - phụ thuộc KNOWN_WIDTHS, FOCAL_LENGTH
+TTC_MODE_SCALE = "scale"         # tau = kích thước / tốc độ phóng to của khung - không cần hiệu chỉnh
+TTC_MODES = (TTC_MODE_DISTANCE, TTC_MODE_SCALE)
+
+# Số mẫu log-kích thước giữ lại cho hồi quy tau (ring buffer)
+TAU_WINDOW = 16
+# Số mẫu tối thiểu trước khi tính tau (ít hơn thì độ dốc quá nhiễu, gây cảnh báo giả)
+TAU_MIN_SAMPLES = 8
+# Tốc độ phóng to tương đối tối thiểu (1/s) để coi là đang tiến lại gần (tau < 100s)
+TAU_MIN_RATE = 0.01
+
+# Ngưỡng TTC cảnh báo mặc định (giây) - config["ttc_threshold"] của ứng dụng
+DEFAULT_TTC_THRESHOLD = 3.0
+
+# Ngưỡng hysteresis suy ra từ ngưỡng cảnh báo:
+# bật khi TTC <= ngưỡng × ALERT_ON_RATIO, tắt khi TTC >= ngưỡng bật × ALERT_OFF_RATIO
+# (ngưỡng 3.0s -> bật 2.0s / tắt 2.5s)
+ALERT_ON_RATIO = 2.0 / 3.0
+ALERT_OFF_RATIO = 1.25
+
+# Số slot track cấp phát ban đầu (tự tăng gấp đôi khi thiếu)
+INITIAL_CAPACITY = 64
+
+# Cột của boxes.data khi tracking: [x1, y1, x2, y2, track_id, conf, class_id]
+BOX_TRACK_ID_COL = 4
+BOX_CLASS_COL = 6
+
+# Bản ghi nhận diện gọn (ObjectDetector.filter_results), cùng bố cục với một hàng boxes.data
+# khi tracking (mọi trường float32), nên một lô bản ghi là view của mảng N×7 (xem as_box_array).
+# track_id = -1 nếu đối tượng chưa được track.
+DETECTION_DTYPE = np.dtype({
+    "names": ["bbox", "track_id", "conf", "class_id"],
+    "formats": [("<f4", (4,)), "<f4", "<f4", "<f4"],
+    "offsets": [0, 16, 20, 24],
+})
+
+
+def as_box_array(detections):
+    """Mảng N×7 [x1, y1, x2, y2, track_id, conf, class_id] của lô bản ghi DETECTION_DTYPE (không sao chép)."""
+    return np.ascontiguousarray(detections).view(np.float32).reshape(-1, 7)
+
+
+def _build_class_table(values, default):
+    """
+    Chuyển dict {class_id: giá trị} thành mảng tra cứu theo class_id.
+    Phần tử cuối cùng chứa giá trị mặc định cho class_id không có trong dict.
+    """
+    table = np.full(max(values) + 2, default, dtype=np.float64)
+    for class_id, value in values.items():
+        table[class_id] = value
+    return table
+
+
+_KNOWN_WIDTH_TABLE = _build_class_table(KNOWN_WIDTHS, 1.8)
+_CRITICAL_DISTANCE_TABLE = _build_class_table(CRITICAL_DISTANCES, 1.8)
+
+# Mọi cặp (i, j), i < j trong cửa sổ tau - dùng cho hồi quy Theil-Sen
+_TAU_PAIRS = np.triu_indices(TAU_WINDOW, k=1)
+
+
+def _class_index(class_ids, table):
+    """Chỉ số tra cứu trong bảng; class_id ngoài bảng trỏ về giá trị mặc định (cuối bảng)."""
+    default_idx = len(table) - 1
+    return np.where((class_ids >= 0) & (class_ids < default_idx), class_ids, default_idx)
+
+
+def alert_thresholds(ttc_threshold=DEFAULT_TTC_THRESHOLD):
+    """(ngưỡng bật, ngưỡng tắt) của hysteresis cảnh báo theo ngưỡng TTC cấu hình."""
+    ttc_on = ttc_threshold * ALERT_ON_RATIO
+    return ttc_on, ttc_on * ALERT_OFF_RATIO
 
 
 class TTCCalculator:
     """
     Bộ xử lý ước lượng Time To Collision (TTC)
-    - Làm mượt khoảng cách
-    - Tính TTC dựa trên đạo hàm kích thước khung
+    - Ước lượng khoảng cách, vận tốc tiếp cận và gia tốc bằng bộ lọc Kalman
+      (gia tốc không đổi), kèm độ bất định của ước lượng
+    - Ước lượng tốc độ phóng to khung bằng bộ lọc Kalman (vận tốc không đổi)
+    - Tính TTC theo một trong hai chế độ:
+      TTC_MODE_DISTANCE: khoảng cách và vận tốc đã lọc (cần hiệu chỉnh KNOWN_WIDTHS, FOCAL_LENGTH)
+      TTC_MODE_SCALE: tau = 1 / tốc độ phóng to tương đối của khung, ước lượng bằng hồi quy
+      Theil-Sen (trung vị độ dốc từng cặp mẫu) trên log-kích thước của TAU_WINDOW mẫu gần nhất;
+      không cần hiệu chỉnh và bền với khung bị rung. Khoảng cách vẫn được ước lượng để hiển thị.
     - Phát hiện cảnh báo tức thì khi đối tượng quá gần hoặc lao tới nhanh
+    - Trạng thái cảnh báo (hysteresis) riêng cho từng track
+
+    Trạng thái của các track được lưu dạng struct-of-arrays: mỗi track chiếm một
+    slot. Toàn bộ track trong một frame được lọc bằng một lần gọi calculate_ttc_batch().
+
+    Bước dự đoán dùng khoảng thời gian thực giữa hai lần đo (timestamp của frame),
+    nên frame bị bỏ, suy luận thưa hay xử lý nhanh hơn thời gian thực không làm sai TTC.
+    Không có timestamp thì coi hai lần cập nhật liên tiếp của một track cách nhau đúng 1/fps.
+    track_grace: số frame liên tiếp một track được phép vắng mặt mà vẫn giữ trạng thái
+    (vd: đối tượng ở xa chỉ thấy được trên các frame có suy luận theo ô).
     """
 
-    def __init__(self, fps):
-        self.history = {}          # track_id: dict
-        self.smooth_dist = {}       # track_id: giá trị khoảng cách đã làm mượt
+    def __init__(self, fps, capacity=INITIAL_CAPACITY, ttc_threshold=DEFAULT_TTC_THRESHOLD,
+                 ttc_mode=TTC_MODE_DISTANCE, track_grace=0):
         self.time_per_frame = 1.0 / fps if fps > 0 else 0.033
-        self.alert_active = False   # dùng cho hysteresis
+        self.set_ttc_threshold(ttc_threshold)
+        self.set_ttc_mode(ttc_mode)
+        self.set_track_grace(track_grace)
+
+        # --- Kho lưu track (struct-of-arrays) ---
+        capacity = max(1, int(capacity))
+        self._slot_ids = np.full(capacity, -1, dtype=np.int64)      # track_id của slot, -1 = trống
+        self._last_time = np.zeros(capacity, dtype=np.float64)      # thời điểm lần đo gần nhất
+        self._alert = np.zeros(capacity, dtype=bool)                 # trạng thái hysteresis của track
+        self._missed = np.zeros(capacity, dtype=np.int64)           # số frame liên tiếp track vắng mặt
+        self._count = np.zeros(capacity, dtype=np.int64)            # số mẫu hợp lệ trong ring buffer tau
+        self._head = np.zeros(capacity, dtype=np.int64)             # vị trí ghi tiếp theo
+        self._log_scale_hist = np.zeros((capacity, TAU_WINDOW), dtype=np.float64)
+        self._time_hist = np.zeros((capacity, TAU_WINDOW), dtype=np.float64)
+        # [khoảng cách, vận tốc, gia tốc] (m, m/s, m/s²) và [kích thước, tốc độ phóng to] (pixel, pixel/s)
+        self._distance_filter = KinematicKalman(3, DISTANCE_JERK_NOISE, capacity,
+                                                (INITIAL_VELOCITY_STD, INITIAL_ACCEL_STD))
+        self._scale_filter = KinematicKalman(2, SCALE_ACCEL_NOISE, capacity, (INITIAL_SCALE_RATE_STD,))
         print(f"TTCCalculator khởi tạo với FPS={fps:.2f}")
 
+    def set_ttc_threshold(self, ttc_threshold):
+        """Đổi ngưỡng cảnh báo (vd: từ cửa sổ Cài đặt); áp dụng từ frame kế tiếp."""
+        self.ttc_threshold = ttc_threshold
+        self.ttc_on, self.ttc_off = alert_thresholds(ttc_threshold)
+
+    def set_ttc_mode(self, ttc_mode):
+        """Chọn cách tính TTC (TTC_MODE_DISTANCE / TTC_MODE_SCALE); áp dụng từ frame kế tiếp."""
+        if ttc_mode not in TTC_MODES:
+            raise ValueError(f"Chế độ TTC không hợp lệ: {ttc_mode} (hỗ trợ: {', '.join(TTC_MODES)})")
+        self.ttc_mode = ttc_mode
+
+    def set_track_grace(self, track_grace):
+        """Số frame liên tiếp một track được vắng mặt trước khi bị xoá trạng thái."""
+        self.track_grace = max(0, int(track_grace))
+
+    @property
+    def capacity(self):
+        return len(self._slot_ids)
+
+    @property
+    def track_count(self):
+        return int(np.count_nonzero(self._slot_ids >= 0))
+
+    # --- QUẢN LÝ SLOT ---
+    def _grow(self, min_capacity):
+        """Tăng gấp đôi số slot cho đến khi đủ chỗ."""
+        old = self.capacity
+        new = old
+        while new < min_capacity:
+            new *= 2
+        extra = new - old
+
+        self._slot_ids = np.concatenate([self._slot_ids, np.full(extra, -1, dtype=np.int64)])
+        self._last_time = np.concatenate([self._last_time, np.zeros(extra)])
+        self._alert = np.concatenate([self._alert, np.zeros(extra, dtype=bool)])
+        self._missed = np.concatenate([self._missed, np.zeros(extra, dtype=np.int64)])
+        self._count = np.concatenate([self._count, np.zeros(extra, dtype=np.int64)])
+        self._head = np.concatenate([self._head, np.zeros(extra, dtype=np.int64)])
+        self._log_scale_hist = np.concatenate([self._log_scale_hist, np.zeros((extra, TAU_WINDOW))])
+        self._time_hist = np.concatenate([self._time_hist, np.zeros((extra, TAU_WINDOW))])
+        self._distance_filter.grow(new)
+        self._scale_filter.grow(new)
+
+    def _lookup_slots(self, track_ids):
+        """
+        Tìm slot của từng track_id, cấp slot mới cho track chưa có.
+        Trả về (slots, is_new).
+        """
+        match = track_ids[:, None] == self._slot_ids[None, :]
+        is_new = ~match.any(axis=1)
+        slots = match.argmax(axis=1)
+
+        if is_new.any():
+            new_ids, inverse = np.unique(track_ids[is_new], return_inverse=True)
+            free = np.flatnonzero(self._slot_ids < 0)
+            if len(free) < len(new_ids):
+                self._grow(self.track_count + len(new_ids))
+                free = np.flatnonzero(self._slot_ids < 0)
+            new_slots = free[:len(new_ids)]
+            self._slot_ids[new_slots] = new_ids
+            self._alert[new_slots] = False
+            self._missed[new_slots] = 0
+            self._count[new_slots] = 0
+            self._head[new_slots] = 0
+            slots[is_new] = new_slots[inverse.ravel()]
+        return slots, is_new
+
     # --- ƯỚC LƯỢNG KHOẢNG CÁCH ---
-    def _estimate_distance(self, class_id, pixel_size):
+    def _estimate_distance(self, class_ids, pixel_sizes):
         """Ước lượng khoảng cách (m) dựa trên kích thước pixel của bounding box."""
-        if pixel_size <= 0:
-            return float('inf')
-        known_width = KNOWN_WIDTHS.get(class_id, 1.8)
-        return (known_width * FOCAL_LENGTH) / pixel_size
-
-    # --- LÀM MƯỢT DỮ LIỆU ---
-    def _smooth_value(self, track_id, new_value):
-        prev = self.smooth_dist.get(track_id, new_value)
-        smoothed = EMA_ALPHA * new_value + (1 - EMA_ALPHA) * prev
-        self.smooth_dist[track_id] = smoothed
-        return smoothed
+        known_widths = _KNOWN_WIDTH_TABLE[_class_index(class_ids, _KNOWN_WIDTH_TABLE)]
+        with np.errstate(divide="ignore"):
+            return np.where(pixel_sizes > 0, known_widths * FOCAL_LENGTH / pixel_sizes, np.inf)
 
     # --- TÍNH TOÁN TTC ---
-    def calculate_ttc(self, track_id, box, class_id=None):
+    def calculate_ttc_batch(self, boxes_data, timestamp=None):
         """
-        Tính toán khoảng cách, vận tốc, TTC, và cờ cảnh báo tức thì.
+        Tính khoảng cách, vận tốc, TTC và cờ cảnh báo cho mọi track trong frame.
+
+        boxes_data: mảng N×7 (results[0].boxes.data) với các cột
+                    [x1, y1, x2, y2, track_id, conf, class_id], hoặc lô bản ghi DETECTION_DTYPE.
+        timestamp: thời điểm của frame (giây, tăng dần), vd: CAP_PROP_POS_MSEC / 1000.
+        Trả về 5 mảng độ dài N: (distance, velocity, ttc, immediate_alert, alert)
+        với alert = trạng thái hysteresis của track (đã cập nhật) hoặc cảnh báo tức thì.
+        Khung chưa được track (track_id < 0) có distance/ttc vô cùng và không cảnh báo.
         """
-        x1, y1, x2, y2 = box
-        width = max(x2 - x1, 1)
-        height = max(y2 - y1, 1)
+        if getattr(boxes_data, "dtype", None) == DETECTION_DTYPE:
+            boxes_data = as_box_array(boxes_data)
+        data = np.asarray(boxes_data, dtype=np.float64).reshape(-1, 7)
+        n = len(data)
+        if n == 0:
+            empty = np.zeros(0)
+            return empty, empty.copy(), empty.copy(), np.zeros(0, dtype=bool), np.zeros(0, dtype=bool)
+
+        untracked = data[:, BOX_TRACK_ID_COL] < 0
+        if untracked.any():
+            # Khung chưa có track_id (-1, trùng giá trị đánh dấu slot trống): không có lịch sử
+            # để ước lượng, không được cấp slot -> khoảng cách/TTC vô cùng, không cảnh báo
+            outputs = (np.full(n, np.inf), np.zeros(n), np.full(n, np.inf),
+                       np.zeros(n, dtype=bool), np.zeros(n, dtype=bool))
+            tracked = ~untracked
+            if tracked.any():
+                for out, values in zip(outputs, self.calculate_ttc_batch(data[tracked], timestamp)):
+                    out[tracked] = values
+            return outputs
+
+        track_ids = data[:, BOX_TRACK_ID_COL].astype(np.int64)
+        class_ids = data[:, BOX_CLASS_COL].astype(np.int64)
+        width = np.maximum(data[:, 2] - data[:, 0], 1)
+        height = np.maximum(data[:, 3] - data[:, 1], 1)
         pixel_size = (width + height) / 2.0
 
-        # Ước tính khoảng cách
-        raw_distance = self._estimate_distance(class_id, pixel_size)
-        distance = self._smooth_value(track_id, raw_distance)
-        current_time = time.time()
-
-        # Khởi tạo lịch sử nếu chưa có
-        if track_id not in self.history:
-            self.history[track_id] = {
-                "distances": [distance],
-                "sizes": [pixel_size],
-                "velocity": 0.0,
-                "last_time": current_time
-            }
-            return distance, 0.0, float("inf"), False
-
-        entry = self.history[track_id]
-        distances = entry["distances"]
-        sizes = entry["sizes"]
-
-        # Cập nhật danh sách lịch sử
-        distances.append(distance)
-        sizes.append(pixel_size)
-        if len(distances) > 6:
-            distances.pop(0)
-        if len(sizes) > 6:
-            sizes.pop(0)
-
-        # Tính vận tốc trung bình
-        diffs = [distances[i] - distances[i - 1] for i in range(1, len(distances))]
-        avg_diff = sum(diffs) / len(diffs) if diffs else 0.0
-        velocity = avg_diff / self.time_per_frame
-
-        # Tính tốc độ phóng to bounding box
-        size_diffs = [sizes[i] - sizes[i - 1] for i in range(1, len(sizes))]
-        avg_size_rate = sum(size_diffs) / len(size_diffs) if size_diffs else 0.0
-
-        # Tính TTC (Time to Collision)
-        ttc = float("inf")
-        if velocity < -0.05:  # đối tượng đang tiến lại gần
-            ttc = distance / (-velocity)
+        slots, is_new = self._lookup_slots(track_ids)
 
-        # --- Kiểm tra điều kiện cảnh báo tức thì ---
-        immediate_alert = False
+        # Khoảng thời gian từ lần đo trước của từng track
+        if timestamp is None:
+            dt = np.full(n, self.time_per_frame)
+            timestamp = np.where(is_new, 0.0, self._last_time[slots] + dt)
+        else:
+            dt = timestamp - self._last_time[slots]
+        self._last_time[slots] = timestamp
 
-        # 1. Nếu khoảng cách < ngưỡng an toàn
-        crit_dist = CRITICAL_DISTANCES.get(class_id, 1.8)
-        if distance <= crit_dist:
-            immediate_alert = True
+        # Phép đo khoảng cách và phương sai của nó (nhiễu pixel truyền qua d = W·f / s)
+        raw_distance = self._estimate_distance(class_ids, pixel_size)
+        distance_var = np.square(raw_distance * PIXEL_NOISE / pixel_size)
+        size_var = np.full(n, PIXEL_NOISE ** 2)
+
+        # Track mới: khởi tạo trạng thái; track cũ: dự đoán qua dt rồi cập nhật
+        new_slots = slots[is_new]
+        self._distance_filter.reset(new_slots, raw_distance[is_new], distance_var[is_new])
+        self._scale_filter.reset(new_slots, pixel_size[is_new], size_var[is_new])
+        old = ~is_new
+        self._distance_filter.step(slots[old], dt[old], raw_distance[old], distance_var[old])
+        self._scale_filter.step(slots[old], dt[old], pixel_size[old], size_var[old])
+
+        state = self._distance_filter.x[slots]
+        distance = state[:, 0].copy()
+        velocity = state[:, 1].copy()
+        # Tốc độ phóng to bounding box (quy về pixel/frame ở FPS danh định)
+        avg_size_rate = self._scale_filter.x[slots, 1] * self.time_per_frame
+
+        # Ghi log-kích thước (trung bình nhân rộng × cao) vào ring buffer tau
+        head = self._head[slots]
+        self._log_scale_hist[slots, head] = 0.5 * (np.log(width) + np.log(height))
+        self._time_hist[slots, head] = timestamp
+        self._head[slots] = (head + 1) % TAU_WINDOW
+        self._count[slots] = np.minimum(self._count[slots] + 1, TAU_WINDOW)
 
+        # Tính TTC (Time to Collision) - đối tượng đang tiến lại gần
+        if self.ttc_mode == TTC_MODE_SCALE:
+            ttc = self._scale_ttc(slots)
+        else:
+            # d / v của trạng thái đã lọc: gia tốc chỉ giúp vận tốc bám kịp khi phanh/tăng tốc,
+            # đưa gia tốc (nhiễu hơn nhiều) vào công thức TTC gây cảnh báo sớm giả
+            approaching = velocity < -0.05
+            with np.errstate(divide="ignore", invalid="ignore"):
+                ttc = np.where(approaching, distance / -velocity, np.inf)
+
+        # --- Kiểm tra điều kiện cảnh báo tức thì ---
+        # 1. Nếu khoảng cách < ngưỡng an toàn
         # 2. Nếu bounding box tăng nhanh (đối tượng lao tới)
-        if avg_size_rate >= EXPANSION_RATE_THRESHOLD:
-            immediate_alert = True
+        crit_dist = _CRITICAL_DISTANCE_TABLE[_class_index(class_ids, _CRITICAL_DISTANCE_TABLE)]
+        immediate_alert = (distance <= crit_dist) | (avg_size_rate >= EXPANSION_RATE_THRESHOLD)
+        # Track mới chưa đủ lịch sử để đánh giá
+        immediate_alert &= ~is_new
 
-        # Cập nhật lịch sử
-        self.history[track_id] = {
-            "distances": distances,
-            "sizes": sizes,
-            "velocity": velocity,
-            "last_time": current_time
-        }
+        # --- Hysteresis theo từng track ---
+        active = self.check_collision_warning(ttc, self._alert[slots])
+        self._alert[slots] = active
 
-        return distance, velocity, ttc, immediate_alert
+        return distance, velocity, ttc, immediate_alert, active | immediate_alert
 
-    # --- LOGIC HYSTERESIS ---
-    def check_collision_warning(self, ttc):
+    def _scale_ttc(self, slots):
         """
-        Logic bật/tắt cảnh báo dựa trên TTC (hysteresis)
+        TTC theo tốc độ phóng to: với kích thước s ~ 1/d, d(ln s)/dt = -d'/d = 1/TTC.
+        Độ dốc của ln s theo thời gian là trung vị độ dốc của mọi cặp mẫu trong cửa sổ (Theil-Sen).
         """
-        TTC_ON_THRESHOLD = 2.0
-        TTC_OFF_THRESHOLD = 2.5
+        count = self._count[slots]
+        times = self._time_hist[slots]
+        log_scale = self._log_scale_hist[slots]
+        # Tuổi của từng vị trí trong ring buffer (0 = mới nhất); chỉ dùng vị trí đã ghi
+        age = (self._head[slots, None] - 1 - np.arange(TAU_WINDOW)) % TAU_WINDOW
+        valid = age < count[:, None]
 
-        if not self.alert_active and ttc <= TTC_ON_THRESHOLD:
-            self.alert_active = True
-        elif self.alert_active and ttc >= TTC_OFF_THRESHOLD:
-            self.alert_active = False
+        i, j = _TAU_PAIRS
+        dt = times[:, j] - times[:, i]
+        pair_ok = valid[:, i] & valid[:, j] & (dt != 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            slopes = np.where(pair_ok, (log_scale[:, j] - log_scale[:, i]) / dt, np.nan)
 
-        return self.alert_active
+        rate = np.zeros(len(slots))
+        rows = (count >= TAU_MIN_SAMPLES) & pair_ok.any(axis=1)
+        if rows.any():
+            rate[rows] = np.nanmedian(slopes[rows], axis=1)
+        with np.errstate(divide="ignore"):
+            return np.where(rate > TAU_MIN_RATE, 1.0 / rate, np.inf)
+
+    def estimate_std(self, track_ids):
+        """
+        Độ bất định của ước lượng cho các track_id đang có: (distance_std, velocity_std, ttc_std).
+        ttc_std xấp xỉ bậc nhất từ sai số khoảng cách và vận tốc của bộ lọc Kalman (kể cả ở
+        TTC_MODE_SCALE); vô cùng nếu không tiến lại gần.
+        """
+        track_ids = np.asarray(track_ids, dtype=np.int64).ravel()
+        match = track_ids[:, None] == self._slot_ids[None, :]
+        slots = match.argmax(axis=1)
+        # track_id < 0 (chưa được track) trùng giá trị đánh dấu slot trống, không phải track nào
+        known = match.any(axis=1) & (track_ids >= 0)
+        state = self._distance_filter.x[slots]
+        std = self._distance_filter.std(slots)
+        d, v = state[:, 0], state[:, 1]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ttc_std = np.hypot(std[:, 0] / v, d * std[:, 1] / (v * v))
+        ttc_std = np.where(known & (v < -0.05), ttc_std, np.inf)
+        return (np.where(known, std[:, 0], np.inf), np.where(known, std[:, 1], np.inf), ttc_std)
+
+    def calculate_ttc(self, track_id, box, class_id=None, timestamp=None):
+        """
+        Tính toán khoảng cách, vận tốc, TTC, và cờ cảnh báo tức thì cho một track.
+        (Bọc calculate_ttc_batch cho trường hợp một đối tượng.)
+        """
+        x1, y1, x2, y2 = box
+        row = [x1, y1, x2, y2, track_id, 1.0, -1 if class_id is None else class_id]
+        distance, velocity, ttc, immediate_alert, _ = self.calculate_ttc_batch([row], timestamp)
+        return float(distance[0]), float(velocity[0]), float(ttc[0]), bool(immediate_alert[0])
+
+    # --- LOGIC HYSTERESIS ---
+    def check_collision_warning(self, ttc, active=False):
+        """
+        Logic bật/tắt cảnh báo dựa trên TTC (hysteresis).
+        ttc, active: số hoặc mảng - TTC hiện tại và trạng thái cảnh báo trước đó.
+        Trả về trạng thái mới: bật khi TTC <= ttc_on, giữ cho đến khi TTC >= ttc_off
+        (bool nếu ttc và active là số, mảng bool nếu là mảng).
+        """
+        alert = np.where(active, ttc < self.ttc_off, ttc <= self.ttc_on)
+        return bool(alert) if alert.ndim == 0 else alert
 
     # --- DỌN DẸP BỘ NHỚ ---
+    def reset(self):
+        """Quên mọi track (vd: sau khi đổi mô hình, track_id của tracker mới không liên quan tới track cũ)."""
+        self._release(self._slot_ids >= 0)
+
     def cleanup_history(self, current_track_ids):
-        """Xóa track_id không còn xuất hiện để tránh tràn bộ nhớ."""
-        current_ids = set(current_track_ids)
-        self.history = {tid: h for tid, h in self.history.items() if tid in current_ids}
-        self.smooth_dist = {tid: d for tid, d in self.smooth_dist.items() if tid in current_ids}
+        """
+        Giải phóng slot của track_id không còn xuất hiện (quá track_grace frame liên tiếp)
+        để tránh tràn bộ nhớ.
+        """
+        current_ids = np.asarray(list(current_track_ids), dtype=np.int64)
+        occupied = self._slot_ids >= 0
+        present = np.isin(self._slot_ids, current_ids)
+        self._missed[present] = 0
+        self._missed[occupied & ~present] += 1
+        self._release(occupied & (self._missed > self.track_grace))
+
+    def _release(self, stale):
+        self._slot_ids[stale] = -1
+        self._alert[stale] = False
+        self._count[stale] = 0
+        self._head[stale] = 0
@@ -1,22 +1,131 @@
-from ultralytics import YOLO
 import cv2
 import numpy as np
+import os
+import time
+
+from .calculator import DETECTION_DTYPE, BOX_TRACK_ID_COL, as_box_array
+from .roi import MASK_FILL
+from .tiling import merge_detections
+
+# === CÁC BACKEND SUY LUẬN ===
+BACKEND_TORCH = "torch"           # PyTorch (mặc định)
+BACKEND_ONNX = "onnx"             # ONNX Runtime (CPU)
+BACKEND_OPENVINO = "openvino"     # OpenVINO IR (CPU Intel)
+BACKENDS = (BACKEND_TORCH, BACKEND_ONNX, BACKEND_OPENVINO)
+
+# Backend chấp nhận kích thước ảnh vào thay đổi (OpenVINO IR được export với kích thước cố định)
+DYNAMIC_BACKENDS = (BACKEND_TORCH, BACKEND_ONNX)
+
+# Cấu hình tracker mặc định (giống model.track() của ultralytics)
+DEFAULT_TRACKER = "botsort.yaml"
+
+# Kích thước ảnh vào phải là bội số của stride lớn nhất của YOLOv8
+MODEL_STRIDE = 32
+
+# Tham số export của ultralytics cho từng backend
+EXPORT_ARGS = {
+    BACKEND_ONNX: {"format": "onnx", "dynamic": True},
+    BACKEND_OPENVINO: {"format": "openvino"},
+}
+
+
+def _yolo():
+    """
+    Import ultralytics (kéo theo torch, mất vài giây) chỉ khi thực sự tải mô hình,
+    để giao diện/server khởi động ngay và việc tải có thể chạy trên luồng nền.
+    """
+    from ultralytics import YOLO
+    return YOLO
+
+
+def exported_model_path(model_path, backend):
+    """
+    Đường dẫn model đã export của một file .pt (theo quy ước đặt tên của ultralytics):
+    - onnx:     yolov8n.pt -> yolov8n.onnx
+    - openvino: yolov8n.pt -> yolov8n_openvino_model/
+    """
+    stem, _ = os.path.splitext(model_path)
+    if backend == BACKEND_ONNX:
+        return stem + ".onnx"
+    if backend == BACKEND_OPENVINO:
+        return stem + "_openvino_model"
+    return model_path
+
+
+def resolve_model_path(model_path, backend=BACKEND_TORCH, imgsz=640):
+    """
+    Trả về đường dẫn model phù hợp với backend.
+    Lần đầu yêu cầu backend onnx/openvino cho một file .pt, model sẽ được export
+    và lưu cạnh file .pt; các lần sau dùng lại bản đã export.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend không hợp lệ: '{backend}'. Chọn một trong {BACKENDS}")
+    if backend == BACKEND_TORCH or not model_path.endswith(".pt"):
+        return model_path
+
+    target = exported_model_path(model_path, backend)
+    if os.path.exists(target):
+        return target
+
+    print(f"Export '{model_path}' sang {backend} (chỉ thực hiện lần đầu)...")
+    exported = _yolo()(model_path).export(imgsz=imgsz, **EXPORT_ARGS[backend])
+    return str(exported)
+
+
+def create_tracker(tracker_cfg=DEFAULT_TRACKER):
+    """Tạo một tracker của ultralytics (BoT-SORT/ByteTrack) từ file cấu hình yaml."""
+    from ultralytics.trackers.track import TRACKER_MAP
+    from ultralytics.utils import YAML, IterableSimpleNamespace
+    from ultralytics.utils.checks import check_yaml
+
+    cfg = IterableSimpleNamespace(**YAML.load(check_yaml(tracker_cfg)))
+    return TRACKER_MAP[cfg.tracker_type](args=cfg)
+
 
 class ObjectDetector:
-    def __init__(self, model_path='yolov8n.pt', conf_threshold=0.5):
+    def __init__(self, model_path='yolov8n.pt', conf_threshold=0.5, backend=BACKEND_TORCH, imgsz=640,
+                 roi=None, tiler=None):
         """
         Khởi tạo và tải mô hình YOLOv8.
+        backend: 'torch', 'onnx' (onnxruntime) hoặc 'openvino'.
+        roi: RegionOfInterest - nếu có, chỉ suy luận trên vùng này (xem detect_and_track).
+        tiler: HorizonTiler - nếu có, chạy thêm dải chân trời ở độ phân giải cao (đối tượng ở xa).
         """
         try:
-            self.model = YOLO(model_path)
+            resolved_path = resolve_model_path(model_path, backend, imgsz)
+            self.model = _yolo()(resolved_path, task="detect")
+            self.backend = backend
+            self.imgsz = imgsz
             self.conf_threshold = conf_threshold
+            self.roi = roi
+            self.tiler = tiler
+            self.roi_fallbacks = 0   # số frame phải suy luận lại toàn ảnh vì khung bị ROI cắt cụt
+            self.trackers = {}       # tracker riêng theo nguồn (ROI / detect_batch), khoá = stream_id
             # 5 lớp chính cần nhận diện theo tài liệu
-            self.target_classes = ['car', 'motorcycle', 'bus', 'truck', 'person']
-            print(f"Tải mô hình '{model_path}' thành công.")
+            self.set_target_classes(['car', 'motorcycle', 'bus', 'truck', 'person'])
+            print(f"Tải mô hình '{resolved_path}' (backend: {backend}) thành công.")
         except Exception as e:
             print(f"Lỗi khi tải mô hình '{model_path}': {e}")
             raise
 
+    def warmup(self, frame_shape=(720, 1280, 3)):
+        """
+        Chạy một lần suy luận trên ảnh rỗng (cùng kích thước video dự kiến) để khởi tạo
+        backend (cấp phát bộ nhớ, tối ưu đồ thị ONNX/OpenVINO, ...) và import tracker,
+        nên frame thật đầu tiên không phải chịu độ trễ này. Không thay đổi trạng thái tracker.
+        Trả về thời gian warmup (giây).
+        """
+        start = time.perf_counter()
+        frames = [np.full(frame_shape, MASK_FILL, dtype=np.uint8)]
+        batch = self._predict_frames(frames)
+        if self.tiler is not None:
+            # Chạy cả các ô (imgsz riêng) nhưng không tính vào nhịp chạy ô của nguồn nào
+            self._add_tiles(batch, frames)
+        create_tracker()
+        elapsed = time.perf_counter() - start
+        print(f"Warmup mô hình xong ({elapsed:.2f}s).")
+        return elapsed
+
     def preprocess_frame(self, frame):
         """
         Tiền xử lý khung hình để phù hợp với YOLOv8:
@@ -31,34 +140,213 @@ class ObjectDetector:
         Nhận diện đối tượng trong một khung hình.
         """
         rgb_frame = self.preprocess_frame(frame)
-        results = self.model.predict(rgb_frame, conf=self.conf_threshold, verbose=False)
+        results = self.model.predict(rgb_frame, conf=self.conf_threshold, imgsz=self.imgsz, verbose=False)
         return results
     
     def detect_and_track(self, frame):
         """
         Hàm tương thích với desktop_app.py.
         Dùng YOLOv8 để nhận diện và theo dõi đối tượng (track).
+        Khi có ROI hoặc tiler, khung được đưa về toạ độ frame (và ghép lại) trước khi qua tracker,
+        nên track_id không phụ thuộc vào việc có cắt hay không.
         """
+        if self.roi is not None or self.tiler is not None:
+            return self._track(self._predict_batch([frame])[0], frame)
         rgb_frame = self.preprocess_frame(frame)
-        results = self.model.track(rgb_frame, persist=True, conf=self.conf_threshold, verbose=False)
+        results = self.model.track(rgb_frame, persist=True, conf=self.conf_threshold,
+                                   imgsz=self.imgsz, verbose=False)
         return results
 
-    
+    def detect_batch(self, frames, stream_ids=None, track=True):
+        """
+        Nhận diện (và theo dõi) một lô frame, có thể đến từ nhiều nguồn, trong một lần forward.
+        - stream_ids: nguồn của từng frame (mặc định: cùng một nguồn). Mỗi nguồn có tracker
+          riêng; các frame cùng nguồn phải theo đúng thứ tự thời gian trong lô.
+        Trả về danh sách kết quả theo từng frame, cùng định dạng với detect_and_track().
+        """
+        if stream_ids is None:
+            stream_ids = [None] * len(frames)
+        batch = self._predict_batch(frames, stream_ids)
+        if not track:
+            return batch
+        return [self._track(results, frame, stream_id)
+                for results, frame, stream_id in zip(batch, frames, stream_ids)]
+
+    def reset_tracker(self, stream_id=None):
+        """Xoá trạng thái tracker của một nguồn (vd: khi nguồn được mở lại)."""
+        self.trackers.pop(stream_id, None)
+
+    def set_roi(self, roi):
+        """Đổi (hoặc bỏ với None) vùng quan tâm; tracker được tạo lại."""
+        self.roi = roi
+        self.trackers.clear()
+
+    def set_tiler(self, tiler):
+        """Bật (HorizonTiler) hoặc tắt (None) suy luận theo ô; tracker được tạo lại."""
+        self.tiler = tiler
+        self.trackers.clear()
+
+    @property
+    def track_grace(self):
+        """
+        Số frame một track có thể vắng mặt mà vẫn là cùng một đối tượng: đối tượng ở xa
+        chỉ thấy được qua các ô chỉ xuất hiện mỗi tiler.interval frame.
+        Truyền cho FrameAnalyzer để trạng thái TTC của chúng không bị xoá giữa các lần chạy ô.
+        """
+        return self.tiler.track_grace if self.tiler is not None else 0
+
+    def _roi_imgsz(self, crop_shape, frame_shape):
+        """Thu nhỏ imgsz theo tỉ lệ vùng cắt để giữ nguyên độ phân giải (pixel/mét) như khi chạy cả frame."""
+        if self.backend not in DYNAMIC_BACKENDS:
+            return self.imgsz
+        ratio = max(crop_shape[:2]) / max(frame_shape[:2])
+        return max(MODEL_STRIDE, int(np.ceil(self.imgsz * ratio / MODEL_STRIDE)) * MODEL_STRIDE)
+
+    def _tile_imgsz(self, tile_shape, frame_shape):
+        """imgsz của ô để đạt độ phân giải gấp tiler.scale lần so với chạy cả frame."""
+        if self.backend not in DYNAMIC_BACKENDS:
+            return self.imgsz
+        ratio = max(tile_shape[:2]) / max(frame_shape[:2]) * self.tiler.scale
+        return max(MODEL_STRIDE, int(np.ceil(self.imgsz * ratio / MODEL_STRIDE)) * MODEL_STRIDE)
+
+    def _predict(self, images, imgsz):
+        """Một lần forward cho cả lô (backend có kích thước động), ngược lại chạy từng ảnh."""
+        images = [self.preprocess_frame(image) for image in images]
+        if self.backend in DYNAMIC_BACKENDS:
+            return self.model.predict(images, conf=self.conf_threshold, imgsz=imgsz, verbose=False)
+        return [self.model.predict(image, conf=self.conf_threshold, imgsz=imgsz, verbose=False)[0]
+                for image in images]
+
+    def _predict_batch(self, frames, stream_ids=None):
+        """
+        Nhận diện (chưa track) một lô frame; khung luôn ở toạ độ frame gốc.
+        Nhịp chạy các ô được tính riêng cho từng nguồn (stream_ids, mặc định: cùng một nguồn),
+        nên mỗi frame trong lô được quyết định riêng có chạy thêm các ô hay không.
+        """
+        if not frames:
+            return []
+        batch = self._predict_frames(frames)
+        if self.tiler is not None:
+            if stream_ids is None:
+                stream_ids = [None] * len(frames)
+            due = [i for i, stream_id in enumerate(stream_ids) if self.tiler.due(stream_id)]
+            if due:
+                tiled = self._add_tiles([batch[i] for i in due], [frames[i] for i in due])
+                for i, results in zip(due, tiled):
+                    batch[i] = results
+        return batch
+
+    def _predict_frames(self, frames):
+        if self.roi is None:
+            return [[result] for result in self._predict(frames, self.imgsz)]
+
+        crops = [self.roi.crop(frame) for frame in frames]
+        imgsz = self._roi_imgsz(crops[0][0].shape, frames[0].shape)
+        batch = []
+        fallback = []
+        for i, (result, (_, (x0, y0)), frame) in enumerate(zip(self._predict([c for c, _ in crops], imgsz),
+                                                               crops, frames)):
+            boxes_data = result.boxes.data.cpu().numpy().copy()
+            boxes_data[:, [0, 2]] += x0
+            boxes_data[:, [1, 3]] += y0
+            batch.append(self.rebuild_results([result], frame, boxes_data))
+
+            # Khung chạm cạnh vùng cắt có tâm trong ROI có thể là xe ở gần bị cắt mất một phần
+            # (bề rộng sai -> khoảng cách sai). Khi đó chạy lại trên cả frame cho frame này.
+            centers = (boxes_data[:, 0:2] + boxes_data[:, 2:4]) / 2
+            cut = self.roi.truncated(boxes_data[:, :4], frame.shape)
+            if cut.any() and self.roi.contains(centers[cut], frame.shape).any():
+                fallback.append(i)
+
+        if fallback:
+            self.roi_fallbacks += len(fallback)
+            for i, result in zip(fallback, self._predict([frames[i] for i in fallback], self.imgsz)):
+                batch[i] = [result]
+        return batch
+
+    def _add_tiles(self, batch, frames):
+        """Chạy các ô dải chân trời của mọi frame trong một lần forward, rồi ghép vào kết quả bằng NMS."""
+        tiles = [self.tiler.crop(frame) for frame in frames]
+        imgsz = self._tile_imgsz(tiles[0][0].shape, frames[0].shape)
+        results = iter(self._predict([tile for frame_tiles in tiles for tile in frame_tiles], imgsz))
+        merged = []
+        for results_i, frame, frame_tiles in zip(batch, frames, tiles):
+            tile_boxes = [next(results).boxes.data.cpu().numpy() for _ in frame_tiles]
+            boxes_data = np.concatenate([results_i[0].boxes.data.cpu().numpy(),
+                                         self.tiler.to_frame(tile_boxes, frame.shape)])
+            merged.append(self.rebuild_results(results_i, frame, merge_detections(boxes_data)))
+        return merged
+
+    def _track(self, results, frame, stream_id=None):
+        """Cập nhật tracker của nguồn `stream_id` với các khung (toạ độ frame) và gán track_id."""
+        import torch
+
+        tracker = self.trackers.get(stream_id)
+        if tracker is None:
+            tracker = self.trackers[stream_id] = create_tracker()
+        result = results[0]
+        tracks = tracker.update(result.boxes.cpu().numpy(), frame)
+        if len(tracks) == 0:
+            return [result[:0]]
+        # tracks: x1, y1, x2, y2, track_id, conf, class_id, chỉ số khung gốc
+        result = result[tracks[:, -1].astype(int)]
+        result.update(boxes=torch.as_tensor(tracks[:, :-1], dtype=torch.float32))
+        return [result]
+
+    def rebuild_results(self, results, frame, boxes_data):
+        """
+        Tạo kết quả mới cùng định dạng với detect_and_track() cho `frame`,
+        với boxes thay bằng `boxes_data` (N×7: x1, y1, x2, y2, track_id, conf, class_id
+        hoặc N×6 chưa có track_id).
+        Dùng khi khung được suy ra mà không chạy mô hình (nội suy, ghép vùng cắt...).
+        """
+        import torch
+
+        result = results[0].new()
+        # Giữ cùng định dạng ảnh gốc với kết quả của mô hình
+        result.orig_img = self.preprocess_frame(frame)
+        result.orig_shape = frame.shape[:2]
+        boxes_data = np.asarray(boxes_data, dtype=np.float32)
+        if boxes_data.ndim != 2:
+            boxes_data = boxes_data.reshape(-1, 7)
+        result.update(boxes=torch.as_tensor(boxes_data))
+        return [result]
+
+    def set_target_classes(self, class_names):
+        """Đổi các lớp mục tiêu của filter_results; bảng tra class_id -> bool được tính lại."""
+        self.target_classes = list(class_names)
+        names = self.model.names
+        lut = np.zeros(max(names) + 1, dtype=bool)
+        for class_id, name in names.items():
+            lut[class_id] = name in self.target_classes
+        self._target_lut = lut
 
     def filter_results(self, results):
         """
         Giữ lại các đối tượng thuộc lớp mục tiêu và có độ tin cậy đủ cao.
+        Chuyển boxes.data về CPU một lần rồi lọc bằng mặt nạ numpy qua bảng tra lớp.
+        Trả về lô bản ghi DETECTION_DTYPE (bbox, track_id, conf, class_id); tên lớp là
+        self.model.names[class_id]. as_box_array() cho mảng N×7 dùng được ngay với TTCCalculator.
         """
-        detections = []
-        for box in results[0].boxes:
-            cls_name = self.model.names[int(box.cls)]
-            conf = float(box.conf)
-            if cls_name in self.target_classes and conf >= self.conf_threshold:
-                detections.append({
-                    "class": cls_name,
-                    "confidence": conf,
-                    "bbox": box.xyxy[0].cpu().numpy()  # [x1, y1, x2, y2]
-                })
+        boxes = results[0].boxes
+        if boxes is None or len(boxes) == 0:
+            return np.zeros(0, dtype=DETECTION_DTYPE)
+        data = boxes.data.cpu().numpy()
+        class_ids = data[:, -1].astype(np.int64)
+        lut = self._target_lut
+        keep = ((class_ids < len(lut)) & lut[np.minimum(class_ids, len(lut) - 1)]
+                & (data[:, -2] >= self.conf_threshold))
+        kept = data[keep]
+
+        detections = np.empty(len(kept), dtype=DETECTION_DTYPE)
+        box_array = as_box_array(detections)
+        if data.shape[1] == 7:
+            box_array[:] = kept
+        else:
+            # Chưa track: [x1, y1, x2, y2, conf, class_id]
+            box_array[:, :4] = kept[:, :4]
+            box_array[:, BOX_TRACK_ID_COL] = -1
+            box_array[:, BOX_TRACK_ID_COL + 1:] = kept[:, 4:]
         return detections
 
     def draw_results(self, frame, results):
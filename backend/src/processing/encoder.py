@@ -0,0 +1,128 @@
+import time
+from collections import deque
+
+import cv2
+
+# libjpeg-turbo qua PyTurboJPEG (tuỳ chọn): nhanh hơn cv2.imencode khoảng 1.5-2 lần
+try:
+    from turbojpeg import TurboJPEG
+except ImportError:
+    TurboJPEG = None
+
+# === CHẤT LƯỢNG / ĐỘ PHÂN GIẢI ===
+DEFAULT_QUALITY = 80
+MIN_QUALITY = 40
+MAX_QUALITY = 90
+QUALITY_STEP = 5
+# Tỉ lệ thu nhỏ thấp nhất mà bộ điều khiển bitrate được phép dùng (so với tỉ lệ client yêu cầu)
+MIN_RESOLUTION = 0.25
+RESOLUTION_STEP = 0.85
+
+# === ĐIỀU KHIỂN BITRATE ===
+# Số frame gần nhất dùng để đo bitrate; điều chỉnh sau mỗi cửa sổ, nên mỗi lần đo
+# chỉ gồm các frame đã mã hoá với thiết lập hiện tại
+BITRATE_WINDOW = 15
+# Giảm khi vượt mục tiêu quá 10%, tăng khi dưới 70% mục tiêu
+# (dải rộng hơn một bước độ phân giải ~1.38× để không dao động qua lại)
+BITRATE_HIGH = 1.1
+BITRATE_LOW = 0.7
+
+
+class JpegEncoder:
+    """
+    Mã hoá ảnh BGR thành JPEG bằng libjpeg-turbo (nếu có PyTurboJPEG) hoặc cv2.imencode.
+    use_turbo: None = tự chọn, True = bắt buộc TurboJPEG, False = luôn dùng OpenCV.
+    Không giữ trạng thái, an toàn khi gọi từ nhiều luồng.
+    """
+
+    def __init__(self, use_turbo=None):
+        self._turbo = None
+        if use_turbo or (use_turbo is None and TurboJPEG is not None):
+            if TurboJPEG is None:
+                raise ImportError("Chưa cài PyTurboJPEG. Hãy chạy: pip install PyTurboJPEG")
+            try:
+                self._turbo = TurboJPEG()
+            except (OSError, RuntimeError) as e:
+                # Có gói Python nhưng thiếu thư viện libturbojpeg của hệ thống
+                if use_turbo:
+                    raise
+                print(f"[CẢNH BÁO] Không tải được libjpeg-turbo ({e}), dùng OpenCV.")
+
+    @property
+    def name(self):
+        return "turbojpeg" if self._turbo is not None else "opencv"
+
+    def encode(self, image, quality=DEFAULT_QUALITY):
+        """Trả về buffer JPEG (bytes hoặc mảng uint8 của OpenCV - dùng được với memoryview), None nếu lỗi."""
+        if self._turbo is not None:
+            return self._turbo.encode(image, quality=int(quality))
+        flag, encoded = cv2.imencode(".jpg", image, (cv2.IMWRITE_JPEG_QUALITY, int(quality)))
+        return encoded if flag else None
+
+
+class AdaptiveJpegStream:
+    """
+    Một luồng JPEG có tỉ lệ thu nhỏ cố định (theo yêu cầu của client) và bộ điều khiển bitrate:
+    - Vượt target_kbps: giảm chất lượng trước, tới MIN_QUALITY thì giảm độ phân giải
+    - Dưới mục tiêu: tăng lại độ phân giải trước (tới tỉ lệ client yêu cầu), rồi tới chất lượng
+    target_kbps=None: giữ nguyên chất lượng và độ phân giải.
+    Buffer thu nhỏ được cấp phát một lần và dùng lại cho mọi frame cùng kích thước.
+    """
+
+    def __init__(self, encoder, scale=1.0, target_kbps=None, quality=DEFAULT_QUALITY):
+        self.encoder = encoder
+        self.scale = scale
+        self.target_kbps = target_kbps
+        self.quality = quality
+        self.max_quality = max(quality, MAX_QUALITY) if target_kbps else quality
+        self.resolution = 1.0        # hệ số do bộ điều khiển bitrate áp thêm lên scale
+        self._history = deque(maxlen=BITRATE_WINDOW)   # (thời điểm, số byte)
+        self._since_adjust = 0
+        self._resized = None
+
+    @property
+    def bitrate_kbps(self):
+        """Bitrate đo được trên BITRATE_WINDOW frame gần nhất (kbit/s)."""
+        if len(self._history) < 2:
+            return 0.0
+        elapsed = self._history[-1][0] - self._history[0][0]
+        if elapsed <= 0:
+            return 0.0
+        sent = sum(size for _, size in list(self._history)[1:])
+        return sent * 8 / 1000.0 / elapsed
+
+    def _resize(self, frame):
+        factor = self.scale * self.resolution
+        if factor >= 0.999:
+            return frame
+        h, w = frame.shape[:2]
+        size = (max(1, int(w * factor)), max(1, int(h * factor)))
+        if self._resized is None or self._resized.shape[1::-1] != size:
+            self._resized = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        else:
+            cv2.resize(frame, size, dst=self._resized, interpolation=cv2.INTER_AREA)
+        return self._resized
+
+    def encode(self, frame):
+        data = self.encoder.encode(self._resize(frame), self.quality)
+        if data is not None and self.target_kbps:
+            self._history.append((time.perf_counter(), len(data)))
+            self._adapt()
+        return data
+
+    def _adapt(self):
+        self._since_adjust += 1
+        if self._since_adjust < BITRATE_WINDOW:
+            return
+        self._since_adjust = 0
+        bitrate = self.bitrate_kbps
+        if bitrate > self.target_kbps * BITRATE_HIGH:
+            if self.quality > MIN_QUALITY:
+                self.quality = max(MIN_QUALITY, self.quality - QUALITY_STEP)
+            elif self.resolution > MIN_RESOLUTION:
+                self.resolution = max(MIN_RESOLUTION, self.resolution * RESOLUTION_STEP)
+        elif bitrate < self.target_kbps * BITRATE_LOW:
+            if self.resolution < 1.0:
+                self.resolution = min(1.0, self.resolution / RESOLUTION_STEP)
+            elif self.quality < self.max_quality:
+                self.quality = min(self.max_quality, self.quality + QUALITY_STEP)
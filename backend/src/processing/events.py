@@ -0,0 +1,116 @@
+import json
+import struct
+
+import numpy as np
+
+from .broker import StreamPublisher
+from .calculator import BOX_CLASS_COL, BOX_TRACK_ID_COL
+
+# === ĐỊNH DẠNG THÔNG ĐIỆP ===
+FORMAT_JSON = "json"
+FORMAT_BINARY = "binary"
+MESSAGE_FORMATS = (FORMAT_JSON, FORMAT_BINARY)
+
+# Phiên bản của bố cục nhị phân (byte đầu tiên của mỗi thông điệp)
+BINARY_VERSION = 1
+
+# Header nhị phân (little-endian, 16 byte):
+# version (u8), risk_level (u8), số đối tượng (u16), số thứ tự frame (u32), timestamp giây (f64)
+BINARY_HEADER = struct.Struct("<BBHId")
+
+# Mỗi đối tượng (36 byte), nối tiếp ngay sau header; ttc = +inf khi không tiến lại gần
+BINARY_OBJECT_DTYPE = np.dtype([
+    ("track_id", "<i4"),
+    ("class_id", "<u2"),
+    ("alert", "u1"),
+    ("reserved", "u1"),
+    ("box", "<f4", (4,)),      # x1, y1, x2, y2 (pixel)
+    ("conf", "<f4"),
+    ("distance", "<f4"),       # m
+    ("ttc", "<f4"),            # giây
+])
+
+
+def _finite_or_none(value, digits):
+    return round(float(value), digits) if np.isfinite(value) else None
+
+
+class DetectionMessage:
+    """
+    Kết quả của một frame gửi cho client WebSocket: các đối tượng được tính TTC
+    (phương tiện trong ROI) kèm khoảng cách, TTC, cờ cảnh báo và mức rủi ro của frame.
+    Mỗi định dạng chỉ được mã hoá một lần, dùng chung cho mọi client.
+    """
+
+    def __init__(self, stream_id, frame_index, timestamp, analysis):
+        self.stream_id = stream_id
+        self.frame_index = frame_index
+        self.timestamp = timestamp
+        self.analysis = analysis
+        self._json = None
+        self._binary = None
+
+    def encode(self, message_format):
+        return self.binary() if message_format == FORMAT_BINARY else self.json()
+
+    def json(self):
+        if self._json is None:
+            a = self.analysis
+            boxes = a["boxes"]
+            objects = [
+                {
+                    "id": int(boxes[i, BOX_TRACK_ID_COL]),
+                    "cls": int(boxes[i, BOX_CLASS_COL]),
+                    "box": [round(float(v), 1) for v in boxes[i, :4]],
+                    "conf": round(float(boxes[i, 5]), 3),
+                    "dist": _finite_or_none(a["distances"][i], 2),
+                    "ttc": _finite_or_none(a["ttcs"][i], 2),
+                    "alert": bool(a["alerts"][i]),
+                }
+                for i in range(len(boxes))
+            ]
+            self._json = json.dumps({
+                "stream": self.stream_id,
+                "frame": self.frame_index,
+                "time": self.timestamp,
+                "risk": a["risk_level"],
+                "min_ttc": _finite_or_none(a["min_ttc"], 2),
+                "objects": objects,
+            }, separators=(",", ":"))
+        return self._json
+
+    def binary(self):
+        if self._binary is None:
+            a = self.analysis
+            boxes = a["boxes"]
+            objects = np.zeros(len(boxes), dtype=BINARY_OBJECT_DTYPE)
+            objects["track_id"] = boxes[:, BOX_TRACK_ID_COL]
+            objects["class_id"] = boxes[:, BOX_CLASS_COL]
+            objects["alert"] = a["alerts"]
+            objects["box"] = boxes[:, :4]
+            objects["conf"] = boxes[:, 5]
+            objects["distance"] = a["distances"]
+            objects["ttc"] = a["ttcs"]
+            header = BINARY_HEADER.pack(BINARY_VERSION, a["risk_level"], len(objects),
+                                        self.frame_index & 0xFFFFFFFF,
+                                        self.timestamp if self.timestamp is not None else float("nan"))
+            self._binary = header + objects.tobytes()
+        return self._binary
+
+
+def decode_binary(data):
+    """Giải mã một thông điệp nhị phân: (header dict, mảng có cấu trúc BINARY_OBJECT_DTYPE)."""
+    version, risk, count, frame_index, timestamp = BINARY_HEADER.unpack_from(data)
+    objects = np.frombuffer(data, dtype=BINARY_OBJECT_DTYPE, count=count, offset=BINARY_HEADER.size)
+    return {"version": version, "risk": risk, "frame": frame_index, "time": timestamp}, objects
+
+
+class DetectionPublisher(StreamPublisher):
+    """
+    Phát kết quả nhận diện/TTC của một nguồn tới các client WebSocket.
+    Không vẽ và không mã hoá JPEG, nên client chỉ cần dữ liệu không tốn chi phí video;
+    client chậm chỉ nhận thông điệp mới nhất (như MJPEG).
+    """
+
+    def _on_frame(self, stream, frame, results, analysis):
+        self.broker.publish(DetectionMessage(stream.stream_id, stream.frames, stream.timestamp, analysis))
@@ -0,0 +1,273 @@
+import multiprocessing as mp
+import queue
+import threading
+import time
+import weakref
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from .metrics import STAGE_DECODE
+from .pipeline import VideoSource
+
+# Số slot mặc định của vòng frame. Slot chỉ được ghi lại khi mọi tham chiếu tới frame cũ
+# đã bị huỷ, nên cần đủ cho mọi frame còn "sống" ở phía đọc (hàng đợi, giai đoạn đang chạy,
+# kết quả/ảnh đang mã hoá giữ lại frame gốc) cộng vài frame giải mã trước.
+DEFAULT_SLOTS = 10
+
+# Trạng thái của slot (ghi trong bộ nhớ chung)
+SLOT_FREE = 0        # decoder được ghi
+SLOT_BUSY = 1        # đang được ghi hoặc phía đọc đang dùng
+
+# Metadata của mỗi slot, nằm ở đầu vùng nhớ chung, trước dữ liệu ảnh
+SLOT_META_DTYPE = np.dtype([
+    ("seq", "<i8"),            # số thứ tự frame đang nằm trong slot
+    ("timestamp", "<f8"),      # thời điểm của frame (giây, như VideoSource.timestamp)
+    ("decode_time", "<f8"),    # thời gian giải mã (giây)
+    ("state", "<i8"),
+])
+_ALIGN = 64
+
+# Thông điệp từ tiến trình decoder (chỉ gửi chỉ số, không gửi ảnh)
+MSG_OPEN = "open"      # (MSG_OPEN, tên vùng nhớ, shape, fps)
+MSG_FRAME = "frame"    # (MSG_FRAME, slot, seq)
+MSG_END = "end"        # (MSG_END,) hết video
+MSG_ERROR = "error"    # (MSG_ERROR, thông báo)
+
+# Thời gian chờ tiến trình decoder mở nguồn (giây)
+OPEN_TIMEOUT = 30.0
+
+
+class SharedFrameRing:
+    """
+    Bố cục vòng frame trong multiprocessing.shared_memory:
+    [metadata của `slots` slot][`slots` ảnh uint8 kích thước `shape`].
+    Tiến trình decoder tạo (create) và sở hữu vùng nhớ; tiến trình đọc chỉ gắn vào (attach).
+    """
+
+    def __init__(self, shm, slots, shape):
+        self.shm = shm
+        self.slots = slots
+        self.shape = tuple(shape)
+        meta_size = -(-slots * SLOT_META_DTYPE.itemsize // _ALIGN) * _ALIGN
+        self.meta = np.ndarray((slots,), dtype=SLOT_META_DTYPE, buffer=shm.buf)
+        self.frames = np.ndarray((slots,) + self.shape, dtype=np.uint8, buffer=shm.buf,
+                                 offset=meta_size)
+
+    @staticmethod
+    def nbytes(slots, shape):
+        meta_size = -(-slots * SLOT_META_DTYPE.itemsize // _ALIGN) * _ALIGN
+        return meta_size + slots * int(np.prod(shape))
+
+    @classmethod
+    def create(cls, slots, shape):
+        shm = shared_memory.SharedMemory(create=True, size=cls.nbytes(slots, shape))
+        ring = cls(shm, slots, shape)
+        ring.meta["seq"] = -1
+        ring.meta["state"] = SLOT_FREE
+        return ring
+
+    @classmethod
+    def attach(cls, name, slots, shape):
+        # Tiến trình con (spawn) dùng chung resource_tracker với tiến trình cha, nên vùng nhớ
+        # chỉ được đăng ký một lần và decoder tự unlink khi kết thúc
+        return cls(shared_memory.SharedMemory(name=name), slots, shape)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def close(self):
+        """Bỏ ánh xạ vùng nhớ. Chỉ gọi khi không còn frame nào trỏ vào vùng nhớ này."""
+        self.meta = None
+        self.frames = None
+        self.shm.close()
+
+
+class _FrameLease:
+    """
+    Chủ sở hữu (base) của mảng frame trả về cho phía đọc. Mọi view/crop của frame đều giữ
+    đối tượng này, nên slot chỉ được trả cho decoder khi không còn ai dùng tới frame.
+    """
+
+    def __init__(self, view):
+        self.__array_interface__ = view.__array_interface__
+        self._view = view
+
+
+def _decoder_main(source_path, loop, realtime, slots, messages, free_slots, stop_event, reset_clock):
+    """Tiến trình decoder: giải mã bằng VideoSource và ghi frame vào vòng frame dùng chung."""
+    cap = cv2.VideoCapture(source_path)
+    if not cap.isOpened():
+        messages.put((MSG_ERROR, f"Không thể mở nguồn video: {source_path}"))
+        return
+    source = VideoSource(cap, loop=loop, realtime=realtime)
+    ring = None
+    try:
+        success, frame = source.read()
+        if not success:
+            messages.put((MSG_ERROR, f"Không đọc được frame nào từ: {source_path}"))
+            return
+        ring = SharedFrameRing.create(slots, frame.shape)
+        messages.put((MSG_OPEN, ring.name, ring.shape, source.fps))
+
+        seq = 0
+        while success:
+            # Backpressure: chờ phía đọc trả slot
+            while not free_slots.acquire(timeout=0.1):
+                if stop_event.is_set():
+                    return
+            slot = int(np.flatnonzero(ring.meta["state"] == SLOT_FREE)[0])
+            ring.meta["state"][slot] = SLOT_BUSY
+            if frame.shape != ring.shape:
+                # Camera đổi độ phân giải giữa chừng: đưa về kích thước của vòng frame
+                cv2.resize(frame, ring.shape[1::-1], dst=ring.frames[slot])
+            else:
+                ring.frames[slot] = frame
+            meta = ring.meta[slot]
+            meta["seq"] = seq
+            meta["timestamp"] = source.timestamp
+            # Chỉ thời gian giải mã, không gồm thời gian VideoSource chờ để giữ nhịp realtime
+            meta["decode_time"] = source.decode_time
+            messages.put((MSG_FRAME, slot, seq))
+            seq += 1
+
+            if stop_event.is_set():
+                return
+            if reset_clock.is_set():
+                reset_clock.clear()
+                source.reset_clock()
+            success, frame = source.read()
+        messages.put((MSG_END,))
+    except Exception as e:
+        messages.put((MSG_ERROR, str(e)))
+    finally:
+        cap.release()
+        if ring is not None:
+            ring.close()
+            ring.shm.unlink()
+
+
+class SharedFrameSource:
+    """
+    Nguồn video có cùng giao diện với VideoSource (read, timestamp, fps, reset_clock, release)
+    nhưng việc giải mã chạy ở một TIẾN TRÌNH riêng, nên không tranh GIL với YOLO:
+    - Decoder ghi frame vào SharedFrameRing; chỉ chỉ số slot + số thứ tự đi qua hàng đợi,
+      ảnh không bị pickle hay sao chép
+    - read() trả về view trực tiếp vào bộ nhớ chung (ghi được, vd: vẽ lớp phủ tại chỗ)
+    - Slot được trả lại khi mọi tham chiếu tới frame (kể cả view/crop) bị huỷ; khi mọi slot
+      đang được dùng thì decoder chờ (backpressure), không ghi đè frame đang dùng
+    Các tham số loop/realtime giống VideoSource. Nguồn không mở được thì ném IOError.
+    """
+
+    def __init__(self, source_path, loop=True, realtime=True, metrics=None, slots=DEFAULT_SLOTS):
+        self.source_path = source_path
+        self.metrics = metrics
+        self.slots = max(2, int(slots))
+        self.timestamp = None
+        self.seq = -1
+        self.error = None
+        self._ring = None
+        self._lock = threading.Lock()
+        self._leased = 0            # số frame đã trả ra mà chưa bị huỷ
+        self._released = False
+        # spawn: không fork tiến trình đang có luồng suy luận / CUDA
+        ctx = mp.get_context("spawn")
+        self._messages = ctx.Queue()
+        self._free_slots = ctx.Semaphore(self.slots)
+        self._stop_event = ctx.Event()
+        self._reset_clock = ctx.Event()
+        self._process = ctx.Process(
+            target=_decoder_main, name="frame-decoder", daemon=True,
+            args=(source_path, loop, realtime, self.slots, self._messages, self._free_slots,
+                  self._stop_event, self._reset_clock))
+        self._process.start()
+        self._ended = False
+
+        message = self._next_message(OPEN_TIMEOUT)
+        if message is None or message[0] != MSG_OPEN:
+            self.release()
+            raise IOError(message[1] if message is not None and message[0] == MSG_ERROR
+                          else f"Tiến trình giải mã không phản hồi: {source_path}")
+        _, name, shape, self.fps = message
+        self._ring = SharedFrameRing.attach(name, self.slots, shape)
+
+    def _next_message(self, timeout):
+        """Chờ thông điệp kế tiếp; None nếu hết thời gian hoặc tiến trình decoder đã chết."""
+        deadline = time.perf_counter() + timeout
+        while True:
+            try:
+                return self._messages.get(timeout=0.1)
+            except queue.Empty:
+                if not self._process.is_alive() or time.perf_counter() > deadline:
+                    return None
+
+    def read(self):
+        """Đọc frame tiếp theo. Trả về (success, frame) giống cv2.VideoCapture.read()."""
+        while not self._ended:
+            message = self._next_message(1.0)
+            if message is None:
+                if self._process.is_alive():
+                    continue
+                self.error = "Tiến trình giải mã dừng đột ngột."
+                break
+            if message[0] == MSG_FRAME:
+                return True, self._lease(message[1], message[2])
+            if message[0] == MSG_ERROR:
+                self.error = message[1]
+                print(f"[LỖI] Giải mã '{self.source_path}' thất bại: {self.error}")
+            break
+        self._ended = True
+        return False, None
+
+    def _lease(self, slot, seq):
+        meta = self._ring.meta[slot]
+        if meta["seq"] != seq:
+            raise RuntimeError(f"Slot {slot} chứa frame {meta['seq']}, mong đợi frame {seq}.")
+        self.seq = seq
+        self.timestamp = float(meta["timestamp"])
+        if self.metrics is not None:
+            self.metrics.observe(STAGE_DECODE, float(meta["decode_time"]))
+        with self._lock:
+            self._leased += 1
+        # numpy không giữ vùng nhớ chung qua __array_interface__, nên SharedFrameSource tự đếm
+        # frame đang dùng và chỉ bỏ ánh xạ khi frame cuối cùng bị huỷ (xem release)
+        lease = _FrameLease(self._ring.frames[slot])
+        # Không chạy lúc thoát chương trình: vùng nhớ có thể đã bị bỏ ánh xạ
+        weakref.finalize(lease, self._free_slot, slot).atexit = False
+        return np.asarray(lease)
+
+    def _free_slot(self, slot):
+        # Có thể chạy trên bất kỳ luồng nào (nơi tham chiếu cuối cùng tới frame bị huỷ)
+        with self._lock:
+            self._leased -= 1
+            if not self._released:
+                self._ring.meta["state"][slot] = SLOT_FREE
+                self._free_slots.release()
+            elif self._leased == 0:
+                self._close_ring()
+
+    def _close_ring(self):
+        if self._ring is not None:
+            self._ring.close()
+            self._ring = None
+
+    def reset_clock(self):
+        """Gọi khi tiếp tục phát sau khi tạm dừng để không 'đuổi' các frame đã lỡ."""
+        self._reset_clock.set()
+
+    def release(self):
+        """
+        Dừng tiến trình decoder và bỏ ánh xạ vùng nhớ chung
+        (ngay, hoặc khi frame cuối cùng còn đang được dùng bị huỷ).
+        """
+        self._ended = True
+        self._stop_event.set()
+        self._process.join(2.0)
+        if self._process.is_alive():
+            self._process.terminate()
+        with self._lock:
+            self._released = True
+            if self._leased == 0:
+                self._close_ring()
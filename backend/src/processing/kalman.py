@@ -0,0 +1,84 @@
+import numpy as np
+
+
+class KinematicKalman:
+    """
+    Bộ lọc Kalman chạy theo lô cho nhiều track cùng lúc (mỗi track một slot).
+    - order=2: trạng thái [vị trí, vận tốc] (vận tốc không đổi)
+    - order=3: trạng thái [vị trí, vận tốc, gia tốc] (gia tốc không đổi)
+    Nhiễu quá trình là nhiễu trắng của đạo hàm bậc cao nhất (mật độ phổ process_noise),
+    nên bộ lọc tự thích nghi với khoảng thời gian dt khác nhau giữa các lần đo.
+    Chỉ đo trực tiếp thành phần vị trí (H = [1, 0, ...]).
+    """
+
+    def __init__(self, order, process_noise, capacity, initial_std):
+        self.order = order
+        self.process_noise = process_noise
+        # Độ lệch chuẩn ban đầu của các đạo hàm (vận tốc, gia tốc) khi track mới xuất hiện
+        self.initial_var = np.square(np.asarray(initial_std, dtype=np.float64))
+        self.x = np.zeros((capacity, order), dtype=np.float64)
+        self.P = np.zeros((capacity, order, order), dtype=np.float64)
+
+    def grow(self, capacity):
+        extra = capacity - len(self.x)
+        if extra > 0:
+            self.x = np.concatenate([self.x, np.zeros((extra, self.order))])
+            self.P = np.concatenate([self.P, np.zeros((extra, self.order, self.order))])
+
+    def reset(self, slots, z, r):
+        """Khởi tạo trạng thái của slot mới từ phép đo đầu tiên z (phương sai r)."""
+        self.x[slots] = 0.0
+        self.x[slots, 0] = z
+        self.P[slots] = 0.0
+        self.P[slots, 0, 0] = r
+        for k, var in enumerate(self.initial_var, start=1):
+            self.P[slots, k, k] = var
+
+    def _transition(self, dt):
+        """Ma trận chuyển trạng thái F và nhiễu quá trình Q cho mỗi dt (mảng độ dài n)."""
+        n = len(dt)
+        dt2 = dt * dt
+        dt3 = dt2 * dt
+        F = np.broadcast_to(np.eye(self.order), (n, self.order, self.order)).copy()
+        F[:, 0, 1] = dt
+        Q = np.empty((n, self.order, self.order))
+        if self.order == 2:
+            # Nhiễu trắng gia tốc
+            Q[:, 0, 0] = dt3 / 3
+            Q[:, 0, 1] = Q[:, 1, 0] = dt2 / 2
+            Q[:, 1, 1] = dt
+        else:
+            # Nhiễu trắng của đạo hàm gia tốc (jerk)
+            F[:, 0, 2] = dt2 / 2
+            F[:, 1, 2] = dt
+            Q[:, 0, 0] = dt3 * dt2 / 20
+            Q[:, 0, 1] = Q[:, 1, 0] = dt2 * dt2 / 8
+            Q[:, 0, 2] = Q[:, 2, 0] = dt3 / 6
+            Q[:, 1, 1] = dt3 / 3
+            Q[:, 1, 2] = Q[:, 2, 1] = dt2 / 2
+            Q[:, 2, 2] = dt
+        return F, Q * self.process_noise
+
+    def step(self, slots, dt, z, r):
+        """
+        Dự đoán qua khoảng thời gian dt rồi cập nhật với phép đo z (phương sai r).
+        slots, dt, z, r: mảng độ dài n (mỗi slot xuất hiện tối đa một lần).
+        Trả về trạng thái sau cập nhật (n × order).
+        """
+        F, Q = self._transition(np.maximum(dt, 0.0))
+        x = np.einsum("nij,nj->ni", F, self.x[slots])
+        P = F @ self.P[slots] @ F.transpose(0, 2, 1) + Q
+
+        # Cập nhật với H = [1, 0, ...]: S = P00 + r, K = P[:, :, 0] / S
+        S = P[:, 0, 0] + r
+        K = P[:, :, 0] / S[:, None]
+        x += K * (z - x[:, 0])[:, None]
+        P -= K[:, :, None] * P[:, 0, None, :]
+
+        self.x[slots] = x
+        self.P[slots] = P
+        return x
+
+    def std(self, slots):
+        """Độ lệch chuẩn của từng thành phần trạng thái (n × order)."""
+        return np.sqrt(np.maximum(np.diagonal(self.P[slots], axis1=1, axis2=2), 0.0))
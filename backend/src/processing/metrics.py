@@ -0,0 +1,130 @@
+import collections
+import contextlib
+import threading
+import time
+
+import numpy as np
+
+# === CÁC GIAI ĐOẠN ĐƯỢC ĐO ===
+STAGE_DECODE = "decode"           # đọc + giải mã frame
+STAGE_PREPROCESS = "preprocess"   # chuyển màu, letterbox, chuẩn hoá tensor
+STAGE_INFERENCE = "inference"     # forward pass của mô hình
+STAGE_TRACKING = "tracking"       # NMS + cập nhật tracker
+STAGE_PROPAGATE = "propagate"     # dịch khung bằng optical flow giữa các keyframe
+STAGE_TTC = "ttc"                 # lọc ROI + tính TTC + cảnh báo
+STAGE_OVERLAY = "overlay"         # vẽ khung, nhãn, HUD
+STAGE_ENCODE = "encode"           # mã hoá JPEG (server)
+STAGE_DISPLAY = "display"         # resize + chuyển ảnh cho Tk (desktop)
+STAGE_SOUND = "sound"             # xử lý âm thanh cảnh báo
+STAGES = (STAGE_DECODE, STAGE_PREPROCESS, STAGE_INFERENCE, STAGE_TRACKING, STAGE_PROPAGATE,
+          STAGE_TTC, STAGE_OVERLAY, STAGE_ENCODE, STAGE_DISPLAY, STAGE_SOUND)
+
+# Số mẫu gần nhất giữ lại cho mỗi giai đoạn
+WINDOW_SIZE = 300
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class LatencyHistogram:
+    """Cửa sổ trượt các mẫu thời gian (giây) của một giai đoạn."""
+
+    def __init__(self, window=WINDOW_SIZE):
+        self.samples = collections.deque(maxlen=window)
+        self.count = 0      # tổng số mẫu từ khi khởi động
+        self.total = 0.0    # tổng thời gian từ khi khởi động
+
+    def observe(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+
+    def quantiles(self, qs=QUANTILES):
+        if not self.samples:
+            return [float("nan")] * len(qs)
+        return np.quantile(np.fromiter(self.samples, dtype=np.float64), qs).tolist()
+
+
+class StageMetrics:
+    """
+    Thu thập độ trễ của từng giai đoạn xử lý (thread-safe).
+    - observe(stage, seconds) hoặc `with metrics.timer(stage): ...`
+    - summary(): p50/p95/p99 theo cửa sổ trượt
+    - to_prometheus(): định dạng text của Prometheus
+    """
+
+    def __init__(self, window=WINDOW_SIZE):
+        self.window = window
+        self._histograms = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = LatencyHistogram(self.window)
+                self._histograms[stage] = histogram
+            histogram.observe(seconds)
+
+    @contextlib.contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def observe_detection(self, results, total_seconds):
+        """
+        Tách thời gian một lần gọi detect/track thành preprocess / inference / tracking
+        dựa trên results[0].speed (ms) của ultralytics.
+        """
+        speed = getattr(results[0], "speed", None) or {}
+        preprocess = (speed.get("preprocess") or 0.0) / 1000.0
+        inference = (speed.get("inference") or 0.0) / 1000.0
+        self.observe(STAGE_PREPROCESS, preprocess)
+        self.observe(STAGE_INFERENCE, inference)
+        self.observe(STAGE_TRACKING, max(total_seconds - preprocess - inference, 0.0))
+
+    def summary(self):
+        """{stage: {"count", "mean", "p50", "p95", "p99"}} theo thứ tự STAGES."""
+        with self._lock:
+            items = [(stage, self._histograms[stage]) for stage in self._ordered_stages()]
+            result = collections.OrderedDict()
+            for stage, histogram in items:
+                p50, p95, p99 = histogram.quantiles()
+                result[stage] = {
+                    "count": histogram.count,
+                    "mean": histogram.total / histogram.count if histogram.count else 0.0,
+                    "p50": p50,
+                    "p95": p95,
+                    "p99": p99,
+                }
+            return result
+
+    def _ordered_stages(self):
+        known = [s for s in STAGES if s in self._histograms]
+        return known + [s for s in self._histograms if s not in STAGES]
+
+    def overlay_lines(self):
+        """Các dòng text ngắn gọn (ms) cho debug overlay."""
+        lines = []
+        for stage, stats in self.summary().items():
+            lines.append(f"{stage:<10} p50 {stats['p50'] * 1000:6.1f}  "
+                         f"p95 {stats['p95'] * 1000:6.1f}  p99 {stats['p99'] * 1000:6.1f} ms")
+        return lines
+
+    def to_prometheus(self, prefix="cws"):
+        """Xuất dạng summary của Prometheus (text exposition format)."""
+        name = f"{prefix}_stage_latency_seconds"
+        lines = [
+            f"# HELP {name} Per-stage processing latency over the last {self.window} frames.",
+            f"# TYPE {name} summary",
+        ]
+        with self._lock:
+            for stage in self._ordered_stages():
+                histogram = self._histograms[stage]
+                for q, value in zip(QUANTILES, histogram.quantiles()):
+                    lines.append(f'{name}{{stage="{stage}",quantile="{q}"}} {value:.6f}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.total:.6f}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
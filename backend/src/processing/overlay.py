@@ -0,0 +1,183 @@
+import collections
+
+import cv2
+import numpy as np
+
+from .analyzer import RISK_CRITICAL, RISK_WARNING
+
+# Tên phương tiện hiển thị trên HUD theo class_id
+VEHICLE_NAMES = {
+    1: "Nguoi di bo",
+    2: "O to",
+    3: "Xe may",
+    5: "Xe buyt",
+    7: "Xe tai"
+}
+
+# Độ trong suốt của nền HUD
+HUD_ALPHA = 0.35
+
+# Kích thước HUD (x0 cách mép phải HUD_OFFSET_X, nền mở rộng quanh điểm neo)
+HUD_OFFSET_X = 320
+HUD_Y = 50
+HUD_WIDTH = 300
+HUD_HEIGHT = 160
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+# Số mặt nạ chữ tối đa giữ trong cache
+TEXT_CACHE_SIZE = 256
+
+# Bảng màu khung theo class_id (BGR, cùng bảng màu với ultralytics)
+BOX_PALETTE = ((56, 56, 255), (151, 157, 255), (31, 112, 255), (29, 178, 255), (49, 210, 207),
+               (10, 249, 72), (23, 204, 146), (134, 219, 61), (52, 147, 26), (187, 212, 0),
+               (168, 153, 44), (255, 194, 0), (147, 69, 52), (255, 115, 100), (236, 24, 0),
+               (255, 56, 132), (133, 0, 82), (255, 56, 203), (200, 149, 255), (199, 55, 255))
+
+
+def get_vehicle_name(class_id):
+    """Trả về tên phương tiện theo class_id."""
+    return VEHICLE_NAMES.get(class_id, "Khong xac dinh")
+
+
+def hud_style(analysis):
+    """(màu nền, tiêu đề) của HUD theo mức rủi ro của frame."""
+    if analysis["risk_level"] == RISK_CRITICAL:
+        return (0, 0, 255), "NGUY HIEM!"
+    if analysis["risk_level"] == RISK_WARNING:
+        return (0, 255, 255), "CANH BAO"
+    if analysis["min_ttc"] == float("inf"):
+        return (80, 80, 80), "NORMAL"
+    return (0, 200, 0), "AN TOAN"
+
+
+class OverlayRenderer:
+    """
+    Vẽ khung, nhãn, khoảng cách/TTC và HUD trực tiếp lên frame BGR trong một lượt.
+    - Chỉ vùng HUD được pha trộn trong suốt (tại chỗ), không sao chép cả frame
+    - Nền HUD và mặt nạ của các chuỗi chữ lặp lại (tiêu đề, tên lớp...) được cache
+    Chi phí tăng theo số đối tượng, không theo kích thước frame.
+    """
+
+    def __init__(self, names=None):
+        self.names = names or {}
+        self._text_masks = collections.OrderedDict()
+        self._backgrounds = {}
+
+    # --- Cache ---
+
+    def _text_mask(self, text, scale, thickness):
+        """Mặt nạ (uint8) của chuỗi chữ và độ cao phía trên baseline."""
+        key = (text, scale, thickness)
+        cached = self._text_masks.get(key)
+        if cached is not None:
+            self._text_masks.move_to_end(key)
+            return cached
+        (w, h), baseline = cv2.getTextSize(text, FONT, scale, thickness)
+        pad = thickness
+        mask = np.zeros((h + baseline + 2 * pad, w + 2 * pad), dtype=np.uint8)
+        cv2.putText(mask, text, (pad, h + pad), FONT, scale, 255, thickness)
+        cached = (mask, h + pad, pad)
+        self._text_masks[key] = cached
+        if len(self._text_masks) > TEXT_CACHE_SIZE:
+            self._text_masks.popitem(last=False)
+        return cached
+
+    def _background(self, color):
+        background = self._backgrounds.get(color)
+        if background is None:
+            background = np.empty((HUD_HEIGHT, HUD_WIDTH, 3), dtype=np.uint8)
+            background[:] = color
+            self._backgrounds[color] = background
+        return background
+
+    def draw_text(self, frame, text, org, scale, color, thickness):
+        """Như cv2.putText nhưng dùng mặt nạ đã cache (cho các chuỗi lặp lại)."""
+        mask, ascent, pad = self._text_mask(text, scale, thickness)
+        x, y = int(org[0]) - pad, int(org[1]) - ascent
+        fh, fw = frame.shape[:2]
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + mask.shape[1], fw), min(y + mask.shape[0], fh)
+        if x0 >= x1 or y0 >= y1:
+            return
+        region = frame[y0:y1, x0:x1]
+        region[mask[y0 - y:y1 - y, x0 - x:x1 - x] > 0] = color
+
+    # --- Các lớp vẽ ---
+
+    def draw_boxes(self, frame, results):
+        """Vẽ khung và nhãn 'id:<track> <lớp> <conf>' của mọi đối tượng (thay cho results[0].plot())."""
+        boxes = results[0].boxes
+        if boxes is None or len(boxes) == 0:
+            return frame
+        data = boxes.data.cpu().numpy()
+        has_id = data.shape[1] == 7
+        names = self.names or results[0].names
+        for row in data:
+            x1, y1, x2, y2 = (int(v) for v in row[:4])
+            conf, class_id = float(row[-2]), int(row[-1])
+            color = BOX_PALETTE[class_id % len(BOX_PALETTE)]
+            cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+
+            name = names.get(class_id, str(class_id))
+            label = f"id:{int(row[4])} {name} {conf:.2f}" if has_id else f"{name} {conf:.2f}"
+            (tw, th), baseline = cv2.getTextSize(label, FONT, 0.5, 1)
+            top = y1 - th - baseline - 2 if y1 - th - baseline - 2 >= 0 else y1
+            cv2.rectangle(frame, (x1, top), (x1 + tw + 2, top + th + baseline + 2), color, -1)
+            cv2.putText(frame, label, (x1 + 1, top + th + 1), FONT, 0.5, (255, 255, 255), 1, cv2.LINE_AA)
+        return frame
+
+    def draw_track_labels(self, frame, analysis):
+        """Vẽ khoảng cách và TTC cạnh từng đối tượng đã được tính TTC."""
+        shown_ttc = float("inf")
+        for box_data, distance, ttc, alert_state in zip(analysis["boxes"], analysis["distances"],
+                                                         analysis["ttcs"], analysis["alerts"]):
+            x1, y1 = int(box_data[0]), int(box_data[1])
+            color = (0, 0, 255) if alert_state else (0, 255, 0)
+            if ttc != float("inf") and ttc < shown_ttc:
+                shown_ttc = ttc
+                cv2.putText(frame, f"TTC: {ttc:.2f}s", (x1, y1 - 10), FONT, 0.6, color, 2)
+            cv2.putText(frame, f"D: {distance:.1f}m", (x1, y1 - 30), FONT, 0.6, color, 2)
+        return frame
+
+    def draw_hud(self, frame, analysis):
+        """HUD đối tượng nguy hiểm nhất (TTC nhỏ nhất) ở góc trên bên phải, vẽ tại chỗ."""
+        min_ttc = analysis["min_ttc"]
+        bg_color, title_text = hud_style(analysis)
+        x0 = frame.shape[1] - HUD_OFFSET_X
+        y0 = HUD_Y
+        left, top = x0 - 10, y0 - 40
+
+        # --- Pha trộn nền chỉ trong vùng HUD ---
+        fh, fw = frame.shape[:2]
+        bx0, by0 = max(left, 0), max(top, 0)
+        bx1, by1 = min(left + HUD_WIDTH, fw), min(top + HUD_HEIGHT, fh)
+        if bx0 < bx1 and by0 < by1:
+            region = frame[by0:by1, bx0:bx1]
+            background = self._background(bg_color)[by0 - top:by1 - top, bx0 - left:bx1 - left]
+            cv2.addWeighted(background, HUD_ALPHA, region, 1 - HUD_ALPHA, 0, dst=region)
+
+        # Viền trắng bên ngoài
+        cv2.rectangle(frame, (left, top), (left + HUD_WIDTH, top + HUD_HEIGHT), (255, 255, 255), 2)
+
+        white = (255, 255, 255)
+        self.draw_text(frame, title_text, (x0, y0), 1.0, white, 3)
+        if min_ttc == float("inf"):
+            self.draw_text(frame, "TTC: --", (x0, y0 + 40), 0.8, white, 2)
+            self.draw_text(frame, "Khoang cach: --", (x0, y0 + 75), 0.8, white, 2)
+            self.draw_text(frame, "Phuong tien: --", (x0, y0 + 110), 0.8, white, 2)
+        else:
+            cv2.putText(frame, f"TTC: {min_ttc:.2f}s", (x0, y0 + 40), FONT, 0.8, white, 2)
+            cv2.putText(frame, f"Khoang cach: {analysis['min_distance']:.1f}m", (x0, y0 + 75),
+                        FONT, 0.8, white, 2)
+            self.draw_text(frame, f"Phuong tien: {get_vehicle_name(analysis['min_class_id'])}",
+                           (x0, y0 + 110), 0.8, white, 2)
+        return frame
+
+    def render(self, frame, results, analysis=None):
+        """Vẽ toàn bộ lớp phủ lên `frame` (BGR, tại chỗ) và trả về chính frame đó."""
+        self.draw_boxes(frame, results)
+        if analysis is not None:
+            self.draw_track_labels(frame, analysis)
+            self.draw_hud(frame, analysis)
+        return frame
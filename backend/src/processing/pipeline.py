@@ -0,0 +1,268 @@
+import collections
+import threading
+import time
+
+import cv2
+
+from .metrics import STAGE_DECODE
+
+# === CHÍNH SÁCH KHI HÀNG ĐỢI ĐẦY ===
+# Bỏ phần tử cũ nhất để nhận phần tử mới (giai đoạn trước không bị chặn)
+DROP_OLDEST = "drop_oldest"
+# Giai đoạn trước phải chờ cho đến khi hàng đợi có chỗ (backpressure)
+BLOCK = "block"
+DROP_POLICIES = (DROP_OLDEST, BLOCK)
+
+
+class FrameQueue:
+    """
+    Hàng đợi có giới hạn nối giữa hai giai đoạn của pipeline.
+    - Thread-safe, một hay nhiều luồng ghi/đọc
+    - Khi đầy: bỏ phần tử cũ nhất (DROP_OLDEST) hoặc chờ (BLOCK)
+    """
+
+    def __init__(self, maxsize=2, policy=DROP_OLDEST):
+        if policy not in DROP_POLICIES:
+            raise ValueError(f"Chính sách hàng đợi không hợp lệ: {policy}")
+        self.maxsize = max(1, int(maxsize))
+        self.policy = policy
+        self.dropped = 0            # số phần tử đã bị bỏ do đầy
+        self._items = collections.deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def __len__(self):
+        with self._cond:
+            return len(self._items)
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def put(self, item, timeout=None):
+        """
+        Đưa phần tử vào hàng đợi.
+        Trả về False nếu hàng đợi đã đóng hoặc hết thời gian chờ (chế độ BLOCK).
+        """
+        with self._cond:
+            if self._closed:
+                return False
+            if len(self._items) >= self.maxsize:
+                if self.policy == DROP_OLDEST:
+                    while len(self._items) >= self.maxsize:
+                        self._items.popleft()
+                        self.dropped += 1
+                else:
+                    ready = self._cond.wait_for(
+                        lambda: self._closed or len(self._items) < self.maxsize, timeout)
+                    if not ready or self._closed:
+                        return False
+            self._items.append(item)
+            self._cond.notify_all()
+            return True
+
+    def get(self, timeout=None):
+        """Lấy phần tử cũ nhất. Trả về None nếu hết thời gian chờ hoặc hàng đợi đã đóng."""
+        with self._cond:
+            ready = self._cond.wait_for(lambda: self._closed or self._items, timeout)
+            if not ready or not self._items:
+                return None
+            item = self._items.popleft()
+            self._cond.notify_all()
+            return item
+
+    def get_nowait(self):
+        return self.get(timeout=0)
+
+    def close(self, discard=True):
+        """
+        Đóng hàng đợi và đánh thức mọi luồng đang chờ.
+        discard=False: giữ các phần tử còn lại để luồng đọc lấy nốt (get() trả về None khi đã hết).
+        """
+        with self._cond:
+            self._closed = True
+            if discard:
+                self._items.clear()
+            self._cond.notify_all()
+
+
+class FramePacket:
+    """Dữ liệu của một frame khi đi qua các giai đoạn của pipeline."""
+
+    def __init__(self, index, frame, timestamp=None):
+        self.index = index
+        self.frame = frame
+        self.timestamp = timestamp  # thời điểm của frame (giây, theo video/camera)
+        self.results = None     # kết quả từ giai đoạn inference
+        self.model_version = 0  # phiên bản mô hình đã xử lý frame (tăng mỗi lần đổi mô hình nóng)
+        self.detector = None    # mô hình đã xử lý frame (bảng lớp của results), cùng model_version
+        self.output = None      # kết quả từ giai đoạn render
+
+
+class VideoSource:
+    """
+    Bọc cv2.VideoCapture cho luồng decode:
+    - Tự quay lại đầu video khi hết (loop)
+    - Giới hạn tốc độ đọc theo FPS gốc (realtime) để video file chạy như camera
+    - timestamp: thời điểm (giây) của frame vừa đọc, lấy từ CAP_PROP_POS_MSEC của bộ giải mã.
+      Khi bộ giải mã không cho timestamp hợp lệ: file video dùng 1/fps mỗi frame, camera
+      dùng đồng hồ hệ thống. Luôn tăng, kể cả khi loop.
+    """
+
+    def __init__(self, cap, loop=True, realtime=True, metrics=None):
+        self.cap = cap
+        self.loop = loop
+        self.realtime = realtime
+        self.metrics = metrics
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        self.fps = fps if fps and fps > 0 else 30.0
+        self.timestamp = None
+        self.error = None           # lỗi giải mã (cùng giao diện với SharedFrameSource)
+        self.decode_time = 0.0      # thời gian giải mã frame vừa đọc (giây, không gồm thời gian chờ realtime)
+        self._next_time = None
+        self._time_offset = 0.0     # cộng dồn thời lượng các vòng loop trước
+        self._last_wall = None
+        # File video có số frame; camera/luồng trực tiếp thì không
+        self._is_file = cap.get(cv2.CAP_PROP_FRAME_COUNT) > 0
+
+    def read(self):
+        """Đọc frame tiếp theo. Trả về (success, frame) giống cv2.VideoCapture.read()."""
+        start = time.perf_counter()
+        success, frame = self.cap.read()
+        if not success and self.loop:
+            # Hết video, quay lại từ đầu
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            if self.timestamp is not None:
+                self._time_offset = self.timestamp + 1.0 / self.fps
+            success, frame = self.cap.read()
+        self.decode_time = time.perf_counter() - start
+        if self.metrics is not None:
+            self.metrics.observe(STAGE_DECODE, self.decode_time)
+        if not success:
+            return False, None
+        self._update_timestamp()
+
+        if self.realtime:
+            now = time.perf_counter()
+            if self._next_time is None or now - self._next_time > 1.0:
+                self._next_time = now
+            delay = self._next_time - now
+            if delay > 0:
+                time.sleep(delay)
+            self._next_time += 1.0 / self.fps
+        return True, frame
+
+    def _update_timestamp(self):
+        now = time.perf_counter()
+        msec = self.cap.get(cv2.CAP_PROP_POS_MSEC)
+        timestamp = msec / 1000.0 + self._time_offset if msec is not None and msec >= 0 else None
+        if timestamp is None or (self.timestamp is not None and timestamp <= self.timestamp):
+            # Không có timestamp hợp lệ: file tiến 1/fps, camera theo thời gian thực đã trôi qua
+            if self.timestamp is None:
+                timestamp = 0.0
+            elif self._is_file:
+                timestamp = self.timestamp + 1.0 / self.fps
+            else:
+                timestamp = self.timestamp + (now - self._last_wall)
+        self.timestamp = timestamp
+        self._last_wall = now
+
+    def reset_clock(self):
+        """Gọi khi tiếp tục phát sau khi tạm dừng để không 'đuổi' các frame đã lỡ."""
+        self._next_time = None
+
+    def release(self):
+        self.cap.release()
+
+
+class VideoPipeline:
+    """
+    Pipeline 3 giai đoạn chạy song song:
+        decode (VideoSource.read) -> inference (infer_fn) -> render (render_fn)
+    Các giai đoạn nối với nhau bằng FrameQueue có giới hạn, vì vậy thông lượng
+    được quyết định bởi giai đoạn chậm nhất thay vì tổng thời gian của cả chuỗi.
+    Giai đoạn hiển thị (Tk) chỉ cần lấy kết quả mới nhất bằng get_output().
+
+    infer_fn(packet) và render_fn(packet) ghi kết quả vào packet.results / packet.output.
+    """
+
+    def __init__(self, source, infer_fn, render_fn, queue_size=2, drop_policy=DROP_OLDEST):
+        self.source = source
+        self.infer_fn = infer_fn
+        self.render_fn = render_fn
+        self.decode_queue = FrameQueue(queue_size, drop_policy)
+        self.infer_queue = FrameQueue(queue_size, drop_policy)
+        # Giao diện chỉ cần frame mới nhất
+        self.output_queue = FrameQueue(1, DROP_OLDEST)
+        self.error = None
+        self._stop_event = threading.Event()
+        self._threads = []
+
+    @property
+    def is_running(self):
+        return any(t.is_alive() for t in self._threads) and not self._stop_event.is_set()
+
+    def start(self):
+        if self._threads:
+            return
+        self._threads = [
+            threading.Thread(target=self._decode_loop, name="decode", daemon=True),
+            threading.Thread(target=self._stage_loop, name="inference", daemon=True,
+                             args=(self.decode_queue, self.infer_fn, self.infer_queue)),
+            threading.Thread(target=self._stage_loop, name="render", daemon=True,
+                             args=(self.infer_queue, self.render_fn, self.output_queue)),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout=1.0):
+        """Dừng mọi giai đoạn. Các luồng đang bận (vd: đang chạy YOLO) sẽ tự thoát sau bước hiện tại."""
+        self._stop_event.set()
+        for q in (self.decode_queue, self.infer_queue, self.output_queue):
+            q.close()
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout)
+
+    def get_output(self):
+        """Lấy packet đã render mới nhất (không chặn). Trả về None nếu chưa có."""
+        return self.output_queue.get_nowait()
+
+    @property
+    def dropped_frames(self):
+        return self.decode_queue.dropped + self.infer_queue.dropped + self.output_queue.dropped
+
+    # --- CÁC VÒNG LẶP CỦA TỪNG GIAI ĐOẠN ---
+    def _decode_loop(self):
+        index = 0
+        try:
+            while not self._stop_event.is_set():
+                success, frame = self.source.read()
+                if not success:
+                    break
+                self._forward(self.decode_queue, FramePacket(index, frame, self.source.timestamp))
+                index += 1
+        except Exception as e:
+            self._fail(e)
+
+    def _stage_loop(self, in_queue, fn, out_queue):
+        try:
+            while not self._stop_event.is_set():
+                packet = in_queue.get(timeout=0.1)
+                if packet is None:
+                    continue
+                fn(packet)
+                self._forward(out_queue, packet)
+        except Exception as e:
+            self._fail(e)
+
+    def _forward(self, queue, packet):
+        # Với chính sách BLOCK, thử lại cho đến khi có chỗ hoặc pipeline dừng
+        while not self._stop_event.is_set():
+            if queue.put(packet, timeout=0.1):
+                return
+
+    def _fail(self, error):
+        print(f"[LỖI] Pipeline dừng ở giai đoạn '{threading.current_thread().name}': {error}")
+        self.error = error
+        self.stop(timeout=0)
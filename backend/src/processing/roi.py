@@ -0,0 +1,102 @@
+import cv2
+import numpy as np
+
+from .analyzer import ROI_WIDTH_RATIO
+
+# Lề mặc định quanh vùng quan tâm (tỉ lệ theo chiều rộng frame), để đối tượng
+# có tâm nằm trong vùng nhưng thân xe tràn ra ngoài vẫn được nhìn thấy trọn vẹn
+DEFAULT_MARGIN = 0.1
+
+# Màu nền dùng để che vùng ngoài đa giác (trùng màu letterbox của ultralytics)
+MASK_FILL = 114
+
+# Khung cách mép vùng cắt ít hơn số pixel này được coi là bị cắt cụt
+EDGE_TOLERANCE = 2
+
+
+class RegionOfInterest:
+    """
+    Vùng quan tâm (ROI) để chỉ suy luận trên phần ảnh cần thiết.
+    - polygon: danh sách đỉnh (x, y) chuẩn hoá theo kích thước frame (0..1)
+    - margin: lề mở rộng quanh đa giác (tỉ lệ theo chiều rộng frame)
+    Ảnh được cắt theo hình chữ nhật bao của đa giác (cộng lề); phần ngoài đa giác
+    (đã giãn theo lề) được tô màu nền nếu đa giác không phải hình chữ nhật.
+    """
+
+    def __init__(self, polygon, margin=DEFAULT_MARGIN):
+        self.polygon = np.asarray(polygon, dtype=np.float32).reshape(-1, 2)
+        if len(self.polygon) < 3:
+            raise ValueError("ROI cần ít nhất 3 đỉnh.")
+        self.margin = margin
+        self._shape = None
+        self._geometry = None
+
+    @classmethod
+    def corridor(cls, width_ratio=ROI_WIDTH_RATIO, top_ratio=0.0, margin=DEFAULT_MARGIN):
+        """Hành lang phía trước: dải giữa rộng width_ratio, từ top_ratio tới đáy frame."""
+        left = 0.5 - width_ratio / 2
+        right = 0.5 + width_ratio / 2
+        return cls([(left, top_ratio), (right, top_ratio), (right, 1.0), (left, 1.0)], margin)
+
+    def _prepare(self, frame_shape):
+        """Tính (và cache theo kích thước frame) vùng cắt, đa giác theo pixel và mặt nạ."""
+        shape = tuple(frame_shape[:2])
+        if shape == self._shape:
+            return self._geometry
+        h, w = shape
+        points = self.polygon * np.array([w, h], dtype=np.float32)
+        pad = self.margin * w
+        x0 = int(max(0, np.floor(points[:, 0].min() - pad)))
+        y0 = int(max(0, np.floor(points[:, 1].min() - pad)))
+        x1 = int(min(w, np.ceil(points[:, 0].max() + pad)))
+        y1 = int(min(h, np.ceil(points[:, 1].max() + pad)))
+
+        # Hình chữ nhật thẳng trục thì không cần mặt nạ
+        local = np.round(points - [x0, y0]).astype(np.int32)
+        is_rect = (len(points) == 4 and len(np.unique(points[:, 0])) == 2
+                   and len(np.unique(points[:, 1])) == 2)
+        mask = None
+        if not is_rect:
+            mask = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+            cv2.fillPoly(mask, [local], 255)
+            if pad >= 1:
+                size = int(2 * pad) | 1
+                mask = cv2.dilate(mask, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (size, size)))
+
+        # Cạnh vùng cắt nằm bên trong frame (đối tượng chạm cạnh này có thể bị cắt cụt)
+        inner_edges = (x0 > 0, y0 > 0, x1 < w, y1 < h)
+        self._shape = shape
+        self._geometry = ((x0, y0, x1, y1), points, mask, inner_edges)
+        return self._geometry
+
+    def crop(self, frame):
+        """Trả về (ảnh đã cắt/che, (x0, y0)) - ảnh là bản sao nếu có che mặt nạ."""
+        (x0, y0, x1, y1), _, mask, _ = self._prepare(frame.shape)
+        cropped = frame[y0:y1, x0:x1]
+        if mask is not None:
+            cropped = cropped.copy()
+            cropped[mask == 0] = MASK_FILL
+        return cropped, (x0, y0)
+
+    def contains(self, points, frame_shape):
+        """Mảng bool: các điểm (N×2, toạ độ frame) có nằm trong đa giác hay không."""
+        _, polygon, _, _ = self._prepare(frame_shape)
+        polygon = polygon.reshape(-1, 1, 2)
+        return np.array([cv2.pointPolygonTest(polygon, (float(x), float(y)), False) >= 0
+                         for x, y in points], dtype=bool)
+
+    def truncated(self, boxes, frame_shape):
+        """
+        Mảng bool: khung (N×4 xyxy, toạ độ frame) có thể đã bị cắt cụt bởi ROI,
+        tức chạm cạnh vùng cắt nằm trong frame hoặc có góc rơi vào vùng bị che.
+        """
+        (x0, y0, x1, y1), _, mask, inner = self._prepare(frame_shape)
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        tol = EDGE_TOLERANCE
+        cut = ((inner[0] & (boxes[:, 0] <= x0 + tol)) | (inner[1] & (boxes[:, 1] <= y0 + tol))
+               | (inner[2] & (boxes[:, 2] >= x1 - tol)) | (inner[3] & (boxes[:, 3] >= y1 - tol)))
+        if mask is not None and len(boxes):
+            cx = np.clip(boxes[:, [0, 2, 2, 0]] - x0, 0, mask.shape[1] - 1).astype(np.int32)
+            cy = np.clip(boxes[:, [1, 1, 3, 3]] - y0, 0, mask.shape[0] - 1).astype(np.int32)
+            cut |= (mask[cy, cx] == 0).any(axis=1)
+        return cut
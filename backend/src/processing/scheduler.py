@@ -0,0 +1,139 @@
+import cv2
+import numpy as np
+
+# Kích thước ảnh xám thu nhỏ dùng để đo chuyển động toàn cảnh
+MOTION_SIZE = (160, 90)
+
+# Lưới điểm lấy mẫu trong mỗi khung để theo dõi bằng optical flow
+FLOW_GRID = 3
+
+LK_PARAMS = dict(winSize=(15, 15), maxLevel=2,
+                 criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
+
+
+def _masked_median(values, valid, default):
+    """Trung vị theo từng hàng chỉ trên các phần tử hợp lệ; hàng không có phần tử hợp lệ trả về default."""
+    values = np.where(valid, values, np.nan)
+    values[~valid.any(axis=1)] = default
+    return np.nanmedian(values, axis=1)
+
+
+class AdaptiveScheduler:
+    """
+    Lập lịch suy luận thích ứng quanh ObjectDetector.detect_and_track():
+    - Keyframe: chạy YOLO + tracker đầy đủ
+    - Frame giữa các keyframe: dịch khung bằng optical flow (Lucas-Kanade) từ frame trước
+    - Khoảng cách giữa các keyframe tăng dần khi cảnh gần như đứng yên (vd: dừng đèn đỏ)
+      và trở về mỗi frame khi có chuyển động hoặc TTC của một đối tượng xuống thấp
+    """
+
+    def __init__(self, detector, min_interval=1, max_interval=5, motion_threshold=4.0, risk_ttc=3.0):
+        self.detector = detector
+        self.min_interval = max(1, int(min_interval))
+        self.max_interval = max(self.min_interval, int(max_interval))
+        self.motion_threshold = motion_threshold    # chênh lệch xám trung bình (0-255)
+        self.risk_ttc = risk_ttc                    # TTC (giây) dưới ngưỡng này luôn chạy đầy đủ
+        self.interval = self.min_interval
+        self.last_was_keyframe = True
+        self.keyframes = 0
+        self.propagated = 0
+        self._min_ttc = float("inf")
+        self._frames_since_key = 0
+        self._prev_small = None
+        self._prev_gray = None
+        self._last_results = None
+        self._last_boxes = None
+
+    def report_ttc(self, min_ttc):
+        """Nhận TTC nhỏ nhất của frame vừa phân tích (gọi từ giai đoạn tính TTC)."""
+        self._min_ttc = min_ttc
+
+    def reset(self):
+        self.interval = self.min_interval
+        self._prev_small = None
+        self._prev_gray = None
+        self._last_results = None
+        self._last_boxes = None
+
+    def _motion_score(self, gray):
+        small = cv2.resize(gray, MOTION_SIZE, interpolation=cv2.INTER_AREA)
+        score = 0.0 if self._prev_small is None else float(cv2.absdiff(small, self._prev_small).mean())
+        self._prev_small = small
+        return score
+
+    def _update_interval(self, motion):
+        if motion >= self.motion_threshold or self._min_ttc <= self.risk_ttc:
+            self.interval = self.min_interval
+        elif self.last_was_keyframe:
+            # Cảnh yên tĩnh: giãn dần khoảng cách keyframe
+            self.interval = min(self.interval + 1, self.max_interval)
+
+    def detect_and_track(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        motion = self._motion_score(gray)
+        self._update_interval(motion)
+
+        self._frames_since_key += 1
+        need_keyframe = (self._last_results is None
+                         or self._frames_since_key >= self.interval
+                         or self.interval <= 1)
+
+        if need_keyframe:
+            results = self.detector.detect_and_track(frame)
+            self._last_results = results
+            self._last_boxes = (results[0].boxes.data.cpu().numpy()
+                                if results[0].boxes is not None and results[0].boxes.id is not None
+                                else np.zeros((0, 7), dtype=np.float32))
+            self._frames_since_key = 0
+            self.keyframes += 1
+        else:
+            self._last_boxes = self._propagate(self._prev_gray, gray, self._last_boxes)
+            results = self.detector.rebuild_results(self._last_results, frame, self._last_boxes)
+            self.propagated += 1
+
+        self.last_was_keyframe = need_keyframe
+        self._prev_gray = gray
+        return results
+
+    def _propagate(self, prev_gray, gray, boxes):
+        """Dịch và co giãn các khung theo optical flow của lưới điểm bên trong mỗi khung."""
+        n = len(boxes)
+        if n == 0:
+            return boxes
+
+        # Lưới FLOW_GRID×FLOW_GRID điểm trong vùng giữa của mỗi khung
+        t = (np.arange(FLOW_GRID) + 1) / (FLOW_GRID + 1)
+        gx, gy = np.meshgrid(t, t)
+        gx, gy = gx.ravel(), gy.ravel()
+        x1, y1, x2, y2 = boxes[:, 0:1], boxes[:, 1:2], boxes[:, 2:3], boxes[:, 3:4]
+        px = x1 + (x2 - x1) * gx
+        py = y1 + (y2 - y1) * gy
+        points = np.stack([px, py], axis=-1).reshape(-1, 1, 2).astype(np.float32)
+
+        new_points, status, _ = cv2.calcOpticalFlowPyrLK(prev_gray, gray, points, None, **LK_PARAMS)
+        k = FLOW_GRID * FLOW_GRID
+        old = points.reshape(n, k, 2)
+        new = new_points.reshape(n, k, 2)
+        valid = status.reshape(n, k).astype(bool)
+
+        # Độ dịch = trung vị dịch chuyển của các điểm hợp lệ
+        dx = _masked_median(new[..., 0] - old[..., 0], valid, 0.0)
+        dy = _masked_median(new[..., 1] - old[..., 1], valid, 0.0)
+
+        # Hệ số co giãn = trung vị tỉ lệ khoảng cách tới tâm (mới / cũ)
+        old_spread = np.linalg.norm(old - old.mean(axis=1, keepdims=True), axis=-1)
+        new_center = old.mean(axis=1) + np.stack([dx, dy], axis=-1)
+        new_spread = np.linalg.norm(new - new_center[:, None, :], axis=-1)
+        ratio = new_spread / np.maximum(old_spread, 1e-6)
+        scale = np.clip(_masked_median(ratio, valid & (old_spread > 1e-6), 1.0), 0.8, 1.25)
+
+        out = boxes.copy()
+        cx = (boxes[:, 0] + boxes[:, 2]) / 2 + dx
+        cy = (boxes[:, 1] + boxes[:, 3]) / 2 + dy
+        half_w = (boxes[:, 2] - boxes[:, 0]) / 2 * scale
+        half_h = (boxes[:, 3] - boxes[:, 1]) / 2 * scale
+        out[:, 0] = cx - half_w
+        out[:, 1] = cy - half_h
+        out[:, 2] = cx + half_w
+        out[:, 3] = cy + half_h
+        return out
@@ -0,0 +1,251 @@
+import os
+import threading
+import time
+from concurrent.futures import CancelledError
+
+import cv2
+
+from .analyzer import FrameAnalyzer, RISK_NONE, RISK_CRITICAL
+from .calculator import DEFAULT_TTC_THRESHOLD, TTC_MODE_DISTANCE
+from .batching import MicroBatcher
+from .metrics import STAGE_TTC
+from .framering import SharedFrameSource
+from .pipeline import VideoSource, FrameQueue, FramePacket, DROP_OLDEST, BLOCK
+
+# Số frame giải mã trước; việc giải mã (kể cả tua lại đầu video khi loop) chạy trên luồng riêng
+# nên không làm khựng luồng suy luận
+DECODE_AHEAD = 2
+
+class CameraStream:
+    """
+    Một nguồn camera/video trong StreamManager:
+    decode (luồng riêng, đọc trước DECODE_AHEAD frame) -> gửi frame vào hàng đợi suy luận chung
+    -> TTC (FrameAnalyzer riêng) -> listener.
+    Tracker (trong detector, theo stream_id) và TTCCalculator là riêng của từng nguồn.
+    Nguồn realtime bỏ frame cũ khi suy luận không theo kịp; nguồn không realtime thì chờ.
+    decode_process=True: giải mã ở tiến trình riêng, frame đi qua bộ nhớ chung (SharedFrameSource).
+    """
+
+    def __init__(self, stream_id, source_path, batcher, loop=True, realtime=True, metrics=None,
+                 ttc_threshold=DEFAULT_TTC_THRESHOLD, ttc_mode=TTC_MODE_DISTANCE, decode_process=False):
+        self.stream_id = stream_id
+        self.decode_process = decode_process
+        self.ttc_threshold = ttc_threshold
+        self.ttc_mode = ttc_mode
+        self.source_path = source_path
+        self.batcher = batcher
+        self.loop = loop
+        self.realtime = realtime
+        self.metrics = metrics
+        self.risk = RISK_NONE
+        self.frames = 0
+        self.timestamp = None       # thời điểm (giây) của frame mới nhất theo bộ giải mã
+        self.error = None
+        self.latest = None          # (frame, results, analysis) mới nhất
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def add_listener(self, callback):
+        """callback(stream, frame, results, analysis) - gọi trên luồng của nguồn sau mỗi frame."""
+        with self._lock:
+            self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        with self._lock:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.is_running:
+            return
+        self._stop_event.clear()
+        self.error = None
+        self._thread = threading.Thread(target=self._run, name=f"stream:{self.stream_id}", daemon=True)
+        self._thread.start()
+
+    def request_stop(self):
+        """Báo luồng dừng mà không chờ (dùng khi dừng nhiều nguồn cùng lúc)."""
+        self._stop_event.set()
+
+    def stop(self, timeout=2.0):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        if not os.path.exists(self.source_path):
+            self.error = f"Không tìm thấy video tại: {self.source_path}"
+            print(f"[LỖI] {self.error}")
+            return
+        try:
+            source = self._open_source()
+        except IOError as e:
+            self.error = str(e)
+            print(f"[LỖI] {self.error}")
+            return
+
+        analyzer = FrameAnalyzer(source.fps, ttc_threshold=self.ttc_threshold, ttc_mode=self.ttc_mode,
+                                 track_grace=self.batcher.detector.track_grace)
+        self.batcher.detector.reset_tracker(self.stream_id)
+        frames = FrameQueue(DECODE_AHEAD, DROP_OLDEST if self.realtime else BLOCK)
+        decoder = threading.Thread(target=self._decode_loop, args=(source, frames),
+                                   name=f"decode:{self.stream_id}", daemon=True)
+        decoder.start()
+        print(f"Bắt đầu nguồn '{self.stream_id}': {self.source_path}")
+        try:
+            while not self._stop_event.is_set():
+                packet = frames.get(timeout=0.1)
+                if packet is None:
+                    if frames.closed and not len(frames):
+                        break
+                    continue
+                frame = packet.frame
+
+                # Nguồn đang có cảnh báo được ưu tiên suy luận trước các nguồn yên tĩnh
+                results = self.batcher.detect_and_track(frame, self.stream_id, priority=self.risk)
+
+                start = time.perf_counter()
+                analysis = analyzer.analyze(self.batcher.detector.filter_results(results),
+                                            frame.shape, packet.timestamp)
+                if self.metrics is not None:
+                    self.metrics.observe(STAGE_TTC, time.perf_counter() - start)
+                # Mức rủi ro của frame là độ ưu tiên suy luận của frame kế tiếp
+                self.risk = analysis["risk_level"]
+                self.frames += 1
+                self.timestamp = packet.timestamp
+                self.latest = (frame, results, analysis)
+
+                with self._lock:
+                    listeners = list(self._listeners)
+                for callback in listeners:
+                    callback(self, frame, results, analysis)
+        except (CancelledError, RuntimeError) as e:
+            # Hàng đợi suy luận bị dừng trong lúc nguồn còn chờ kết quả
+            if not self._stop_event.is_set():
+                # Hàng đợi dừng/lỗi khi nguồn vẫn đang chạy: báo lỗi qua /streams
+                self.error = str(e) or "Hàng đợi suy luận đã dừng."
+                print(f"[LỖI] Nguồn '{self.stream_id}' dừng: {self.error}")
+                raise
+        except Exception as e:
+            self.error = str(e)
+            print(f"[LỖI] Nguồn '{self.stream_id}' dừng: {e}")
+        finally:
+            frames.close()
+            decoder.join(1.0)
+            source.release()
+            print(f"Dừng nguồn '{self.stream_id}'.")
+
+    def _open_source(self):
+        """VideoSource trong tiến trình này, hoặc SharedFrameSource nếu giải mã ở tiến trình riêng."""
+        if self.decode_process:
+            return SharedFrameSource(self.source_path, loop=self.loop, realtime=self.realtime,
+                                     metrics=self.metrics)
+        cap = cv2.VideoCapture(self.source_path)
+        if not cap.isOpened():
+            raise IOError(f"Không thể mở nguồn video: {self.source_path}")
+        return VideoSource(cap, loop=self.loop, realtime=self.realtime, metrics=self.metrics)
+
+    def _decode_loop(self, source, frames):
+        """Luồng giải mã: đọc frame (tự tua lại khi loop) và đưa vào hàng đợi cho luồng suy luận."""
+        index = 0
+        try:
+            while not self._stop_event.is_set() and not frames.closed:
+                success, frame = source.read()
+                if not success:
+                    self.error = source.error
+                    break
+                packet = FramePacket(index, frame, source.timestamp)
+                # BLOCK: thử lại cho đến khi có chỗ hoặc nguồn dừng
+                while not frames.put(packet, timeout=0.1):
+                    if self._stop_event.is_set() or frames.closed:
+                        return
+                index += 1
+        except Exception as e:
+            self.error = str(e)
+            print(f"[LỖI] Giải mã nguồn '{self.stream_id}' thất bại: {e}")
+        # Hết video (không loop) hoặc lỗi: luồng suy luận xử lý nốt các frame đã giải mã rồi kết thúc
+        frames.close(discard=False)
+
+
+class StreamManager:
+    """
+    Chạy đồng thời N nguồn video dùng chung MỘT mô hình qua hàng đợi suy luận (MicroBatcher):
+    - Mỗi nguồn có luồng decode (hoặc tiến trình decode nếu decode_process=True),
+      tracker và TTCCalculator riêng
+    - Khi nhiều nguồn cùng chờ, nguồn có cảnh báo đỏ (rồi cảnh báo) được suy luận trước;
+      frame của nguồn đang cảnh báo đỏ được chạy ngay, không chờ gom đủ lô
+    """
+
+    def __init__(self, detector, max_batch=4, max_delay=0.01, metrics=None,
+                 ttc_threshold=DEFAULT_TTC_THRESHOLD, ttc_mode=TTC_MODE_DISTANCE, decode_process=False):
+        self.detector = detector
+        self.decode_process = decode_process
+        self.ttc_threshold = ttc_threshold
+        self.ttc_mode = ttc_mode
+        self.metrics = metrics
+        self.batcher = MicroBatcher(detector, max_batch=max_batch, max_delay=max_delay,
+                                    flush_priority=RISK_CRITICAL, metrics=metrics)
+        self.streams = {}
+        self._lock = threading.Lock()
+        self._running = False
+
+    def add_stream(self, stream_id, source_path, loop=True, realtime=True):
+        with self._lock:
+            if stream_id in self.streams:
+                raise ValueError(f"Nguồn '{stream_id}' đã tồn tại.")
+            stream = CameraStream(stream_id, source_path, self.batcher, loop=loop, realtime=realtime,
+                                  metrics=self.metrics, ttc_threshold=self.ttc_threshold,
+                                  ttc_mode=self.ttc_mode, decode_process=self.decode_process)
+            self.streams[stream_id] = stream
+            running = self._running
+        if running:
+            stream.start()
+        return stream
+
+    def remove_stream(self, stream_id):
+        with self._lock:
+            stream = self.streams.pop(stream_id, None)
+        if stream is not None:
+            stream.stop()
+            self.detector.reset_tracker(stream_id)
+
+    def get(self, stream_id):
+        return self.streams.get(stream_id)
+
+    def start(self):
+        with self._lock:
+            self._running = True
+            streams = list(self.streams.values())
+        self.batcher.start()
+        for stream in streams:
+            stream.start()
+
+    def stop(self):
+        with self._lock:
+            self._running = False
+            streams = list(self.streams.values())
+        for stream in streams:
+            stream.request_stop()
+        # Dừng batcher trước để huỷ các frame đang chờ, giải phóng luồng của các nguồn
+        self.batcher.stop()
+        for stream in streams:
+            stream.stop()
+
+    def status(self):
+        """{stream_id: {"running", "risk", "frames", "error"}} - trạng thái từng nguồn."""
+        return {
+            stream_id: {
+                "running": stream.is_running,
+                "risk": stream.risk,
+                "frames": stream.frames,
+                "error": stream.error,
+            }
+            for stream_id, stream in list(self.streams.items())
+        }
@@ -0,0 +1,131 @@
+import numpy as np
+
+from .analyzer import ROI_WIDTH_RATIO
+
+# Dải ngang quanh đường chân trời (tỉ lệ theo chiều cao frame), nơi xe/người ở xa xuất hiện
+DEFAULT_BAND = (0.3, 0.65)
+# Số ô chia theo chiều ngang và phần chồng lấn giữa hai ô liền kề (tỉ lệ theo bề rộng ô)
+DEFAULT_TILES = 2
+DEFAULT_OVERLAP = 0.25
+# Độ phân giải hiệu dụng của ô so với lần chạy cả frame
+DEFAULT_TILE_SCALE = 2.0
+# Chạy thêm các ô mỗi K lần suy luận
+DEFAULT_TILE_INTERVAL = 2
+
+# NMS khi ghép khung của các ô với khung của cả frame
+MERGE_IOU = 0.5
+
+# Khung cách mép trong của ô ít hơn số pixel này được coi là bị cắt cụt
+EDGE_TOLERANCE = 2
+
+
+def merge_detections(boxes_data, iou_threshold=MERGE_IOU):
+    """
+    NMS theo từng lớp cho khung N×6 (x1, y1, x2, y2, conf, class_id) đến từ nhiều lần chạy
+    (cả frame + các ô). Trả về các khung được giữ, xếp theo độ tin cậy giảm dần.
+    """
+    boxes_data = np.asarray(boxes_data, dtype=np.float32).reshape(-1, 6)
+    if len(boxes_data) < 2:
+        return boxes_data
+    boxes_data = boxes_data[np.argsort(-boxes_data[:, 4], kind="stable")]
+    # Dời khung theo lớp để khung khác lớp không bao giờ chồng lên nhau
+    xyxy = boxes_data[:, :4] + boxes_data[:, 5:6] * (boxes_data[:, :4].max() + 1)
+    area = (xyxy[:, 2] - xyxy[:, 0]) * (xyxy[:, 3] - xyxy[:, 1])
+    w = np.clip(np.minimum(xyxy[:, None, 2], xyxy[None, :, 2])
+                - np.maximum(xyxy[:, None, 0], xyxy[None, :, 0]), 0, None)
+    h = np.clip(np.minimum(xyxy[:, None, 3], xyxy[None, :, 3])
+                - np.maximum(xyxy[:, None, 1], xyxy[None, :, 1]), 0, None)
+    inter = w * h
+    iou = inter / np.maximum(area[:, None] + area[None, :] - inter, 1e-6)
+
+    keep = np.ones(len(boxes_data), dtype=bool)
+    for i in range(len(boxes_data)):
+        if keep[i]:
+            keep[i + 1:] &= iou[i, i + 1:] <= iou_threshold
+    return boxes_data[keep]
+
+
+class HorizonTiler:
+    """
+    Suy luận thêm trên dải chân trời của hành lang phía trước ở độ phân giải cao hơn,
+    để xe máy / người đi bộ ở xa (chỉ vài pixel khi chạy cả frame) được nhận diện sớm hơn.
+    - band: (trên, dưới) của dải, tỉ lệ theo chiều cao frame
+    - width_ratio: bề rộng hành lang (dải giữa), tỉ lệ theo chiều rộng frame
+    - tiles / overlap: số ô theo chiều ngang và phần chồng lấn giữa các ô
+    - scale: độ phân giải hiệu dụng của ô so với lần chạy cả frame (backend có kích thước động)
+    - interval: chỉ chạy các ô mỗi `interval` frame của cùng một nguồn (chi phí thêm chia đều cho K frame)
+    Khung chạm mép trong của ô bị bỏ (ô bên cạnh hoặc lần chạy cả frame thấy trọn vẹn),
+    phần còn lại được ghép với khung của cả frame bằng NMS.
+    """
+
+    def __init__(self, band=DEFAULT_BAND, width_ratio=ROI_WIDTH_RATIO, tiles=DEFAULT_TILES,
+                 overlap=DEFAULT_OVERLAP, scale=DEFAULT_TILE_SCALE, interval=DEFAULT_TILE_INTERVAL):
+        if not 0.0 <= band[0] < band[1] <= 1.0:
+            raise ValueError(f"Dải chân trời không hợp lệ: {band}")
+        self.band = band
+        self.width_ratio = width_ratio
+        self.tiles = max(1, int(tiles))
+        self.overlap = overlap
+        self.scale = scale
+        self.interval = max(1, int(interval))
+        self.runs = 0            # số frame đã được chạy thêm các ô
+        self._calls = {}         # số frame đã suy luận theo từng nguồn, khoá = stream_id
+        self._shape = None
+        self._rects = None
+
+    @property
+    def track_grace(self):
+        """Số frame liên tiếp một track chỉ thấy được qua các ô có thể vắng mặt."""
+        return self.interval - 1
+
+    def due(self, stream_id=None):
+        """Gọi một lần cho mỗi frame của nguồn `stream_id`; True nếu frame này cần chạy thêm các ô."""
+        calls = self._calls.get(stream_id, 0)
+        due = calls % self.interval == 0
+        self._calls[stream_id] = calls + 1
+        if due:
+            self.runs += 1
+        return due
+
+    def rects(self, frame_shape):
+        """Các ô (x0, y0, x1, y1) theo pixel, cache theo kích thước frame."""
+        shape = tuple(frame_shape[:2])
+        if shape == self._shape:
+            return self._rects
+        h, w = shape
+        y0 = int(np.floor(self.band[0] * h))
+        y1 = int(np.ceil(self.band[1] * h))
+        left = (0.5 - self.width_ratio / 2) * w
+        span = self.width_ratio * w
+        # n ô rộng tile_w, hai ô liền kề chồng lên nhau tile_w * overlap
+        tile_w = span / (self.tiles - (self.tiles - 1) * self.overlap)
+        step = tile_w * (1 - self.overlap)
+        rects = []
+        for i in range(self.tiles):
+            x0 = int(max(0, np.floor(left + i * step)))
+            x1 = int(min(w, np.ceil(left + i * step + tile_w)))
+            rects.append((x0, y0, x1, y1))
+        self._shape = shape
+        self._rects = rects
+        return rects
+
+    def crop(self, frame):
+        """Danh sách ảnh các ô (view, không sao chép)."""
+        return [frame[y0:y1, x0:x1] for x0, y0, x1, y1 in self.rects(frame.shape)]
+
+    def to_frame(self, tile_boxes, frame_shape):
+        """
+        Đưa khung của từng ô (danh sách mảng K×6, toạ độ ô) về toạ độ frame,
+        bỏ khung chạm mép trong của ô. Trả về mảng M×6.
+        """
+        h, w = frame_shape[:2]
+        tol = EDGE_TOLERANCE
+        merged = []
+        for boxes, (x0, y0, x1, y1) in zip(tile_boxes, self.rects(frame_shape)):
+            boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 6).copy()
+            boxes[:, [0, 2]] += x0
+            boxes[:, [1, 3]] += y0
+            cut = (((x0 > 0) & (boxes[:, 0] <= x0 + tol)) | ((y0 > 0) & (boxes[:, 1] <= y0 + tol))
+                   | ((x1 < w) & (boxes[:, 2] >= x1 - tol)) | ((y1 < h) & (boxes[:, 3] >= y1 - tol)))
+            merged.append(boxes[~cut])
+        return np.concatenate(merged) if merged else np.zeros((0, 6), dtype=np.float32)
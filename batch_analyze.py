@@ -0,0 +1,321 @@
+"""
+Phan tich video offline (khong giao dien, khong gioi han toc do realtime).
+
+Vi du:
+    python batch_analyze.py data/videos/*.mp4 --output-dir output --workers 4
+    python batch_analyze.py dashcam.mp4 --chunk-frames 3000 --warmup-frames 60
+    python batch_analyze.py dashcam.mp4 --batch-size 8
+
+Moi video tao ra trong thu muc output:
+    <ten>.frames.jsonl  - ket qua tung frame (doi tuong, khoang cach, TTC, canh bao)
+    <ten>.events.jsonl  - cac su kien bat/tat canh bao
+    <ten>.summary.json  - thong ke tong hop
+<ten> la ten file video (khong phan mo rong); cac video trung ten (vd: a/clip.mp4, b/clip.mp4)
+duoc them so thu tu tren dong lenh: clip-0, clip-1.
+"""
+import argparse
+import collections
+import json
+import math
+import multiprocessing
+import os
+import time
+
+import cv2
+
+from backend.src.processing.analyzer import FrameAnalyzer
+from backend.src.processing.calculator import DEFAULT_TTC_THRESHOLD, TTC_MODES, TTC_MODE_DISTANCE
+from backend.src.processing.detector import ObjectDetector, BACKENDS, BACKEND_TORCH
+from backend.src.processing.pipeline import VideoSource
+from backend.src.processing.roi import RegionOfInterest
+from backend.src.processing.scheduler import AdaptiveScheduler
+from backend.src.processing.tiling import HorizonTiler, DEFAULT_TILE_INTERVAL
+
+# Track ID cua moi doan (chunk) duoc cong them chunk_index * TRACK_ID_STRIDE
+# de khong trung nhau khi ghep ket qua (moi doan co tracker rieng).
+TRACK_ID_STRIDE = 1_000_000
+
+
+def _finite_or_none(value):
+    """JSON khong ho tro Infinity/NaN -> ghi null."""
+    value = float(value)
+    return value if math.isfinite(value) else None
+
+
+def _frame_record(frame_index, timestamp, analysis, id_offset):
+    detections = []
+    for box, distance, velocity, ttc, alert in zip(analysis["boxes"], analysis["distances"],
+                                                    analysis["velocities"], analysis["ttcs"],
+                                                    analysis["alerts"]):
+        x1, y1, x2, y2, track_id, conf, class_id = box.tolist()
+        detections.append({
+            "track_id": int(track_id) + id_offset,
+            "class_id": int(class_id),
+            "confidence": round(conf, 4),
+            "bbox": [round(x1, 1), round(y1, 1), round(x2, 1), round(y2, 1)],
+            "distance": _finite_or_none(distance),
+            "velocity": _finite_or_none(velocity),
+            "ttc": _finite_or_none(ttc),
+            "alert": bool(alert),
+        })
+    return {
+        "frame": frame_index,
+        "time": round(timestamp, 4),
+        "object_count": analysis["object_count"],
+        "min_ttc": _finite_or_none(analysis["min_ttc"]),
+        "risk": analysis["risk_level"],
+        "danger": analysis["overall_danger"],
+        "red_alert": analysis["is_red_alert"],
+        "detections": detections,
+    }
+
+
+# --- TIEN TRINH CON ---
+
+def _init_worker(threads):
+    """Gioi han so luong tinh toan trong moi tien trinh de cac tien trinh khong tranh CPU."""
+    cv2.setNumThreads(1)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+def analyze_segment(task):
+    """
+    Phan tich doan [start, end) cua mot video va ghi ket qua ra task["part_path"].
+    warmup frame truoc start duoc chay qua detector + TTC de tracker va lich su TTC
+    "am may", nhung khong duoc ghi ra file.
+    """
+    roi = RegionOfInterest.corridor(margin=task["roi_margin"]) if task["roi"] else None
+    tiler = HorizonTiler(interval=task["tile_interval"]) if task["tiles"] else None
+    detector = ObjectDetector(task["model"], conf_threshold=task["conf"], backend=task["backend"], roi=roi,
+                              tiler=tiler)
+    cap = cv2.VideoCapture(task["path"])
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    analyzer = FrameAnalyzer(fps, ttc_threshold=task["ttc_threshold"], ttc_mode=task["ttc_mode"],
+                             track_grace=detector.track_grace)
+    tracker = (AdaptiveScheduler(detector, max_interval=task["max_interval"], risk_ttc=task["ttc_threshold"])
+               if task["adaptive"] else detector)
+
+    first = max(0, task["start"] - task["warmup"])
+    if first > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, first)
+    source = VideoSource(cap, loop=False, realtime=False)
+
+    id_offset = task["chunk_index"] * TRACK_ID_STRIDE
+    batch_size = 1 if task["adaptive"] else task["batch_size"]
+    written = 0
+    with open(task["part_path"], "w", encoding="utf-8") as out:
+        frame_index = first
+        while task["end"] is None or frame_index < task["end"]:
+            # Doc mot lo frame (khong vuot qua cuoi doan)
+            limit = batch_size if task["end"] is None else min(batch_size, task["end"] - frame_index)
+            frames = []
+            timestamps = []
+            while len(frames) < limit:
+                success, frame = source.read()
+                if not success:
+                    break
+                frames.append(frame)
+                # Thoi diem cua frame theo bo giai ma (dung cho van toc/TTC)
+                timestamps.append(source.timestamp)
+            if not frames:
+                break
+
+            if batch_size > 1:
+                batch_results = detector.detect_batch(frames)
+            else:
+                batch_results = [tracker.detect_and_track(frames[0])]
+            for frame, timestamp, results in zip(frames, timestamps, batch_results):
+                analysis = analyzer.analyze(detector.filter_results(results), frame.shape, timestamp)
+                if tracker is not detector:
+                    tracker.report_ttc(analysis["min_ttc"])
+                if frame_index >= task["start"]:
+                    record = _frame_record(frame_index, timestamp, analysis, id_offset)
+                    out.write(json.dumps(record) + "\n")
+                    written += 1
+                frame_index += 1
+            if len(frames) < limit:
+                break
+    cap.release()
+    return task["path"], task["chunk_index"], written
+
+
+# --- TIEN TRINH CHINH ---
+
+def output_names(paths):
+    """Ten ket qua cua tung video: ten file, them '-<so thu tu>' neu nhieu video trung ten."""
+    stems = [os.path.splitext(os.path.basename(path))[0] for path in paths]
+    counts = collections.Counter(stems)
+    return [stem if counts[stem] == 1 else f"{stem}-{video_index}"
+            for video_index, stem in enumerate(stems)]
+
+
+def build_tasks(paths, args):
+    """Chia moi video thanh cac doan (1 doan/file neu chunk_frames = 0)."""
+    tasks = []
+    for video_index, (path, name) in enumerate(zip(paths, output_names(paths))):
+        cap = cv2.VideoCapture(path)
+        if not cap.isOpened():
+            print(f"[LOI] Khong the mo file video: {path}")
+            continue
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
+
+        chunk = args.chunk_frames if args.chunk_frames > 0 and total > 0 else None
+        bounds = [(0, None)] if chunk is None else [
+            (start, min(start + chunk, total)) for start in range(0, total, chunk)
+        ]
+        for chunk_index, (start, end) in enumerate(bounds):
+            tasks.append({
+                "path": path,
+                "video_index": video_index,
+                "name": name,
+                "chunk_index": chunk_index,
+                "start": start,
+                "end": end,
+                "warmup": args.warmup_frames if start > 0 else 0,
+                "model": args.model,
+                "backend": args.backend,
+                "conf": args.conf,
+                "ttc_threshold": args.ttc_threshold,
+                "ttc_mode": args.ttc_mode,
+                "adaptive": args.adaptive,
+                "max_interval": args.max_interval,
+                "roi": args.roi,
+                "batch_size": args.batch_size,
+                "roi_margin": args.roi_margin,
+                "tiles": args.tiles,
+                "tile_interval": args.tile_interval,
+                "part_path": os.path.join(args.output_dir, f"{name}.part{chunk_index:04d}.jsonl"),
+            })
+    return tasks
+
+
+def merge_outputs(name, parts, output_dir):
+    """Ghep cac doan theo thu tu, sinh su kien canh bao va thong ke tong hop."""
+    frames_path = os.path.join(output_dir, f"{name}.frames.jsonl")
+    events_path = os.path.join(output_dir, f"{name}.events.jsonl")
+    frame_count = 0
+    alert_frames = 0
+    global_min_ttc = None
+    danger = False
+
+    with open(frames_path, "w", encoding="utf-8") as frames_out, \
+            open(events_path, "w", encoding="utf-8") as events_out:
+        for part in parts:
+            with open(part, encoding="utf-8") as part_in:
+                for line in part_in:
+                    frames_out.write(line)
+                    record = json.loads(line)
+                    frame_count += 1
+                    if record["danger"]:
+                        alert_frames += 1
+                    if record["min_ttc"] is not None and (global_min_ttc is None
+                                                          or record["min_ttc"] < global_min_ttc):
+                        global_min_ttc = record["min_ttc"]
+                    if record["danger"] != danger:
+                        danger = record["danger"]
+                        events_out.write(json.dumps({
+                            "event": "alert_on" if danger else "alert_off",
+                            "frame": record["frame"],
+                            "time": record["time"],
+                            "min_ttc": record["min_ttc"],
+                        }) + "\n")
+            os.remove(part)
+
+    summary = {
+        "frames": frame_count,
+        "alert_frames": alert_frames,
+        "min_ttc": global_min_ttc,
+    }
+    with open(os.path.join(output_dir, f"{name}.summary.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Phan tich video offline: nhan dien + TTC + canh bao.")
+    parser.add_argument("videos", nargs="+", help="Cac file video can phan tich")
+    parser.add_argument("--output-dir", default="output", help="Thu muc ghi ket qua")
+    parser.add_argument("--model", default="yolov8n.pt", help="Mo hinh YOLO")
+    parser.add_argument("--backend", default=BACKEND_TORCH, choices=BACKENDS, help="Backend suy luan")
+    parser.add_argument("--conf", type=float, default=0.5, help="Nguong do tin cay")
+    parser.add_argument("--ttc-threshold", type=float, default=DEFAULT_TTC_THRESHOLD,
+                        help="Nguong TTC canh bao (giay); canh bao bat/tat o 2/3 va 5/6 nguong nay")
+    parser.add_argument("--ttc-mode", default=TTC_MODE_DISTANCE, choices=TTC_MODES,
+                        help="distance: khoang cach/van toc (can hieu chinh camera); "
+                             "scale: toc do phong to khung (khong can hieu chinh)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="So tien trinh xu ly song song")
+    parser.add_argument("--chunk-frames", type=int, default=0,
+                        help="So frame moi doan (0 = moi file 1 tien trinh)")
+    parser.add_argument("--warmup-frames", type=int, default=30,
+                        help="So frame chay truoc moi doan de tracker/TTC on dinh")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="Chi chay YOLO tren keyframe khi canh it chuyen dong (noi suy bang optical flow)")
+    parser.add_argument("--max-interval", type=int, default=5,
+                        help="Khoang cach toi da giua 2 keyframe khi bat --adaptive")
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="So frame moi lan forward cua mo hinh (khong dung cung --adaptive)")
+    parser.add_argument("--roi", action="store_true",
+                        help="Chi suy luan tren hanh lang phia truoc (vung loc TTC) thay vi ca frame")
+    parser.add_argument("--roi-margin", type=float, default=0.1,
+                        help="Le mo rong quanh hanh lang khi bat --roi (ti le chieu rong frame)")
+    parser.add_argument("--tiles", action="store_true",
+                        help="Chay them dai chan troi o do phan giai cao de thay doi tuong o xa")
+    parser.add_argument("--tile-interval", type=int, default=DEFAULT_TILE_INTERVAL,
+                        help="Chay dai chan troi moi K frame khi bat --tiles")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    tasks = build_tasks(args.videos, args)
+    if not tasks:
+        print("Khong co video nao de xu ly.")
+        return 1
+
+    workers = max(1, min(args.workers, len(tasks)))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    print(f"Xu ly {len(tasks)} doan tu {len(args.videos)} video voi {workers} tien trinh...")
+
+    start_time = time.time()
+    if workers == 1:
+        _init_worker(threads)
+        completed = map(analyze_segment, tasks)
+    else:
+        # 'spawn' de moi tien trinh tu tai mo hinh, tranh fork trang thai torch/OpenCV
+        pool = multiprocessing.get_context("spawn").Pool(workers, initializer=_init_worker,
+                                                         initargs=(threads,))
+        completed = pool.imap_unordered(analyze_segment, tasks)
+
+    total_frames = 0
+    for path, chunk_index, written in completed:
+        total_frames += written
+        print(f"  Xong {os.path.basename(path)} [doan {chunk_index}]: {written} frame")
+    if workers > 1:
+        pool.close()
+        pool.join()
+
+    # Ghep ket qua theo tung video (theo thu tu tren dong lenh, khong theo ten file)
+    by_video = {}
+    for task in tasks:
+        by_video.setdefault(task["video_index"], (task["name"], []))[1].append(task["part_path"])
+    for name, parts in by_video.values():
+        summary = merge_outputs(name, parts, args.output_dir)
+        print(f"{name}: {summary['frames']} frame, {summary['alert_frames']} frame canh bao, "
+              f"TTC nho nhat: {summary['min_ttc']}")
+
+    elapsed = time.time() - start_time
+    print(f"Hoan thanh {total_frames} frame trong {elapsed:.1f}s "
+          f"({total_frames / elapsed if elapsed > 0 else 0:.1f} FPS).")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
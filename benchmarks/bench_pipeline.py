@@ -0,0 +1,328 @@
+"""
+Benchmark cho pipeline nhan dien + TTC.
+
+Chay tu thu muc goc cua du an:
+    python -m benchmarks.bench_pipeline
+    python -m benchmarks.bench_pipeline --model yolov8s.pt --backend onnx --imgsz 480 --threads 4
+    python -m benchmarks.bench_pipeline --video data/videos/test_video.mp4 --frames 300
+    python -m benchmarks.bench_pipeline --compare benchmarks/results/baseline.json
+
+Ket qua (throughput, do tre p50/p95/p99, peak RSS) duoc luu ra JSON de so sanh
+giua cac commit va cau hinh (model, do phan giai, backend, so luong).
+Moi benchmark chay trong mot tien trinh rieng, nen peak RSS la cua rieng benchmark do.
+"""
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import cv2
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from backend.src.processing.analyzer import FrameAnalyzer
+from backend.src.processing.calculator import TTCCalculator
+from backend.src.processing.detector import ObjectDetector, BACKENDS, BACKEND_TORCH
+from backend.src.processing.overlay import OverlayRenderer
+
+RESULTS_DIR = os.path.join(ROOT_DIR, "benchmarks", "results")
+BENCHMARKS = ("detect_objects", "detect_and_track", "filter_results",
+              "calculate_ttc", "calculate_ttc_batch", "overlay")
+
+# Lop COCO dung cho doi tuong gia lap (car, motorcycle, bus, truck, person)
+SYNTHETIC_CLASSES = (2, 3, 5, 7, 0)
+
+
+# --- DO BO NHO ---
+
+def peak_rss_mb():
+    """
+    Peak RSS cua tien trinh (MB) tu luc khoi dong, None neu khong do duoc tren he dieu hanh nay.
+    Chi dung de gan cho mot benchmark khi benchmark do chay trong tien trinh rieng (run_isolated).
+    """
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux tra ve KB, macOS tra ve byte
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / (1024 * 1024)
+    except ImportError:
+        return None
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# --- DU LIEU DAU VAO ---
+
+def synthetic_tracks(rng, width, height, num_tracks, num_frames):
+    """
+    Sinh chuoi boxes.data (N×7) co dinh: cac doi tuong tien lai gan (khung to dan).
+    Tra ve list do dai num_frames, moi phan tu la mang num_tracks×7.
+    """
+    cx = rng.uniform(0.2, 0.8, num_tracks) * width
+    cy = rng.uniform(0.45, 0.75, num_tracks) * height
+    size = rng.uniform(20, 80, num_tracks)
+    growth = rng.uniform(0.0, 1.5, num_tracks)
+    aspect = rng.uniform(0.6, 1.4, num_tracks)
+    conf = rng.uniform(0.5, 0.99, num_tracks)
+    classes = rng.choice(SYNTHETIC_CLASSES, num_tracks)
+    track_ids = np.arange(1, num_tracks + 1)
+
+    sequence = []
+    for k in range(num_frames):
+        w = size + growth * k
+        h = w * aspect
+        data = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2,
+                         track_ids, conf, classes], axis=1)
+        data[:, [0, 2]] = data[:, [0, 2]].clip(0, width - 1)
+        data[:, [1, 3]] = data[:, [1, 3]].clip(0, height - 1)
+        sequence.append(data.astype(np.float32))
+    return sequence
+
+
+def synthetic_frames(rng, width, height, num_frames, tracks):
+    """Frame gia lap: nen nhieu co dinh + cac khoi chu nhat theo synthetic_tracks."""
+    background = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+    background = cv2.GaussianBlur(background, (9, 9), 0)
+    frames = []
+    for data in tracks[:num_frames]:
+        frame = background.copy()
+        for x1, y1, x2, y2, *_ in data:
+            cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (40, 40, 160), -1)
+        frames.append(frame)
+    return frames
+
+
+def recorded_frames(path, num_frames, width=None, height=None):
+    """Doc truoc num_frames frame tu video vao bo nho (de khong do thoi gian decode)."""
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise SystemExit(f"[LOI] Khong the mo file video: {path}")
+    frames = []
+    while len(frames) < num_frames:
+        success, frame = cap.read()
+        if not success:
+            break
+        if width and height:
+            frame = cv2.resize(frame, (width, height))
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def make_results(detector, frame, data):
+    """Tao doi tuong Results cua ultralytics tu boxes.data gia lap."""
+    import torch
+    from ultralytics.engine.results import Results
+    return [Results(frame, path="synthetic", names=detector.model.names, boxes=torch.from_numpy(data))]
+
+
+# --- DO DAC ---
+
+def measure(fn, inputs, warmup, items_per_call=1):
+    """Goi fn(x) cho tung x trong inputs, bo qua `warmup` lan dau, tra ve thong ke."""
+    latencies = []
+    for i, x in enumerate(inputs):
+        start = time.perf_counter()
+        fn(x)
+        elapsed = time.perf_counter() - start
+        if i >= warmup:
+            latencies.append(elapsed)
+    if not latencies:
+        return None
+    lat = np.array(latencies)
+    total = lat.sum()
+    return {
+        "calls": len(lat),
+        "throughput": len(lat) * items_per_call / total if total > 0 else None,
+        "throughput_unit": "items/s" if items_per_call != 1 else "calls/s",
+        "latency_ms": {
+            "mean": float(lat.mean() * 1000),
+            "p50": float(np.percentile(lat, 50) * 1000),
+            "p95": float(np.percentile(lat, 95) * 1000),
+            "p99": float(np.percentile(lat, 99) * 1000),
+            "max": float(lat.max() * 1000),
+        },
+    }
+
+
+def run_benchmarks(args):
+    rng = np.random.default_rng(args.seed)
+    width, height = args.width, args.height
+    tracks = synthetic_tracks(rng, width, height, args.tracks, args.frames + args.warmup)
+    if args.video:
+        frames = recorded_frames(args.video, args.frames + args.warmup, args.width, args.height)
+    else:
+        frames = synthetic_frames(rng, width, height, args.frames + args.warmup, tracks)
+
+    selected = args.only or BENCHMARKS
+    results = {}
+
+    # Cac benchmark can mo hinh
+    needs_model = {"detect_objects", "detect_and_track", "filter_results", "overlay"}
+    detector = None
+    if needs_model & set(selected):
+        detector = ObjectDetector(args.model, conf_threshold=args.conf, backend=args.backend,
+                                  imgsz=args.imgsz)
+
+    if "detect_objects" in selected:
+        print("- detect_objects ...")
+        results["detect_objects"] = measure(detector.detect_objects, frames, args.warmup)
+
+    if "detect_and_track" in selected:
+        print("- detect_and_track ...")
+        results["detect_and_track"] = measure(detector.detect_and_track, frames, args.warmup)
+
+    if "filter_results" in selected:
+        print("- filter_results ...")
+        inputs = [make_results(detector, frame, data) for frame, data in zip(frames, tracks)]
+        results["filter_results"] = measure(detector.filter_results, inputs, args.warmup,
+                                            items_per_call=args.tracks)
+
+    if "calculate_ttc" in selected:
+        print("- calculate_ttc (tung doi tuong) ...")
+        calculator = TTCCalculator(30.0)
+
+        def per_box(data):
+            for x1, y1, x2, y2, track_id, conf, class_id in data:
+                calculator.calculate_ttc(int(track_id), (x1, y1, x2, y2), int(class_id))
+        results["calculate_ttc"] = measure(per_box, tracks, args.warmup, items_per_call=args.tracks)
+
+    if "calculate_ttc_batch" in selected:
+        print("- calculate_ttc_batch ...")
+        calculator = TTCCalculator(30.0)
+        results["calculate_ttc_batch"] = measure(calculator.calculate_ttc_batch, tracks, args.warmup,
+                                                 items_per_call=args.tracks)
+
+    if "overlay" in selected:
+        print("- overlay (boxes + nhan TTC + HUD) ...")
+        analyzer = FrameAnalyzer(30.0)
+        inputs = []
+        for frame, data in zip(frames, tracks):
+            frame_results = make_results(detector, frame, data)
+            analysis = analyzer.analyze(detector.filter_results(frame_results), frame.shape)
+            inputs.append((frame, frame_results, analysis))
+
+        renderer = OverlayRenderer()
+
+        def overlay(item):
+            frame, frame_results, analysis = item
+            renderer.render(frame, frame_results, analysis)
+        results["overlay"] = measure(overlay, inputs, args.warmup)
+
+    return results
+
+
+def set_threads(threads):
+    if threads > 0:
+        cv2.setNumThreads(threads)
+        try:
+            import torch
+            torch.set_num_threads(threads)
+        except ImportError:
+            pass
+
+
+def run_isolated(args, name):
+    """Chay mot benchmark (goi trong tien trinh con moi) va gan peak RSS cua tien trinh do."""
+    set_threads(args.threads)
+    stats = run_benchmarks(argparse.Namespace(**{**vars(args), "only": [name]}))[name]
+    stats["peak_rss_mb"] = peak_rss_mb()
+    return stats
+
+
+def print_report(results, baseline=None):
+    print(f"\n{'benchmark':<22}{'throughput':>14}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'RSS MB':>10}")
+    for name, stats in results.items():
+        if stats is None:
+            continue
+        lat = stats["latency_ms"]
+        rss = stats["peak_rss_mb"]
+        line = (f"{name:<22}{stats['throughput']:>14.1f}{lat['p50']:>10.2f}{lat['p95']:>10.2f}"
+                f"{lat['p99']:>10.2f}{rss if rss is None else round(rss, 1):>10}")
+        base = (baseline or {}).get(name)
+        if base and base.get("throughput"):
+            line += f"   x{stats['throughput'] / base['throughput']:.2f} so voi baseline"
+        print(line)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark nhan dien + TTC + overlay.")
+    parser.add_argument("--model", default="yolov8n.pt")
+    parser.add_argument("--backend", default=BACKEND_TORCH, choices=BACKENDS)
+    parser.add_argument("--imgsz", type=int, default=640, help="Kich thuoc dau vao mo hinh")
+    parser.add_argument("--conf", type=float, default=0.5)
+    parser.add_argument("--threads", type=int, default=0, help="So luong torch/OpenCV (0 = mac dinh)")
+    parser.add_argument("--width", type=int, default=1280, help="Do rong frame")
+    parser.add_argument("--height", type=int, default=720, help="Do cao frame")
+    parser.add_argument("--frames", type=int, default=100, help="So lan do moi benchmark")
+    parser.add_argument("--warmup", type=int, default=10, help="So lan chay bo qua truoc khi do")
+    parser.add_argument("--tracks", type=int, default=20, help="So doi tuong gia lap moi frame")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--video", help="Dung frame tu video thay vi frame gia lap")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, help="Chi chay cac benchmark nay")
+    parser.add_argument("--output", help="File JSON ket qua (mac dinh: benchmarks/results/<thoi gian>.json)")
+    parser.add_argument("--compare", help="File JSON cua lan chay truoc de so sanh throughput")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    # ru_maxrss la dinh cua ca tien trinh: moi benchmark chay trong mot tien trinh moi
+    # ('spawn', maxtasksperchild=1) de peak RSS khong bi benchmark truoc do chi phoi
+    results = {}
+    with multiprocessing.get_context("spawn").Pool(1, maxtasksperchild=1) as pool:
+        for name in [name for name in BENCHMARKS if name in (args.only or BENCHMARKS)]:
+            results[name] = pool.apply(run_isolated, (args, name))
+    report = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "platform": {
+            "python": platform.python_version(),
+            "system": platform.platform(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+            "opencv": cv2.__version__,
+        },
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "results": results,
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+    print_report(results, baseline)
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, datetime.datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nDa luu ket qua: {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
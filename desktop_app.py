@@ -2,24 +2,44 @@ import tkinter as tk
 from tkinter import filedialog
 import cv2
 import os
-from PIL import Image, ImageTk
-import pygame
 import time
 import math
+import threading
+from concurrent.futures import Future
 
 # --- IMPORT CAC MODULE CUA CHUNG TA ---
 from backend.src.processing.detector import ObjectDetector
-from backend.src.processing.calculator import TTCCalculator
+from backend.src.processing.roi import RegionOfInterest
+from backend.src.processing.analyzer import FrameAnalyzer
+from backend.src.processing.pipeline import VideoPipeline, VideoSource, DROP_OLDEST
+from backend.src.processing.framering import SharedFrameSource
+from backend.src.processing.overlay import OverlayRenderer
+from backend.src.processing.scheduler import AdaptiveScheduler
+from backend.src.processing.tiling import HorizonTiler, DEFAULT_TILE_INTERVAL
+from backend.src.processing.metrics import (StageMetrics, STAGE_TTC, STAGE_OVERLAY, STAGE_DISPLAY,
+                                            STAGE_SOUND, STAGE_PROPAGATE)
 # Import ca 2 giao dien:
 from ui.main_window_ui import MainWindowUI
 from ui.settings_window_ui import SettingsWindowUI
 from ui.about_window_ui import AboutWindowUI
+from ui.video_display import VideoDisplay
 
 # --- 1. CAU HINH CAC DUONG DAN ---
 ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
 DEFAULT_VIDEO_PATH = os.path.join(ROOT_DIR, "data", "videos", "test_video.mp4")
 SOUND_PATH = os.path.join(ROOT_DIR, "assets", "sounds", "alert.mp3")
 
+# pygame chi duoc import khi bat am thanh (giam thoi gian khoi dong)
+pygame = None
+
+
+def _import_pygame():
+    global pygame
+    if pygame is None:
+        import pygame as module
+        pygame = module
+    return pygame
+
 # --- 2. LOP UNG DUNG (BO DIEU KHIEN) ---
 
 class CollisionApp:
@@ -32,8 +52,26 @@ class CollisionApp:
         # --- B. Khoi tao Cau hinh (Config) ---
         self.config = {
             "ttc_threshold": 3.0,
+            # Cach tinh TTC: "distance" (khoang cach/van toc, can hieu chinh) | "scale" (toc do phong to khung)
+            "ttc_mode": "distance",
             "ai_model": "yolov8n.pt",
-            "sound_enabled": True
+            "backend": "torch",  # torch | onnx | openvino
+            "sound_enabled": True,
+            # Pipeline decode -> inference -> render
+            "queue_size": 2,
+            "drop_policy": DROP_OLDEST,
+            # Giai ma o tien trinh rieng, frame qua bo nho chung (khong tranh GIL voi YOLO)
+            "decode_process": False,
+            # Chay YOLO day du chi tren keyframe khi canh it chuyen dong va TTC con xa
+            "adaptive_rate": False,
+            # Chi suy luan tren vung phia truoc (hanh lang giua, hoac da giac chuan hoa 0..1)
+            "roi_inference": False,
+            "roi_polygon": None,  # vd: [(0.3, 0.4), (0.7, 0.4), (1.0, 1.0), (0.0, 1.0)]
+            # Chay them dai chan troi o do phan giai cao moi K frame (xe/nguoi o xa)
+            "tiled_inference": False,
+            "tile_interval": DEFAULT_TILE_INTERVAL,
+            # Hien thi do tre tung giai doan (bat/tat bang phim F3)
+            "debug_overlay": False
         }
 
         # --- C. Tao Giao dien tu file UI ---
@@ -41,7 +79,13 @@ class CollisionApp:
 
         # --- D. Khoi tao cac bien logic ---
         self.cap = None
-        self.calculator = None
+        self.source = None
+        self.pipeline = None
+        self.analyzer = None
+        self.scheduler = None
+        self.video_display = VideoDisplay(self.ui.video_label)
+        self.overlay = OverlayRenderer()
+        self.metrics = StageMetrics()
         self.video_path = DEFAULT_VIDEO_PATH
         self.is_running = False
         self.alert_triggered = False
@@ -49,19 +93,28 @@ class CollisionApp:
         self.about_window = None
 
         # --- E. Khoi tao cac he thong phu ---
-        self.detector = self._init_detector()
-        self.sound_enabled = self._init_sound()
-
-        if self.detector is None:
-            self.ui.status_bar_label.config(text="LOI: Khong the tai mo hinh AI.")
-            return
+        # Cua so hien ngay; mo hinh duoc tai + warmup tren luong nen, am thanh tai khi Tk ranh
+        self.detector = None
+        self._detector_future = None
+        # Doi mo hinh nong: luong inference nhan mo hinh moi o ranh gioi giua hai frame
+        self._pending_detector = None
+        self._detector_lock = threading.Lock()   # bao ve _pending_detector (luong Tk <-> inference)
+        self._model_version = 0      # tang moi lan doi mo hinh
+        self._analyzer_version = 0   # phien ban mo hinh ma analyzer dang theo (luong render)
+        self._play_requested = False
+        self.sound_enabled = False
+        self._load_detector_async()
+        self.window.after_idle(self._load_sound)
 
         # --- F. Ket noi Logic voi Giao dien ---
         self.ui.start_button.config(command=self.play_resume_video)
         self.ui.stop_button.config(command=self.pause_video)
         self.ui.settings_button.config(command=self.open_settings_window)
         self.ui.about_button.config(command=self.open_about_window)
-        self.ui.exit_button.config(command=self.window.quit)
+        self.ui.exit_button.config(command=self.exit_app)
+        self.window.protocol("WM_DELETE_WINDOW", self.exit_app)
+        self.ui.video_label.bind("<Configure>", self._on_video_label_resize)
+        self.window.bind("<F3>", self.toggle_debug_overlay)
 
         # An hop canh bao luc ban dau
         self.ui.warning_frame.pack_forget()
@@ -77,21 +130,96 @@ class CollisionApp:
     # --- CAC HAM KHOI TAO ---
 
     def _init_detector(self):
-        """Tai mo hinh AI dua tren config."""
+        """Tai mo hinh AI dua tren config va warmup (chay tren luong nen)."""
         try:
-            print(f"Dang tai mo hinh AI: {self.config['ai_model']}...")
-            detector = ObjectDetector(self.config['ai_model'])
-            print("Tai mo hinh thanh cong.")
+            print(f"Dang tai mo hinh AI: {self.config['ai_model']} ({self.config['backend']})...")
+            start = time.perf_counter()
+            detector = ObjectDetector(self.config['ai_model'], backend=self.config['backend'],
+                                      roi=self._init_roi(), tiler=self._init_tiler())
+            detector.warmup()
+            print(f"Tai mo hinh thanh cong ({time.perf_counter() - start:.1f}s).")
             return detector
         except Exception as e:
             print(f"[LOI] Khong the tai mo hinh YOLO. Loi: {e}")
             return None
 
+    def _load_detector_async(self):
+        """Tai mo hinh tren luong nen; _poll_detector() nhan ket qua tren luong Tk."""
+        future = Future()
+        self._detector_future = future
+        threading.Thread(target=lambda: future.set_result(self._init_detector()),
+                         name="model-loader", daemon=True).start()
+        self.ui.status_bar_label.config(
+            text=f"Dang tai mo hinh AI: {self.config['ai_model']} ({self.config['backend']})...")
+        self.window.after(100, self._poll_detector, future)
+
+    def _poll_detector(self, future):
+        if future is not self._detector_future:
+            # Da co yeu cau tai mo hinh khac (vd: doi model trong Cai dat)
+            return
+        if not future.done():
+            self.window.after(100, self._poll_detector, future)
+            return
+        self._detector_future = None
+        detector = future.result()
+        if detector is None:
+            self._play_requested = False
+            if self.detector is not None:
+                # Tai loi: mo hinh cu tiep tuc chay
+                self.ui.status_bar_label.config(text="LOI: Khong the tai mo hinh moi, giu mo hinh cu.")
+            else:
+                self.ui.status_bar_label.config(text="LOI: Khong the tai mo hinh AI.")
+            return
+        if self.pipeline is not None:
+            # Video dang phat: luong inference doi mo hinh truoc frame ke tiep
+            with self._detector_lock:
+                self._pending_detector = detector
+        else:
+            self._swap_detector(detector)
+        self.ui.status_bar_label.config(
+            text=f"Mo hinh san sang: {self.config['ai_model']} ({self.config['backend']})")
+        if self._play_requested:
+            self._play_requested = False
+            self.play_resume_video()
+
+    def _init_roi(self):
+        """Tao vung quan tam cho detector neu duoc bat trong config."""
+        if not self.config["roi_inference"]:
+            return None
+        if self.config["roi_polygon"]:
+            return RegionOfInterest(self.config["roi_polygon"])
+        return RegionOfInterest.corridor()
+
+    def _init_tiler(self):
+        """Tao bo chia o dai chan troi neu duoc bat trong config."""
+        if not self.config["tiled_inference"]:
+            return None
+        return HorizonTiler(interval=self.config["tile_interval"])
+
+    def _init_scheduler(self):
+        """Tao bo lap lich suy luan thich ung neu duoc bat trong config."""
+        if not self.config["adaptive_rate"] or self.detector is None:
+            return None
+        return AdaptiveScheduler(self.detector, risk_ttc=self.config["ttc_threshold"])
+
+    def _swap_detector(self, detector):
+        """
+        Thay mo hinh dang dung (luong inference khi video dang phat, luong Tk khi khong).
+        Tracker moi danh track_id lai tu dau nen trang thai TTC cua cac track cu
+        duoc xoa o frame dau tien cua mo hinh moi (xem _render_stage).
+        """
+        self.detector = detector
+        self.scheduler = self._init_scheduler()
+        self._model_version += 1
+
+    def _load_sound(self):
+        self.sound_enabled = self._init_sound()
+
     def _init_sound(self):
         """Khoi tao hoac tat am thanh dua tren config."""
         if not self.config["sound_enabled"]:
             print("Am thanh da bi tat trong cai dat.")
-            if pygame.mixer.get_init():
+            if pygame is not None and pygame.mixer.get_init():
                 pygame.mixer.quit()
             return False
 
@@ -100,6 +228,7 @@ class CollisionApp:
             return False
 
         try:
+            _import_pygame()
             if not pygame.mixer.get_init():
                 pygame.mixer.init()
             pygame.mixer.music.load(SOUND_PATH)
@@ -109,12 +238,27 @@ class CollisionApp:
             print(f"[CANH BAO] Khong tai duoc file am thanh (pygame): {e}")
             return False
 
+    def _on_video_label_resize(self, event):
+        # Luong render khong duoc goi winfo_*, nen luu lai kich thuoc tai day
+        self.video_display.set_target_size(event.width, event.height)
+
+    def toggle_debug_overlay(self, event=None):
+        self.config["debug_overlay"] = not self.config["debug_overlay"]
+
+    def exit_app(self):
+        self.pause_video()
+        if self.source is not None:
+            # Dung tien trinh giai ma (neu co)
+            self.source.release()
+        self.window.quit()
+
     def open_video_file(self):
         """Ham nay duoc goi boi cua so Cai dat."""
         self.pause_video()
-        if self.cap:
-            self.cap.release()
+        if self.source is not None:
+            self.source.release()
             self.cap = None
+            self.source = None
             print("Da giai phong video cu.")
 
         path = filedialog.askopenfilename(
@@ -137,17 +281,25 @@ class CollisionApp:
     def save_settings(self, new_config):
         """Luu cau hinh moi."""
         print("Luu cai dat moi:", new_config)
-        model_changed = self.config["ai_model"] != new_config["ai_model"]
+        model_changed = (self.config["ai_model"] != new_config["ai_model"]
+                         or self.config["backend"] != new_config.get("backend", self.config["backend"]))
         sound_changed = self.config["sound_enabled"] != new_config.get("sound_enabled", True)
         self.config.update(new_config)
 
         if model_changed:
-            self.detector = self._init_detector()
-            self.ui.status_bar_label.config(text=f"Da doi model thanh: {self.config['ai_model']}")
+            # Mo hinh cu van chay cho den khi mo hinh moi tai xong
+            self._load_detector_async()
 
         if sound_changed:
             self.sound_enabled = self._init_sound()
 
+        # Nguong canh bao moi ap dung ngay cho video dang phat
+        if self.analyzer is not None:
+            self.analyzer.set_ttc_threshold(self.config["ttc_threshold"])
+            self.analyzer.set_ttc_mode(self.config["ttc_mode"])
+        if self.scheduler is not None:
+            self.scheduler.risk_ttc = self.config["ttc_threshold"]
+
         print("Da cap nhat cai dat.")
 
     def open_about_window(self):
@@ -159,155 +311,158 @@ class CollisionApp:
 
     def play_resume_video(self):
         """Bat dau hoac tiep tuc phat video."""
-        if self.cap is None:
+        if self.detector is None:
+            if self._detector_future is not None:
+                # Video se tu phat khi mo hinh tai xong
+                self._play_requested = True
+                self.ui.status_bar_label.config(text="Dang tai mo hinh AI, video se phat khi san sang...")
+            else:
+                self.ui.status_bar_label.config(text="LOI: Khong the tai mo hinh AI.")
+            return
+        if self.source is None:
             if not self.video_path or not os.path.exists(self.video_path):
                 print(f"Loi: Khong tim thay file video {self.video_path}")
                 return
 
-            self.cap = cv2.VideoCapture(self.video_path)
-            if not self.cap.isOpened():
-                print("Loi: Khong the mo file video.")
-                self.cap = None
-                return
-
-            fps = self.cap.get(cv2.CAP_PROP_FPS)
-            self.calculator = TTCCalculator(fps)
+            if self.config["decode_process"]:
+                try:
+                    # Du slot cho moi frame con song: 2 hang doi, 3 giai doan, frame dang hien thi, ket qua giu lai
+                    self.source = SharedFrameSource(self.video_path, metrics=self.metrics,
+                                                    slots=2 * self.config["queue_size"] + 6)
+                except IOError as e:
+                    print(f"Loi: Khong the mo file video. {e}")
+                    return
+            else:
+                self.cap = cv2.VideoCapture(self.video_path)
+                if not self.cap.isOpened():
+                    print("Loi: Khong the mo file video.")
+                    self.cap = None
+                    return
+                self.source = VideoSource(self.cap, metrics=self.metrics)
+            self.analyzer = FrameAnalyzer(self.source.fps, ttc_threshold=self.config["ttc_threshold"],
+                                          ttc_mode=self.config["ttc_mode"],
+                                          track_grace=self.detector.track_grace)
+            self._analyzer_version = self._model_version
+            self.scheduler = self._init_scheduler()
             print(f"Da tai video: {self.video_path}")
 
         if not self.is_running:
             self.is_running = True
+            self.source.reset_clock()
+            self.pipeline = VideoPipeline(
+                self.source, self._infer_stage, self._render_stage,
+                queue_size=self.config["queue_size"],
+                drop_policy=self.config["drop_policy"]
+            )
+            self.pipeline.start()
             print("Video dang phat...")
             self.update_frame()
 
     def pause_video(self):
         """Tam dung video."""
         self.is_running = False
+        if self.pipeline is not None:
+            self.pipeline.stop()
+            self.pipeline = None
         print("Video da tam dung.")
 
     def play_alert_sound(self):
-        if self.sound_enabled:
+        if self.sound_enabled and pygame is not None:
             pygame.mixer.music.play()
 
-    def get_vehicle_name(self, class_id):
-        """Tra ve ten phuong tien theo class_id."""
-        mapping = {
-            1: "Nguoi di bo",
-            2: "O to",
-            3: "Xe may",
-            5: "Xe buyt",
-            7: "Xe tai"
-        }
-        return mapping.get(class_id, "Khong xac dinh")
-
-    def update_frame(self):
-        if not self.is_running or not self.cap:
+    # --- CAC GIAI DOAN CUA PIPELINE ---
+
+    def _infer_stage(self, packet):
+        """Giai doan inference (luong rieng): YOLO nhan dien + theo doi."""
+        start = time.perf_counter()
+        # Lay va xoa trong cung mot lan giu khoa: mo hinh tai xong giua hai buoc khong bi mat
+        with self._detector_lock:
+            detector, self._pending_detector = self._pending_detector, None
+        if detector is not None:
+            self._swap_detector(detector)
+        packet.model_version = self._model_version
+        packet.detector = self.detector
+        scheduler = self.scheduler
+        if scheduler is None:
+            packet.results = self.detector.detect_and_track(packet.frame)
+            self.metrics.observe_detection(packet.results, time.perf_counter() - start)
             return
 
-        success, frame = self.cap.read()
-        if not success:
-            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-            self.window.after(10, self.update_frame)
-            return
+        packet.results = scheduler.detect_and_track(packet.frame)
+        if scheduler.last_was_keyframe:
+            self.metrics.observe_detection(packet.results, time.perf_counter() - start)
+        else:
+            self.metrics.observe(STAGE_PROPAGATE, time.perf_counter() - start)
+
+    def _render_stage(self, packet):
+        """Giai doan render (luong rieng): tinh TTC, ve HUD, chuyen anh cho Tk."""
+        frame = packet.frame
+        results = packet.results
+        if packet.model_version != self._analyzer_version:
+            # Frame dau tien cua mo hinh moi: track_id cu khong con y nghia
+            self._analyzer_version = packet.model_version
+            self.analyzer.reset()
+            self.analyzer.set_track_grace(packet.detector.track_grace)
+        with self.metrics.timer(STAGE_TTC):
+            # Loc bang mo hinh da tao ra results: self.detector co the da la mo hinh moi
+            analysis = self.analyzer.analyze(packet.detector.filter_results(results), frame.shape,
+                                             packet.timestamp)
+        if self.scheduler is not None:
+            self.scheduler.report_ttc(analysis["min_ttc"])
+
+        overlay_start = time.perf_counter()
+        # Ve truc tiep len frame BGR (frame khong con duoc dung sau giai doan nay)
+        annotated_frame = self.overlay.render(frame, results, analysis)
+
+        if self.config["debug_overlay"]:
+            self.draw_debug_overlay(annotated_frame)
+        self.metrics.observe(STAGE_OVERLAY, time.perf_counter() - overlay_start)
+
+        # --- Resize vao bo dem hien thi (PhotoImage chi duoc cap nhat tren luong Tk) ---
+        display_start = time.perf_counter()
+        self.video_display.render(annotated_frame)
+        packet.output = {
+            "overall_danger": analysis["overall_danger"],
+            # Kiem tra xem co canh bao do hay khong (min_ttc <= 2.0)
+            "is_red_alert": analysis["is_red_alert"],
+            "object_count": analysis["object_count"],
+            "display_time": time.perf_counter() - display_start
+        }
 
-        results = self.detector.detect_and_track(frame)
-        annotated_frame = self.detector.draw_results(frame, results)
-
-        current_track_ids = []
-        overall_danger = False
-        min_ttc = float("inf")
-        min_distance = float("inf")
-        min_class_id = None
-        object_count = 0
-
-        if results[0].boxes is not None and results[0].boxes.id is not None:
-            boxes_data = results[0].boxes.data.cpu().numpy()
-            current_track_ids = results[0].boxes.id.int().cpu().tolist()
-            object_count = len(current_track_ids)
-
-            frame_h, frame_w = frame.shape[:2]
-            center_x = frame_w / 2
-
-            for box_data in boxes_data:
-                x1, y1, x2, y2, track_id, conf, class_id = box_data
-                box = [x1, y1, x2, y2]
-                track_id = int(track_id)
-                class_id = int(class_id)
-
-                cx = (x1 + x2) / 2
-                roi_width = frame_w * 0.6
-                if abs(cx - center_x) > roi_width / 2:
-                    continue
-
-                if class_id in [2, 3, 5, 7]:
-                    distance, velocity, ttc, immediate_alert = self.calculator.calculate_ttc(track_id, box, class_id)
-                    hysteresis_alert = self.calculator.check_collision_warning(ttc)
-                    alert_state = hysteresis_alert or immediate_alert
-                    if alert_state:
-                        overall_danger = True
-
-                    color = (0, 0, 255) if alert_state else (0, 255, 0)
-                    info_text = f"D: {distance:.1f}m"
-
-                    if ttc != float("inf") and ttc < min_ttc:
-                        min_ttc = ttc
-                        min_distance = distance
-                        min_class_id = class_id
-
-                        ttc_text = f"TTC: {ttc:.2f}s"
-                        cv2.putText(annotated_frame, ttc_text, (int(x1), int(y1) - 10),
-                                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
-                    cv2.putText(annotated_frame, info_text, (int(x1), int(y1) - 30),
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
-
-        # --- HIEN THI HUD TTC NGUY HIEM NHAT ---
-        x0 = frame.shape[1] - 320
-        y0 = 50
-        bg_color = (80, 80, 80)
-        icon = ""
-        title_text = "NORMAL"
-        ttc_text = "TTC: --"
-        dist_text = "Khoang cach: --"
-        vehicle_text = "Phuong tien: --"
-
-        if min_ttc != float("inf"):
-            if min_ttc > 3.0:
-                bg_color = (0, 200, 0)
-                icon = ""
-                title_text = "AN TOAN"
-            elif 2.0 < min_ttc <= 3.0:
-                bg_color = (0, 255, 255)
-                icon = "⚠"
-                title_text = "CANH BAO"
-            else:
-                bg_color = (0, 0, 255)
-                icon = ""
-                title_text = "NGUY HIEM!"
-            ttc_text = f"TTC: {min_ttc:.2f}s"
-            dist_text = f"Khoang cach: {min_distance:.1f}m"
-            vehicle_text = f"Phuong tien: {self.get_vehicle_name(min_class_id)}"
+    def draw_debug_overlay(self, frame):
+        """Ve bang do tre p50/p95/p99 cua tung giai doan o goc tren ben trai."""
+        lines = self.metrics.overlay_lines()
+        if not lines:
+            return
+        x0, y0, line_h = 10, 10, 18
+        h = line_h * len(lines) + 10
+        roi = frame[y0:y0 + h, x0:x0 + 430]
+        roi[:] = roi // 3
+        for i, line in enumerate(lines):
+            cv2.putText(frame, line, (x0 + 6, y0 + 18 + i * line_h),
+                        cv2.FONT_HERSHEY_PLAIN, 1.0, (255, 255, 255), 1)
 
-        # --- 3. Ve khung nen trong suot hon ---
-        overlay = annotated_frame.copy()
-        cv2.rectangle(overlay, (x0 - 10, y0 - 40), (x0 + 290, y0 + 120), bg_color, -1)
+    # --- GIAI DOAN HIEN THI (LUONG TK) ---
 
-        # alpha = 0.35 de tao do trong suot (co the tang/giam)
-        alpha = 0.35
-        annotated_frame = cv2.addWeighted(overlay, alpha, annotated_frame, 1 - alpha, 0)
+    def update_frame(self):
+        if not self.is_running or self.pipeline is None:
+            return
 
-        # Ve vien trang ben ngoai
-        cv2.rectangle(annotated_frame, (x0 - 10, y0 - 40), (x0 + 290, y0 + 120), (255, 255, 255), 2)
+        if self.pipeline.error is not None:
+            self.ui.status_bar_label.config(text=f"LOI pipeline: {self.pipeline.error}")
+            self.pause_video()
+            return
 
-        font = cv2.FONT_HERSHEY_SIMPLEX
-        cv2.putText(annotated_frame, f"{icon}  {title_text}", (x0, y0), font, 1.0, (255, 255, 255), 3)
-        cv2.putText(annotated_frame, ttc_text, (x0, y0 + 40), font, 0.8, (255, 255, 255), 2)
-        cv2.putText(annotated_frame, dist_text, (x0, y0 + 75), font, 0.8, (255, 255, 255), 2)
-        cv2.putText(annotated_frame, vehicle_text, (x0, y0 + 110), font, 0.8, (255, 255, 255), 2)
+        packet = self.pipeline.get_output()
+        if packet is not None:
+            self.show_frame(packet.output)
 
-        # --- 3. Xu ly canh bao hinh anh & am thanh ---
-        self.calculator.cleanup_history(current_track_ids)
+        self.window.after(5, self.update_frame)
 
-        # Kiem tra xem co canh bao do hay khong (min_ttc <= 2.0)
-        is_red_alert = (min_ttc != float("inf") and min_ttc <= 2.0)
+    def show_frame(self, output):
+        """Hien thi frame da render va xu ly canh bao hinh anh & am thanh."""
+        overall_danger = output["overall_danger"]
+        sound_start = time.perf_counter()
 
         # Hien/An khung canh bao UI (giu nhu cu)
         if overall_danger and not self.alert_triggered:
@@ -320,44 +475,33 @@ class CollisionApp:
 
 
         # --- CHI PHAT AM THANH KHI CANH BAO DO ---
-        if is_red_alert:
+        if output["is_red_alert"]:
             # Neu am thanh bat va chua phat thi phat
             if self.sound_enabled and not pygame.mixer.music.get_busy():
                 pygame.mixer.music.play()
-        else:
+        elif self.sound_enabled and pygame.mixer.music.get_busy():
             # Neu khong con canh bao do thi dung am thanh
-            if pygame.mixer.music.get_busy():
-                pygame.mixer.music.stop()
+            pygame.mixer.music.stop()
+        self.metrics.observe(STAGE_SOUND, time.perf_counter() - sound_start)
 
 
         self.frame_count += 1
         elapsed_time = time.time() - self.start_time
         if elapsed_time >= 1.0:
             fps = self.frame_count / elapsed_time
-            status_text = (f"FPS: {fps:.1f} | Objects: {object_count} | "
-                           f"Model: {self.config['ai_model']} | "
+            status_text = (f"FPS: {fps:.1f} | Objects: {output['object_count']} | "
+                           f"Dropped: {self.pipeline.dropped_frames} | "
+                           f"Model: {self.config['ai_model']} ({self.config['backend']}) | "
                            f"Sound: {'ON' if self.sound_enabled else 'OFF'}")
             self.ui.status_bar_label.config(text=status_text)
             self.frame_count = 0
             self.start_time = time.time()
 
-        label_w = self.ui.video_label.winfo_width()
-        label_h = self.ui.video_label.winfo_height()
-        if label_w > 1 and label_h > 1:
-            frame_resized = cv2.resize(annotated_frame, (label_w, label_h))
-        else:
-            frame_resized = annotated_frame
-
-        frame_rgb = cv2.cvtColor(frame_resized, cv2.COLOR_BGR2RGB)
-        pil_img = Image.fromarray(frame_rgb)
-        img_tk = ImageTk.PhotoImage(image=pil_img)
-        self.ui.video_label.configure(image=img_tk)
-        self.ui.video_label.image = img_tk
+        display_start = time.perf_counter()
+        self.video_display.present()
+        self.metrics.observe(STAGE_DISPLAY, output["display_time"] + time.perf_counter() - display_start)
         self.ui.status_bar_label.lift()
 
 
-        self.window.after(1, self.update_frame)
-
-
 if __name__ == "__main__":
     app = CollisionApp()
@@ -1,11 +1,16 @@
 import tkinter as tk
 from tkinter import ttk
 
+# Các backend suy luận mà ObjectDetector hỗ trợ
+BACKEND_OPTIONS = ("torch", "onnx", "openvino")
+# Cách tính TTC của TTCCalculator: khoảng cách/vận tốc hoặc tốc độ phóng to khung (tau)
+TTC_MODE_OPTIONS = ("distance", "scale")
+
 class SettingsWindowUI:
     def __init__(self, parent, app, config):
         self.window = tk.Toplevel(parent)
         self.window.title("⚙ Cài đặt hệ thống")
-        self.window.geometry("430x370")
+        self.window.geometry("430x470")
         self.window.configure(bg="#2b2b2b")  # xám dịu hơn
         self.app = app
         self.config = config
@@ -33,6 +38,16 @@ class SettingsWindowUI:
         self.model_entry.insert(0, config["ai_model"])
         self.model_entry.grid(row=0, column=1, sticky="e")
 
+        # --- Backend suy luận ---
+        tk.Label(frame, text="Backend:", **label_style).grid(
+            row=1, column=0, sticky="w", pady=10
+        )
+        self.backend_combo = ttk.Combobox(
+            frame, values=BACKEND_OPTIONS, state="readonly", width=26
+        )
+        self.backend_combo.set(config.get("backend", BACKEND_OPTIONS[0]))
+        self.backend_combo.grid(row=1, column=1, sticky="e")
+
         # --- Âm thanh ---
         self.sound_var = tk.BooleanVar(value=config["sound_enabled"])
         tk.Checkbutton(
@@ -44,18 +59,28 @@ class SettingsWindowUI:
             selectcolor="#4dd0e1",
             activebackground="#2b2b2b",
             font=("Helvetica", 12)
-        ).grid(row=1, column=0, columnspan=2, pady=10, sticky="w")
+        ).grid(row=2, column=0, columnspan=2, pady=10, sticky="w")
 
         # --- Ngưỡng TTC ---
         tk.Label(
             frame, text="Ngưỡng TTC cảnh báo (giây):", **label_style
-        ).grid(row=2, column=0, sticky="w", pady=10)
+        ).grid(row=3, column=0, sticky="w", pady=10)
 
         self.ttc_scale = ttk.Scale(
             frame, from_=1.0, to=5.0, orient="horizontal", length=220
         )
         self.ttc_scale.set(config["ttc_threshold"])
-        self.ttc_scale.grid(row=2, column=1, sticky="e")
+        self.ttc_scale.grid(row=3, column=1, sticky="e")
+
+        # --- Cách tính TTC ---
+        tk.Label(frame, text="Cách tính TTC:", **label_style).grid(
+            row=4, column=0, sticky="w", pady=10
+        )
+        self.ttc_mode_combo = ttk.Combobox(
+            frame, values=TTC_MODE_OPTIONS, state="readonly", width=26
+        )
+        self.ttc_mode_combo.set(config.get("ttc_mode", TTC_MODE_OPTIONS[0]))
+        self.ttc_mode_combo.grid(row=4, column=1, sticky="e")
 
         # --- Chọn video ---
         style = ttk.Style()
@@ -74,7 +99,7 @@ class SettingsWindowUI:
             text="🎞  Chọn file video",
             style="Modern.TButton",
             command=app.open_video_file
-        ).grid(row=3, column=0, columnspan=2, pady=18)
+        ).grid(row=5, column=0, columnspan=2, pady=18)
 
         # --- Khung nút hành động ---
         button_frame = tk.Frame(self.window, bg="#2b2b2b")
@@ -108,8 +133,10 @@ class SettingsWindowUI:
     def save_settings(self):
         new_config = {
             "ai_model": self.model_entry.get(),
+            "backend": self.backend_combo.get(),
             "sound_enabled": self.sound_var.get(),
             "ttc_threshold": float(self.ttc_scale.get()),
+            "ttc_mode": self.ttc_mode_combo.get(),
         }
         self.app.save_settings(new_config)
         self.window.destroy()
@@ -0,0 +1,74 @@
+import threading
+
+import cv2
+import numpy as np
+from PIL import Image, ImageTk
+
+# Số bộ đệm xoay vòng: 1 đang hiển thị, 1 chờ hiển thị, 1 đang được ghi
+BUFFER_COUNT = 3
+
+
+class VideoDisplay:
+    """
+    Hiển thị frame BGR lên một tk.Label mà không cấp phát lại mỗi frame.
+    - render(frame) (luồng render): resize thẳng vào bộ đệm BGR cấp phát sẵn
+    - present() (luồng Tk): giải nén BGR -> RGB vào một PIL Image cố định
+      (chuyển màu gộp vào bước giải nén của PIL) rồi paste vào PhotoImage cố định
+    Bộ đệm, PIL Image và PhotoImage chỉ được tạo lại khi kích thước vùng hiển thị đổi.
+    """
+
+    def __init__(self, label):
+        self.label = label
+        self._lock = threading.Lock()
+        self._target_size = None     # (w, h) của label, cập nhật từ luồng Tk
+        self._buffers = [None] * BUFFER_COUNT
+        self._pending = None         # chỉ số bộ đệm mới nhất chờ hiển thị
+        self._displaying = None      # chỉ số bộ đệm đang được luồng Tk đọc
+        self._image = None
+        self._photo = None
+
+    def set_target_size(self, width, height):
+        """Gọi từ sự kiện <Configure> của label (luồng render không được gọi winfo_*)."""
+        self._target_size = (width, height) if width > 1 and height > 1 else None
+
+    def render(self, frame):
+        """Resize frame vào bộ đệm rảnh và đánh dấu là frame mới nhất cần hiển thị."""
+        h, w = frame.shape[:2]
+        size = self._target_size or (w, h)
+        with self._lock:
+            index = next(i for i in range(BUFFER_COUNT) if i not in (self._pending, self._displaying))
+        buffer = self._buffers[index]
+        if buffer is None or buffer.shape[1::-1] != size:
+            buffer = np.empty((size[1], size[0], 3), dtype=np.uint8)
+            self._buffers[index] = buffer
+
+        if size == (w, h):
+            np.copyto(buffer, frame)
+        else:
+            interpolation = cv2.INTER_AREA if size[0] < w else cv2.INTER_LINEAR
+            cv2.resize(frame, size, dst=buffer, interpolation=interpolation)
+        with self._lock:
+            self._pending = index
+
+    def present(self):
+        """Đưa frame mới nhất lên label (chỉ gọi từ luồng Tk). Trả về False nếu chưa có frame mới."""
+        with self._lock:
+            index = self._pending
+            if index is None:
+                return False
+            self._pending = None
+            self._displaying = index
+        buffer = self._buffers[index]
+        size = (buffer.shape[1], buffer.shape[0])
+
+        if self._photo is None or self._image.size != size:
+            self._image = Image.new("RGB", size)
+            self._photo = ImageTk.PhotoImage(self._image)
+            self.label.configure(image=self._photo)
+            self.label.image = self._photo
+
+        self._image.frombytes(buffer.data, "raw", "BGR")
+        self._photo.paste(self._image)
+        with self._lock:
+            self._displaying = None
+        return True